@@ -21,13 +21,15 @@ import sys
 import os
 import json
 import argparse
+import getpass
 import urllib.request
 from PyQt5.QtWidgets import QApplication
 
 from . import transphire_utils as tu
+from . import transphire_daemon as td
 
 
-def main(font, root_directory, settings_directory, mount_directory, adjust_width, adjust_height, edit_settings, n_feedbacks, version, kill):
+def main(font, root_directory, settings_directory, mount_directory, adjust_width, adjust_height, edit_settings, n_feedbacks, version, kill, headless=None, continue_run=False, restart=None, status_socket=None, send=None, ask_password=False, quiet=False):
     """
     Run the GUI.
 
@@ -36,6 +38,13 @@ def main(font, root_directory, settings_directory, mount_directory, adjust_width
     adjust_width - Value to adjust the width of buttons
     adjust_height - Value to adjust the height of buttons
     edit_settings - If True, open the default settings dialog
+    headless - Settings of a previous run to start without GUI (default None)
+    continue_run - Continue the headless run, if the project already exists (default False)
+    restart - Comma separated list of processes to restart in headless continue mode (default None)
+    status_socket - Status socket of the headless run (default None)
+    send - Command to send to a running headless run (default None)
+    ask_password - Ask for the sudo password in headless mode (default False)
+    quiet - Do not print the status changes in headless mode (default False)
 
     Return:
     None
@@ -50,9 +59,42 @@ def main(font, root_directory, settings_directory, mount_directory, adjust_width
             )
         return
 
+    if send is not None:
+        if status_socket is None:
+            print('--send needs the --status_socket of the headless run!')
+            sys.exit(1)
+        try:
+            answer = td.send_command(status_socket, send)
+        except (OSError, ValueError) as err:
+            # OSError includes socket.timeout and a missing or stale socket
+            print('Cannot send {0} to {1}: {2}'.format(send, status_socket, err))
+            sys.exit(1)
+        print(json.dumps(answer, indent=1))
+        return
+
     # Start the GUI from the users home directory.
     os.chdir(root_directory)
 
+    if headless is not None:
+        tu.mkdir_p(mount_directory)
+        password = ''
+        if ask_password:
+            password = getpass.getpass('Sudo password: ')
+        try:
+            td.run_headless(
+                settings_path=headless,
+                mount_directory=mount_directory,
+                continue_run=continue_run,
+                restart_names=[entry for entry in restart.split(',') if entry] if restart else [],
+                password=password,
+                socket_file=status_socket,
+                quiet=quiet,
+                )
+        except (IOError, ValueError) as err:
+            print(err)
+            sys.exit(1)
+        return
+
     QApplication.setStyle('fusion')
     app = QApplication([])
 
@@ -220,6 +262,48 @@ def parse_args():
         action='store_true',
         help='Kill all running from the current user TranSPHIRE instances.'
         )
+    parser.add_argument(
+        '--headless',
+        default=None,
+        type=str,
+        help='Start the processing without GUI with the settings of a previous run: used_settings.json file, settings set folder or project folder.'
+        )
+    parser.add_argument(
+        '--continue_run',
+        default=False,
+        action='store_true',
+        help='Continue the headless run, if the project folder already exists.'
+        )
+    parser.add_argument(
+        '--restart',
+        default=None,
+        type=str,
+        help='Comma separated list of processes to restart in headless continue mode, e.g. feedback,CTF. Restarts subsequent processes.'
+        )
+    parser.add_argument(
+        '--status_socket',
+        default=os.environ.get('TRANSPHIRE_STATUS_SOCKET', None),
+        type=str,
+        help='Unix socket for the status of the headless run (default transphire.sock in the log folder)'
+        )
+    parser.add_argument(
+        '--send',
+        default=None,
+        choices=td.COMMANDS,
+        help='Send a command to the --status_socket of a running headless run and print the answer.'
+        )
+    parser.add_argument(
+        '--ask_password',
+        default=False,
+        action='store_true',
+        help='Ask for the sudo password in headless mode.'
+        )
+    parser.add_argument(
+        '--quiet',
+        default=False,
+        action='store_true',
+        help='Do not print the status changes in headless mode.'
+        )
 
     return vars(parser.parse_args())
 
@@ -229,9 +313,14 @@ def run_package():
     Entry point for the transphire package
     """
     args = parse_args()
-    if not args['version'] and not args['kill']:
+    if args['version'] or args['kill'] or args['send'] is not None:
+        pass
+    elif args['headless'] is None:
         check_running()
         check_update()
+    elif sys.stdin.isatty():
+        # Headless runs might not have a terminal to answer
+        check_running()
     main(**args)
 
 
@@ -17,12 +17,10 @@
 """
 import numpy as np
 import json
-import datetime
 import sys
 import os
 import re
 import copy
-import shutil
 import pexpect as pe
 from PyQt5.QtWidgets import (
     QMainWindow,
@@ -210,6 +208,11 @@ class MainWindow(QMainWindow):
                 self.threads[entry].wait()
                 self.threads[entry].setParent(None)
 
+            try:
+                self.workers[entry].close_pool()
+            except AttributeError:
+                pass
+
             if self.timers[entry] is not None:
                 self.timers[entry].setParent(None)
 
@@ -1134,123 +1137,7 @@ class MainWindow(QMainWindow):
             tu.message('Project needs to exists in order to start Monitor mode')
             return None, None, None
 
-        settings['project_folder'] = os.path.join(
-            settings['project_base'],
-            'TranSPHIRE_results'
-            )
-
-        settings['scratch_folder'] = os.path.join(
-            settings['Output']['Scratch directory'],
-            settings['Output']['Project name'],
-            'TranSPHIRE_results'
-            )
-        folder_dict = {
-            'log_folder': 'XXX_Log_files',
-            'queue_folder': 'XXX_Queue_files',
-            'error_folder': 'XXX_Error_files',
-            'tar_folder': 'XXX_Tar_file_folder',
-            'stack_folder': '000_Import',
-            'meta_folder': '000_Import_meta',
-            'set_folder_raw': 'XXX_Settings',
-            'restart_backup_folder': 'XXX_Restart_Backup',
-            'software_meta_folder': '000_Session_meta',
-            }
-        for key, value in folder_dict.items():
-            settings[key] = os.path.join(
-                settings['project_folder'],
-                value
-                )
-
-        continue_mode = os.path.exists(settings['restart_backup_folder'])
-
-        settings['do_feedback_loop'] = int(settings['Output']['Number of feedbacks'])
-        settings['feedback_file'] = os.path.join(settings['log_folder'], 'feedback_log')
-        settings['spot_file'] = os.path.join(settings['log_folder'], 'spot_dict.txt')
-        settings['data_frame'] = os.path.join(settings['project_folder'], 'data_frame.csv')
-        settings['external_log'] = os.path.join(settings['set_folder_raw'], 'external_files.json')
-        settings['translation_file'] = os.path.join(settings['project_folder'], 'Valid_micrographs_info.txt')
-        settings['translation_file_bad'] = os.path.join(settings['project_folder'], 'Discarded_micrographs_info.txt')
-
-        settings['current_set'] = datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
-
-        settings['restart_backup_folder'] = os.path.join(settings['restart_backup_folder'], settings['current_set'])
-        settings['set_folder'] = os.path.join(settings['set_folder_raw'], settings['current_set'])
-        folder_dict['set_folder'] = settings['set_folder']
-        folder_dict['restart_backup_folder'] = settings['restart_backup_folder']
-
-        # Move Error files from previous run
-        if continue_mode:
-            tu.mkdir_p(settings['restart_backup_folder'])
-            try:
-                tu.copy(
-                    settings['error_folder'],
-                    settings['restart_backup_folder'],
-                    )
-                shutil.rmtree(settings['error_folder'])
-            except FileNotFoundError:
-                pass
-            # Copy Queue files from previous run
-            try:
-                tu.copy(
-                    settings['queue_folder'],
-                    settings['restart_backup_folder'],
-                    )
-            except FileNotFoundError:
-                pass
-
-        names = [
-            entry.replace('_entries', '')
-            for entry in settings['Copy']
-            if entry.endswith('_entries') and
-            entry.replace('_entries', '').replace('_', ' ') in settings['Copy']
-            ]
-        idx = 0
-        settings['plot_emit'] = []
-        for entry in names:
-            base_dir2 = None
-            no_feedback = False
-            if 'copy_to_' in entry.lower():
-                base_dir = self.mount_directory
-                no_feedback = True
-            else:
-                idx += 1
-                base_dir = settings['project_folder']
-                base_dir2 = settings['scratch_folder']
-
-            entry_name = '{}_entries'.format(entry)
-            prog_name_entries = settings['Copy'][entry_name] if entry_name in settings['Copy'] else [entry]
-            for prog_name in prog_name_entries:
-                if 'copy_to_' in entry.lower():
-                    folder_name = prog_name.replace(' ', '_').replace('>=', '')
-                else:
-                    folder_name = '{0:03d}_{1}'.format(idx, prog_name.replace(' ', '_').replace('>=', ''))
-
-                for index in range(int(settings['Output']['Number of feedbacks']) + 1):
-                    if index == 0:
-                        folder_name_tmp = folder_name
-                    elif no_feedback:
-                        continue
-                    else:
-                        folder_name_tmp = os.path.join(
-                            '000_Feedback_results',
-                            '{0}_feedback_{1}'.format(
-                                folder_name,
-                                int(settings['Output']['Number of feedbacks']) - index + 1
-                                )
-                            )
-
-                    folder_setting_name = '{0}_folder_feedback_{1}'.format(entry.lower(), index)
-                    folder_setting = os.path.join(base_dir, folder_name_tmp)
-                    prog_name_feedback = '{} feedback {}'.format(prog_name, int(settings['Output']['Number of feedbacks']) - index + 1) if index != 0 else prog_name
-                    settings['plot_emit'].append([prog_name, prog_name_feedback, entry, folder_setting])
-
-                    if prog_name == settings['Copy'][entry.replace('_', ' ')]:
-                        settings[folder_setting_name] = folder_setting
-                        if base_dir2 is not None:
-                            settings['scratch_{0}_folder_feedback_{1}'.format(entry.lower(), index)] = os.path.join(
-                                base_dir2,
-                                folder_name_tmp
-                                )
+        folder_dict = tu.set_project_folders(settings, self.mount_directory)
 
         return settings, folder_dict, external_files
 
@@ -1511,6 +1398,8 @@ class MainWindow(QMainWindow):
                 thread_instance.quit()
                 thread_instance.wait()
 
+        self.workers['plotting'].close_pool()
+
         print('Wait for thread mount')
         for key in self.content['Mount'].content:
             thread = self.mount_thread_list[key]['thread']
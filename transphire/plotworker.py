@@ -16,17 +16,41 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import traceback as tb
+import hashlib
 import os
+import pickle
+import time
 import multiprocessing as mp
+import numpy as np
 from PyQt5.QtCore import pyqtSignal, QObject, pyqtSlot
 
 from . import transphire_utils as tu
 
 
+def get_digest(data):
+    """
+    Digest of the content of a data array.
+
+    Arguments:
+    data - Numpy array
+
+    Return:
+    Digest string
+    """
+    return hashlib.blake2b(
+        pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),
+        digest_size=16
+        ).hexdigest()
+
+
 class PlotWorker(QObject):
     """
     Plot different information about motion correction and ctf estimation.
 
+    The data is imported by a pool of worker processes that lives as long as the PlotWorker.
+    Every round the workers only send back the rows that are new since the last round,
+    and unchanged programs are not emitted again.
+
     Inherits:
     QObject
 
@@ -54,6 +78,11 @@ class PlotWorker(QObject):
         """
         super(PlotWorker, self).__init__(parent)
         self.settings = []
+        self.pool = None
+        self.pool_size = 0
+        self.plot_data = {}
+        self.log_folder = None
+        self.round_cost = {}
         self.sig_calculate.connect(self.calculate_array)
         self.sig_reset_list.connect(self.reset_list)
 
@@ -61,6 +90,7 @@ class PlotWorker(QObject):
     def reset_list(self):
         self.sig_reset.emit()
         self.settings = []
+        self.plot_data = {}
 
     @pyqtSlot(object)
     def set_settings(self, settings):
@@ -84,14 +114,110 @@ class PlotWorker(QObject):
                 small_settings['Output']['Rename suffix'] = settings['Output']['Rename suffix']
                 small_settings['Output']['Rename micrographs'] = settings['Output']['Rename micrographs']
                 self.settings.append([name, name_no_feedback, directory_name, small_settings, current_name])
+            try:
+                self.log_folder = settings['log_folder']
+            except KeyError:
+                pass
 
         self.calculate_array()
         self.sig_set_visual.emit()
 
-    def send_data(self, data):
-        for entry in data:
-            if entry is not None:
-                self.sig_data.emit(*entry)
+    def get_pool(self, nr_entries):
+        """
+        Return the worker pool and start it, if it is not running or too small.
+
+        Arguments:
+        nr_entries - Number of programs to import
+
+        Returns:
+        Pool, True if the pool has been started
+        """
+        pool_size = max(1, min(nr_entries, mp.cpu_count()))
+        if self.pool is not None and self.pool_size >= pool_size:
+            return self.pool, False
+        self.close_pool()
+        self.pool = mp.Pool(pool_size)
+        self.pool_size = pool_size
+        return self.pool, True
+
+    @pyqtSlot()
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+        self.pool = None
+        self.pool_size = 0
+
+    def send_data(self, valid_entries, data):
+        """
+        Merge the delta updates of the workers and emit the changed data.
+
+        Arguments:
+        valid_entries - Entries that have been calculated
+        data - Worker results in the same order
+
+        Returns:
+        Number of emitted programs
+        """
+        nr_emit = 0
+        for (name, name_no_feedback, directory_name, settings, _), entry in zip(valid_entries, data):
+            mode, rows, digest, _, _ = entry
+            if mode == 'unchanged':
+                continue
+            elif mode == 'empty':
+                self.plot_data.pop(name, None)
+                continue
+            elif mode == 'append':
+                rows = np.concatenate([self.plot_data[name][0], rows])
+            else:
+                pass
+            self.plot_data[name] = [rows, digest]
+            self.sig_data.emit(name, name_no_feedback, rows, directory_name, settings)
+            nr_emit += 1
+        return nr_emit
+
+    def write_round_cost(self, valid_entries, data, pool_time, nr_emit, round_time):
+        """
+        Keep the cost of the last round and append it to the plot statistics file.
+
+        Arguments:
+        valid_entries - Entries that have been calculated
+        data - Worker results in the same order
+        pool_time - Time to start the pool in seconds
+        nr_emit - Number of emitted programs
+        round_time - Time of the whole round in seconds
+
+        Returns:
+        None
+        """
+        self.round_cost = {
+            'time': time.time(),
+            'round_time': round_time,
+            'pool_time': pool_time,
+            'nr_emit': nr_emit,
+            'programs': [
+                [entry[0], result[0], result[3], result[4], len(result[1]) if result[1] is not None else 0]
+                for entry, result in zip(valid_entries, data)
+                ],
+            }
+        if self.log_folder is None or not os.path.isdir(self.log_folder):
+            return
+
+        programs = ';'.join([
+            '{0}:{1}:{2:.3f}s:{3}/{4}'.format(name, mode, import_time, nr_sent, nr_rows)
+            for name, mode, import_time, nr_rows, nr_sent in self.round_cost['programs']
+            ])
+        try:
+            with open(os.path.join(self.log_folder, 'plot_statistics.txt'), 'a') as write:
+                write.write('{0}\t{1:.3f}\t{2:.3f}\t{3}\t{4}\n'.format(
+                    time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.round_cost['time'])),
+                    round_time,
+                    pool_time,
+                    nr_emit,
+                    programs,
+                    ))
+        except OSError:
+            pass
 
     @pyqtSlot()
     def calculate_array(self):
@@ -101,11 +227,18 @@ class PlotWorker(QObject):
         Returns:
         None
         """
+        start_round = time.time()
         valid_entries = []
         for entry in self.settings[:]:
             name, name_no_feedback, directory_name, settings, current_name = entry
             if os.path.isdir(directory_name):
-                valid_entries.append([name, name_no_feedback, directory_name, settings])
+                try:
+                    data, digest = self.plot_data[name]
+                except KeyError:
+                    previous = None
+                else:
+                    previous = [len(data), digest]
+                valid_entries.append([name, name_no_feedback, directory_name, settings, previous])
                 self.sig_visible.emit(True, name)
             else:
                 self.sig_visible.emit(False, name)
@@ -114,17 +247,35 @@ class PlotWorker(QObject):
 
         if valid_entries:
             try:
-                with mp.Pool(min(len(valid_entries), len(valid_entries))) as p:
-                    data = p.starmap(self.calculate_array_now, valid_entries)
+                start_pool = time.time()
+                pool, is_new = self.get_pool(len(valid_entries))
+                pool_time = time.time() - start_pool if is_new else 0
+                data = pool.starmap(self.calculate_array_now, valid_entries)
             except Exception as e:
                 print(e)
                 print(tb.format_exc())
+                self.close_pool()
             else:
-                self.send_data(data)
+                nr_emit = self.send_data(valid_entries, data)
+                self.write_round_cost(valid_entries, data, pool_time, nr_emit, time.time() - start_round)
         self.sig_new_round.emit()
 
     @staticmethod
-    def calculate_array_now(name, name_no_feedback, directory_name, settings):
+    def calculate_array_now(name, name_no_feedback, directory_name, settings, previous):
+        """
+        Import the data of a program and compare it with the previous round.
+
+        Arguments:
+        name - Name of the program
+        name_no_feedback - Name of the program without feedback suffix
+        directory_name - Directory to import
+        settings - TranSPHIRE settings
+        previous - [number of rows, digest] of the last emitted data or None
+
+        Returns:
+        mode (unchanged, empty, append, full), rows, digest, import time, number of rows
+        """
+        start = time.time()
         try:
             data, _ = tu.get_function_dict()[name_no_feedback]['plot_data'](
                 name=name,
@@ -133,9 +284,20 @@ class PlotWorker(QObject):
                 directory_name=directory_name
                 )
         except KeyError:
-            pass
+            return ['empty', None, None, time.time() - start, 0]
+
+        if data is None or data.size == 0:
+            return ['empty', None, None, time.time() - start, 0]
+
+        digest = get_digest(data)
+        import_time = time.time() - start
+        if previous is None:
+            return ['full', data, digest, import_time, data.shape[0]]
+
+        nr_rows, previous_digest = previous
+        if digest == previous_digest:
+            return ['unchanged', None, digest, import_time, data.shape[0]]
+        elif data.shape[0] > nr_rows and get_digest(data[:nr_rows]) == previous_digest:
+            return ['append', data[nr_rows:], digest, import_time, data.shape[0]]
         else:
-            if data is None or data.size == 0:
-                return None
-            else:
-                return [name, name_no_feedback, data, directory_name, settings]
+            return ['full', data, digest, import_time, data.shape[0]]
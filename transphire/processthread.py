@@ -39,6 +39,15 @@ from . import transphire_motion as tum
 from . import transphire_ctf as tuc
 from . import transphire_picking as tup
 from . import transphire_extract as tue
+from . import transphire_find as tfind
+from . import transphire_translation as ttrans
+from . import transphire_gpu as tgpu
+from . import transphire_log as tlog
+from . import transphire_transfer as ttransfer
+from . import transphire_sudo as tsudo
+from . import transphire_tar as ttar
+from . import transphire_health as thealth
+from . import transphire_outlier as toutlier
 from . import transphire_class2d as tuclass2d
 from . import transphire_select2d as tselect2d
 from . import transphire_train2d as ttrain2d
@@ -114,8 +123,24 @@ class ProcessThread(object):
         self.notification_time = float(self.settings['Notification']['Time until notification'])
         self.is_running = False
         self.data_frame = data_frame
+        self.find_engine = None
+        self.translation_index = None
+        self.log_writer = tlog.get_log_writer(self.settings, rotate=False)
+        try:
+            parallel_copies = int(self.settings['Copy']['Parallel copies'])
+        except KeyError:
+            parallel_copies = 4
+        self.transfer_engine = ttransfer.TransferEngine(max_workers=parallel_copies)
 
         self.queue = shared_dict['queue'][self.content_settings['name']]
+        self.queue_store = shared_dict['queue_store']
+        self.fs_health = shared_dict['fs_health']
+        self.metrics = shared_dict['metrics']
+        self.wakeup = shared_dict['wakeup'][self.content_settings['name']]
+        try:
+            self.event_scheduler = bool(self.settings['Output']['Scheduler'] == 'Event')
+        except KeyError:
+            self.event_scheduler = False
         self.shared_dict_typ = shared_dict['typ'][self.content_settings['name']]
         self.queue_lock = self.shared_dict_typ['queue_lock']
         try:
@@ -132,6 +157,8 @@ class ProcessThread(object):
             self.user = self.settings['{0}_user'.format(self.typ)]
         except KeyError:
             self.user = None
+        self.sudo_session = tsudo.SudoSession(self.user, self.password)
+        self.tar_packer = ttar.TarPacker()
 
         self.queue_com['log'].put(tu.create_log('Starting', name))
         self.has_finished = has_finished
@@ -166,6 +193,24 @@ class ProcessThread(object):
         else:
             time.sleep(wait_time % 1)
 
+    def wait_for_work(self, wait_time=10):
+        """
+        Wait for new entries in the queue of this process.
+        In Event scheduler mode, the process wakes up as soon as a producer adds an entry.
+        The wait_time is the fallback timeout.
+
+        Arguments:
+        wait_time - Maximum time to wait in seconds
+
+        Return:
+        None
+        """
+        if self.event_scheduler:
+            if self.wakeup.wait(wait_time):
+                self.wakeup.clear()
+        else:
+            self.wait(wait_time)
+
     def run(self):
         """
         Run the thread.
@@ -348,6 +393,9 @@ class ProcessThread(object):
             ])
         self.queue_com['log'].put(tu.create_log('Stopped', self.name))
         print(self.name, ': Stopped')
+        self.sudo_session.close()
+        self.tar_packer.close()
+        self.log_writer.close()
         self.has_finished.value = True
         self.GLOBAL_LOCKS.clear()
 
@@ -392,10 +440,11 @@ class ProcessThread(object):
                 [project_stop, scratch_stop],
                 ['project_folder', 'scratch_folder']
                 ):
-            try:
-                total_quota = shutil.disk_usage(self.settings[folder]).total / 1e12
-                used_quota = shutil.disk_usage(self.settings[folder]).used / 1e12
-            except FileNotFoundError:
+            health = self.fs_health.get(self.settings[folder])
+            if health['status'] in (thealth.STATUS_TIMEOUT, thealth.STATUS_ERROR):
+                # Hanging or broken mount: Wait for the next probe
+                return False
+            elif health['status'] == thealth.STATUS_MISSING:
                 self.stop.value = True
                 message_error = '\n'.join([
                     '{0} no longer available!'.format(
@@ -414,6 +463,8 @@ class ProcessThread(object):
                     message_error
                     )
                 return False
+            total_quota = health['total'] / 1e12
+            used_quota = health['used'] / 1e12
             if used_quota > (total_quota * stop):
                 self.stop.value = True
                 message_error = '\n'.join([
@@ -475,7 +526,7 @@ class ProcessThread(object):
                     # These processes do not have a mount point
                     return False
                 elif self.mount_directory in output_folder:
-                    if self.check_if_mounted(output_folder):
+                    if self.fs_health.is_mounted(output_folder):
                         self.shared_dict_typ[process] = False
                         self.queue_com['notification'].put(''.join([
                             '{0} is connected again!'.format(self.name),
@@ -511,32 +562,7 @@ class ProcessThread(object):
         Return:
         True, if the mount point is still present, else False
         """
-        folder_names = directory.split('/')
-        # Return, if the process is not running.
-        if folder_names[-1] == 'False' or folder_names[-1] == 'Later':
-            return False
-        else:
-            pass
-
-        for idx in range(1, len(folder_names)+1):
-            current_dir = os.path.join(*folder_names[0:idx])
-            if not current_dir:
-                continue
-            elif folder_names[0]:
-                pass
-            else:
-                current_dir = '/{0}'.format(current_dir)
-
-            if os.path.ismount(current_dir):
-                return True
-            else:
-                try:
-                    os.listdir(current_dir)
-                except PermissionError:
-                    return True
-                else:
-                    pass
-        return False
+        return thealth.check_if_mounted(directory)
 
     def reset_queue(self, aim=None, switch_feedback=False, remove_pattern='THIS IS A DUMMY PATTERN'):
         if aim is None:
@@ -557,43 +583,22 @@ class ProcessThread(object):
                 self.shared_dict['queue'][aim].get()
             self.wait(1)
 
-            with open(self.shared_dict['typ'][aim]['done_file'], 'r') as read:
-                content_done = [line.strip() for line in read.readlines() if line.strip()]
-            with open(self.shared_dict['typ'][aim]['save_file'], 'r') as read:
-                content_save = [line.strip() for line in read.readlines() if line.strip()]
+            content_done = self.queue_store.read(self.shared_dict['typ'][aim]['done_file'])
+            content_save = self.queue_store.read(self.shared_dict['typ'][aim]['save_file'])
 
             if switch_feedback:
-                tu.copy(
-                    self.shared_dict['typ'][aim]['save_file'],
-                    '{0}_folder_feedback_{1}'.format(self.shared_dict['typ'][aim]['save_file'], self.settings['do_feedback_loop'].value)
-                    )
-                tu.copy(
-                    self.shared_dict['typ'][aim]['list_file'],
-                    '{0}_folder_feedback_{1}'.format(self.shared_dict['typ'][aim]['list_file'], self.settings['do_feedback_loop'].value)
-                    )
-                tu.copy(
-                    self.shared_dict['typ'][aim]['done_file'],
-                    '{0}_folder_feedback_{1}'.format(self.shared_dict['typ'][aim]['done_file'], self.settings['do_feedback_loop'].value)
-                    )
+                for name in ('save_file', 'list_file', 'done_file'):
+                    self.queue_store.export(
+                        self.shared_dict['typ'][aim][name],
+                        '{0}_folder_feedback_{1}'.format(self.shared_dict['typ'][aim][name], self.settings['do_feedback_loop'].value)
+                        )
 
             pattern = re.compile(remove_pattern)
             combined_content = sorted([entry for entry in content_done + content_save if pattern.search(entry) is None])
 
-            self.try_write(
-                self.shared_dict['typ'][aim]['save_file'],
-                'w',
-                '{0}\n'.format('\n'.join(combined_content))
-                )
-            self.try_write(
-                self.shared_dict['typ'][aim]['done_file'],
-                'w',
-                ''
-                )
-            self.try_write(
-                self.shared_dict['typ'][aim]['list_file'],
-                'w',
-                ''
-                )
+            self.queue_store.write(self.shared_dict['typ'][aim]['save_file'], combined_content)
+            self.queue_store.write(self.shared_dict['typ'][aim]['done_file'], [])
+            self.queue_store.write(self.shared_dict['typ'][aim]['list_file'], [])
 
             self.shared_dict['typ'][aim]['queue_list_lock'].acquire()
             try:
@@ -604,6 +609,7 @@ class ProcessThread(object):
             for entry in combined_content:
                 assert entry, (aim, entry)
                 self.shared_dict['queue'][aim].put(entry, block=False)
+            self.shared_dict['wakeup'][aim].set()
 
             self.shared_dict['typ'][aim]['file_number'] = 0
 
@@ -721,7 +727,7 @@ class ProcessThread(object):
                     )
                 self.queue_com['notification'].put(message)
                 self.queue_com['error'].put(message)
-        self.wait(20)
+        self.wait_for_work(20)
 
     def start_queue(self, clear_list):
         """
@@ -793,7 +799,7 @@ class ProcessThread(object):
             self.queue_lock.release()
 
         if error:
-            self.wait(5)
+            self.wait_for_work(5)
             return None
         else:
             pass
@@ -822,6 +828,8 @@ class ProcessThread(object):
                 root_name = 'None'
             else:
                 root_name = self.remove_from_queue()
+                self.metrics.dequeue(self.typ, root_name)
+                self.queue_store.set_running(self.shared_dict_typ['save_file'], root_name)
         except Exception:
             self.shared_dict_typ['running'] -= 1
             if self.shared_dict_typ['running'] == 0:
@@ -900,6 +908,9 @@ class ProcessThread(object):
                 }
             }
 
+        success = False
+        if not dummy:
+            self.metrics.start(self.typ, root_name)
         try:
             method_dict[self.typ]['method'](
                 root_name=root_name,
@@ -997,16 +1008,15 @@ class ProcessThread(object):
             else:
                 pass
         else:
+            success = True
             if not dummy:
-                self.remove_from_queue_file(root_name, self.shared_dict_typ['save_file'])
-
                 self.queue_lock.acquire()
                 try:
-                    self.add_to_queue_file(
-                        root_name=root_name,
-                        file_name=self.shared_dict['typ'][self.typ]['done_file'],
+                    self.queue_store.move(
+                        root_name,
+                        self.shared_dict_typ['save_file'],
+                        self.shared_dict_typ['done_file'],
                         )
-
                 finally:
                     self.queue_lock.release()
 
@@ -1018,6 +1028,9 @@ class ProcessThread(object):
                 finally:
                     self.queue_lock.release()
 
+        if not dummy:
+            self.metrics.end(self.typ, root_name, success)
+
         #if self.typ == 'Picking': print(self.name, 'User Error! Reduce Max running', 4)
         self.queue_lock.acquire()
         try:
@@ -1072,19 +1085,8 @@ class ProcessThread(object):
                 )
             )
 
-        delete_stack = True
-        for key in self.shared_dict['typ']:
-            self.shared_dict['typ'][key]['save_lock'].acquire()
-            try:
-                for name in ('save_file', 'list_file'):
-                    with open(self.shared_dict['typ'][key][name]) as read:
-                        reads = read.read()
-                    if compressed_file in reads:
-                        delete_stack = False
-                    if stack_file in reads:
-                        delete_stack = False
-            finally:
-                self.shared_dict['typ'][key]['save_lock'].release()
+        # The queue store counts the references of the save and list files of all processes
+        delete_stack = not self.shared_dict['references'].count([stack_file, compressed_file])
 
         if delete_stack:
             options = (
@@ -1109,30 +1111,31 @@ class ProcessThread(object):
         Return:
         None
         """
-        self.shared_dict_typ['error_lock'].acquire()
-        try:
-            local = time.localtime()
-            print('\n{0}/{1}/{2}-{3}:{4}:{5}\t'.format(*local[0:6]))
-            print(root_name)
-            print('New error message in error file: {0}'.format(
-                self.shared_dict_typ['error_file']
-                ))
-            content = []
-            content.append('{0}/{1}/{2}-{3}:{4}:{5}\t'.format(*local[0:6]))
-            content.append('{0}\n'.format(self.typ))
-            content.append('{0}\n'.format(root_name))
-            if self.password:
-                content.append(
-                    '{0}\n\n\n'.format(
-                        str(msg).replace(self.password, 'SUDOPASSWORD')
-                        )
+        local = time.localtime()
+        print('\n{0}/{1}/{2}-{3}:{4}:{5}\t'.format(*local[0:6]))
+        print(root_name)
+        print('New error message in error file: {0}'.format(
+            self.shared_dict_typ['error_file']
+            ))
+        content = []
+        content.append('{0}/{1}/{2}-{3}:{4}:{5}\t'.format(*local[0:6]))
+        content.append('{0}\n'.format(self.typ))
+        content.append('{0}\n'.format(root_name))
+        if self.password:
+            content.append(
+                '{0}\n\n\n'.format(
+                    str(msg).replace(self.password, 'SUDOPASSWORD')
                     )
-            else:
-                content.append('{0}\n\n\n'.format(str(msg)))
+                )
+        else:
+            content.append('{0}\n\n\n'.format(str(msg)))
 
-            self.try_write(self.shared_dict_typ['error_file'], 'a', ''.join(content))
-        finally:
-            self.shared_dict_typ['error_lock'].release()
+        # The error lock is held by the log writer while the batch is written
+        self.log_writer.write(
+            self.shared_dict_typ['error_file'],
+            ''.join(content),
+            lock=self.shared_dict_typ['error_lock']
+            )
 
     def remove_from_queue(self):
         """
@@ -1164,25 +1167,7 @@ class ProcessThread(object):
         else:
             root_name_list = [root_name]
 
-        if allow_dublicate:
-            # Always write if dublicates are allowed
-            files_to_write = root_name_list
-        else:
-            files_to_write = []
-            try:
-                with open(file_name, 'r') as read:
-                    data = read.read()
-            except FileNotFoundError:
-                pass
-            else:
-                for name in root_name_list:
-                    if not re.search(r'^{0}$'.format(re.escape(name)), data, re.MULTILINE):
-                        files_to_write.append(name)
-
-        if files_to_write:
-            self.try_write(file_name, 'a', '{0}\n'.format("\n".join(files_to_write)))
-        else:
-            pass
+        self.queue_store.append(file_name, root_name_list, allow_dublicate=allow_dublicate)
 
     def all_in_queue_file(self, aim, root_name, lock=True):
         """
@@ -1197,17 +1182,8 @@ class ProcessThread(object):
         """
         if lock:
             self.shared_dict['typ'][aim]['queue_list_lock'].acquire()
-        matches = 0
         try:
-            files = (
-                self.shared_dict['typ'][aim]['list_file'],
-                )
-            for file_name in files:
-                try:
-                    with open(file_name, 'r') as read:
-                        matches = re.findall(r'^.*{0}.*$'.format(re.escape(root_name)), read.read(), re.MULTILINE)
-                except FileNotFoundError:
-                    pass
+            matches = self.queue_store.find(self.shared_dict['typ'][aim]['list_file'], root_name)
         finally:
             if lock:
                 self.shared_dict['typ'][aim]['queue_list_lock'].release()
@@ -1226,20 +1202,15 @@ class ProcessThread(object):
         """
         self.shared_dict['typ'][aim]['queue_lock'].acquire()
         self.shared_dict['typ'][aim]['queue_list_lock'].acquire()
-        is_present = False
         try:
-            files = (
-                self.shared_dict['typ'][aim]['save_file'],
-                self.shared_dict['typ'][aim]['list_file'],
-                self.shared_dict['typ'][aim]['done_file'],
+            is_present = self.queue_store.contains(
+                [
+                    self.shared_dict['typ'][aim]['save_file'],
+                    self.shared_dict['typ'][aim]['list_file'],
+                    self.shared_dict['typ'][aim]['done_file'],
+                    ],
+                root_name
                 )
-            for file_name in files:
-                try:
-                    with open(file_name, 'r') as read:
-                        if bool(re.search(r'{0}'.format(re.escape(root_name)), read.read(), re.MULTILINE)):
-                            is_present = True
-                except FileNotFoundError:
-                    pass
         finally:
             self.shared_dict['typ'][aim]['queue_lock'].release()
             self.shared_dict['typ'][aim]['queue_list_lock'].release()
@@ -1265,6 +1236,7 @@ class ProcessThread(object):
         try:
             for entry in root_name_list:
                 self.shared_dict['queue'][aim].put(entry, block=False)
+                self.metrics.enqueue(aim, entry)
             self.add_to_queue_file(
                 root_name=root_name_list,
                 file_name=self.shared_dict['typ'][aim]['save_file'],
@@ -1272,6 +1244,7 @@ class ProcessThread(object):
                 )
         finally:
             self.shared_dict['typ'][aim]['queue_lock'].release()
+        self.shared_dict['wakeup'][aim].set()
 
     def lost_connection(self, typ):
         """
@@ -1332,20 +1305,7 @@ class ProcessThread(object):
         if lock:
             self.queue_lock.acquire()
         try:
-            useable_lines = []
-            try:
-                with open(file_name, 'r') as read:
-                    lines = [line.strip() for line in read.readlines() if line.strip()]
-            except FileNotFoundError:
-                useable_lines = []
-            else:
-                for line in lines:
-                    if line not in root_name:
-                        useable_lines.append(line)
-                    else:
-                        pass
-
-            self.try_write(file_name, 'w', '{0}\n'.format('\n'.join(useable_lines)))
+            self.queue_store.remove(file_name, root_name)
         finally:
             if lock:
                 self.queue_lock.release()
@@ -1422,12 +1382,38 @@ class ProcessThread(object):
         self.queue_com['log'].put(tu.create_log(self.name, 'run_find start'))
         self.queue_lock.acquire()
         file_list = []
+        # Found files are only kept in the index file after they are in the queue
+        found_entries = {}
         try:
-            file_list = self.recursive_search(
-                directory=self.settings['Input']['Input project path for jpg'],
-                file_list=file_list,
-                find_meta=False
-                )
+            if self.find_engine is None:
+                try:
+                    find_method = self.settings['Input']['Find method']
+                except KeyError:
+                    find_method = 'Full scan'
+                self.find_engine = tfind.FindEngine(
+                    directory=self.settings['Input']['Input project path for jpg'],
+                    method=find_method,
+                    index_file=tfind.get_index_file(self.settings['queue_folder']),
+                    is_candidate=self.is_find_candidate,
+                    )
+
+            for entry in self.find_engine.candidates(stop=self.stop):
+                if self.stop.value:
+                    break
+                nr_found = len(file_list)
+                resolved = self.check_find_candidate(
+                    entry_dir=entry[0],
+                    file_list=file_list,
+                    find_meta=False
+                    )
+                if resolved is None:
+                    pass
+                elif len(file_list) != nr_found:
+                    self.find_engine.resolve(entry, persist=False)
+                    if resolved:
+                        found_entries[file_list[-1]] = entry
+                else:
+                    self.find_engine.resolve(entry, persist=resolved)
         finally:
             self.queue_lock.release()
 
@@ -1521,6 +1507,11 @@ class ProcessThread(object):
                             )
                     else:
                         pass
+
+                if self.stop.value:
+                    break
+                elif root_name in found_entries:
+                    self.find_engine.persist(found_entries[root_name])
         self.queue_com['log'].put(tu.create_log(self.name, 'run_find stop', time.time() - start_prog))
 
     def recursive_search(self, directory, file_list, find_meta):
@@ -1550,159 +1541,195 @@ class ProcessThread(object):
                     file_list=file_list,
                     find_meta=find_meta
                     )
-            elif self.settings["Input"]["Software"] == "Just Stack":
-                if not entry_dir.endswith(self.settings['Input']['Input frames extension']):
-                    continue
-                root_name = os.path.splitext(entry_dir)[0]
-                frames_root = root_name
-                compare_name = frames_root
-                frames = tus.find_frames(
-                    frames_root=frames_root,
-                    compare_name=compare_name,
-                    settings=self.settings,
-                    queue_com=self.queue_com,
-                    name=self.name,
-                    write_error=self.write_error
+            else:
+                self.check_find_candidate(
+                    entry_dir=entry_dir,
+                    file_list=file_list,
+                    find_meta=find_meta
                     )
 
-                if frames is None:
-                    self.shared_dict_typ['bad_lock'].acquire()
-                    try:
-                        if root_name not in self.shared_dict['bad'][self.typ]:
-                            self.shared_dict['bad'][self.typ].append(root_name)
-                        else:
-                            pass
-                    finally:
-                        self.shared_dict_typ['bad_lock'].release()
-                    continue
-                elif not frames:
-                    continue
-                elif self.already_in_translation_file(os.path.basename(root_name)):
-                    self.shared_dict_typ['bad_lock'].acquire()
-                    try:
-                        if root_name not in self.shared_dict['bad'][self.typ]:
-                            self.shared_dict['bad'][self.typ].append(root_name)
-                        else:
-                            pass
-                    finally:
-                        self.shared_dict_typ['bad_lock'].release()
-                    continue
-                elif self.already_in_queue_file('Import', os.path.basename(root_name)):
-                    self.shared_dict_typ['bad_lock'].acquire()
-                    try:
-                        if root_name not in self.shared_dict['bad'][self.typ]:
-                            self.shared_dict['bad'][self.typ].append(root_name)
-                        else:
-                            pass
-                    finally:
-                        self.shared_dict_typ['bad_lock'].release()
-                    continue
-                else:
-                    pass
+        return file_list
+
+    def is_find_candidate(self, entry_dir):
+        """
+        Check by name, if a file can be a micrograph found by the Find process.
+
+        entry_dir - File to check.
+
+        Returns:
+        True, if the file needs to be checked
+        """
+        if self.settings["Input"]["Software"] == "Just Stack":
+            return entry_dir.endswith(self.settings['Input']['Input frames extension'])
+        else:
+            return 'Data' in entry_dir and \
+                (entry_dir.endswith('.jpg') or entry_dir.endswith('.gtg'))
+
+    def check_find_candidate(self, entry_dir, file_list, find_meta):
+        """
+        Check a single file found during the search and add it to the file list.
 
-                self.shared_dict['typ'][self.content_settings['group']]['share_lock'].acquire()
+        entry_dir - File to check.
+        file_list - List of files that have been found.
+        find_meta - Find meta data flag.
+
+        Returns:
+        None, if the file needs to be checked again,
+        False, if the file does not need to be checked again in this session,
+        True, if the file does not need to be checked again unless it changes.
+        """
+        if self.settings["Input"]["Software"] == "Just Stack":
+            if not entry_dir.endswith(self.settings['Input']['Input frames extension']):
+                return None
+            root_name = os.path.splitext(entry_dir)[0]
+            frames_root = root_name
+            compare_name = frames_root
+            frames = tus.find_frames(
+                frames_root=frames_root,
+                compare_name=compare_name,
+                settings=self.settings,
+                queue_com=self.queue_com,
+                name=self.name,
+                write_error=self.write_error
+                )
+
+            if frames is None:
+                self.shared_dict_typ['bad_lock'].acquire()
                 try:
-                    if root_name in self.shared_dict['share'][self.content_settings['group']]:
-                        continue
+                    if root_name not in self.shared_dict['bad'][self.typ]:
+                        self.shared_dict['bad'][self.typ].append(root_name)
                     else:
-                        self.time_last = time.time()
-                        self.notification_send = False
-                        file_list.append(root_name)
-                        self.shared_dict['share'][self.content_settings['group']].append(
-                            root_name
-                            )
+                        pass
                 finally:
-                    self.shared_dict['typ'][self.content_settings['group']]['share_lock'].release()
-            elif find_meta:
-                if os.path.isfile(entry_dir) and 'Data' not in entry_dir and 'SurveyImages' not in entry_dir:
-                    file_list.append(entry_dir)
-                else:
-                    continue
-            elif os.path.isfile(entry_dir) and \
-                    'Data' in entry_dir and \
-                    (entry_dir.endswith('.jpg') or entry_dir.endswith('.gtg')):
-                root_name = entry_dir[:-len('.jpg')]
+                    self.shared_dict_typ['bad_lock'].release()
+                return False
+            elif not frames:
+                return None
+            elif self.already_in_translation_file(os.path.basename(root_name)):
                 self.shared_dict_typ['bad_lock'].acquire()
                 try:
-                    if root_name in self.shared_dict['bad'][self.typ]:
-                        continue
+                    if root_name not in self.shared_dict['bad'][self.typ]:
+                        self.shared_dict['bad'][self.typ].append(root_name)
                     else:
                         pass
                 finally:
                     self.shared_dict_typ['bad_lock'].release()
+                return True
+            elif self.already_in_queue_file('Import', os.path.basename(root_name)):
+                self.shared_dict_typ['bad_lock'].acquire()
+                try:
+                    if root_name not in self.shared_dict['bad'][self.typ]:
+                        self.shared_dict['bad'][self.typ].append(root_name)
+                    else:
+                        pass
+                finally:
+                    self.shared_dict_typ['bad_lock'].release()
+                return True
+            else:
+                pass
 
-                if entry_dir.endswith('.jpg'):
-                    frames_root = root_name.replace(
-                        self.settings['Input']['Input project path for jpg'],
-                        self.settings['Input']['Input project path for frames'],
+            self.shared_dict['typ'][self.content_settings['group']]['share_lock'].acquire()
+            try:
+                if root_name in self.shared_dict['share'][self.content_settings['group']]:
+                    return True
+                else:
+                    self.time_last = time.time()
+                    self.notification_send = False
+                    file_list.append(root_name)
+                    self.shared_dict['share'][self.content_settings['group']].append(
+                        root_name
                         )
-                    compare_name = frames_root[:-len('_19911213_2019')]
-                elif entry_dir.endswith('.gtg'):
-                    frames_root = root_name
-                    compare_name = frames_root
+            finally:
+                self.shared_dict['typ'][self.content_settings['group']]['share_lock'].release()
+        elif find_meta:
+            if os.path.isfile(entry_dir) and 'Data' not in entry_dir and 'SurveyImages' not in entry_dir:
+                file_list.append(entry_dir)
+            return None
+        elif os.path.isfile(entry_dir) and \
+                'Data' in entry_dir and \
+                (entry_dir.endswith('.jpg') or entry_dir.endswith('.gtg')):
+            root_name = entry_dir[:-len('.jpg')]
+            self.shared_dict_typ['bad_lock'].acquire()
+            try:
+                if root_name in self.shared_dict['bad'][self.typ]:
+                    return False
                 else:
-                    assert False
+                    pass
+            finally:
+                self.shared_dict_typ['bad_lock'].release()
 
-                frames = tus.find_frames(
-                    frames_root=frames_root,
-                    compare_name=compare_name,
-                    settings=self.settings,
-                    queue_com=self.queue_com,
-                    name=self.name,
-                    write_error=self.write_error
+            if entry_dir.endswith('.jpg'):
+                frames_root = root_name.replace(
+                    self.settings['Input']['Input project path for jpg'],
+                    self.settings['Input']['Input project path for frames'],
                     )
-                if frames is None:
-                    self.shared_dict_typ['bad_lock'].acquire()
-                    try:
-                        if root_name not in self.shared_dict['bad'][self.typ]:
-                            self.shared_dict['bad'][self.typ].append(root_name)
-                        else:
-                            pass
-                    finally:
-                        self.shared_dict_typ['bad_lock'].release()
-                    continue
-                elif not frames:
-                    continue
-                elif self.already_in_translation_file(os.path.basename(root_name)):
-                    self.shared_dict_typ['bad_lock'].acquire()
-                    try:
-                        if root_name not in self.shared_dict['bad'][self.typ]:
-                            self.shared_dict['bad'][self.typ].append(root_name)
-                        else:
-                            pass
-                    finally:
-                        self.shared_dict_typ['bad_lock'].release()
-                    continue
-                elif self.already_in_queue_file('Import', os.path.basename(root_name)):
-                    self.shared_dict_typ['bad_lock'].acquire()
-                    try:
-                        if root_name not in self.shared_dict['bad'][self.typ]:
-                            self.shared_dict['bad'][self.typ].append(root_name)
-                        else:
-                            pass
-                    finally:
-                        self.shared_dict_typ['bad_lock'].release()
-                    continue
-                else:
-                    pass
+                compare_name = frames_root[:-len('_19911213_2019')]
+            elif entry_dir.endswith('.gtg'):
+                frames_root = root_name
+                compare_name = frames_root
+            else:
+                assert False
 
-                self.shared_dict['typ'][self.content_settings['group']]['share_lock'].acquire()
+            frames = tus.find_frames(
+                frames_root=frames_root,
+                compare_name=compare_name,
+                settings=self.settings,
+                queue_com=self.queue_com,
+                name=self.name,
+                write_error=self.write_error
+                )
+            if frames is None:
+                self.shared_dict_typ['bad_lock'].acquire()
                 try:
-                    if root_name in self.shared_dict['share'][self.content_settings['group']]:
-                        continue
+                    if root_name not in self.shared_dict['bad'][self.typ]:
+                        self.shared_dict['bad'][self.typ].append(root_name)
                     else:
-                        self.time_last = time.time()
-                        self.notification_send = False
-                        file_list.append(root_name)
-                        self.shared_dict['share'][self.content_settings['group']].append(
-                            root_name
-                            )
+                        pass
+                finally:
+                    self.shared_dict_typ['bad_lock'].release()
+                return False
+            elif not frames:
+                return None
+            elif self.already_in_translation_file(os.path.basename(root_name)):
+                self.shared_dict_typ['bad_lock'].acquire()
+                try:
+                    if root_name not in self.shared_dict['bad'][self.typ]:
+                        self.shared_dict['bad'][self.typ].append(root_name)
+                    else:
+                        pass
+                finally:
+                    self.shared_dict_typ['bad_lock'].release()
+                return True
+            elif self.already_in_queue_file('Import', os.path.basename(root_name)):
+                self.shared_dict_typ['bad_lock'].acquire()
+                try:
+                    if root_name not in self.shared_dict['bad'][self.typ]:
+                        self.shared_dict['bad'][self.typ].append(root_name)
+                    else:
+                        pass
                 finally:
-                    self.shared_dict['typ'][self.content_settings['group']]['share_lock'].release()
+                    self.shared_dict_typ['bad_lock'].release()
+                return True
             else:
-                continue
+                pass
 
-        return file_list
+            self.shared_dict['typ'][self.content_settings['group']]['share_lock'].acquire()
+            try:
+                if root_name in self.shared_dict['share'][self.content_settings['group']]:
+                    return True
+                else:
+                    self.time_last = time.time()
+                    self.notification_send = False
+                    file_list.append(root_name)
+                    self.shared_dict['share'][self.content_settings['group']].append(
+                        root_name
+                        )
+            finally:
+                self.shared_dict['typ'][self.content_settings['group']]['share_lock'].release()
+        else:
+            return None
+
+        return True
 
     def run_import(self, root_name):
         """
@@ -1794,11 +1821,10 @@ class ProcessThread(object):
 
         if os.path.exists('{0}_krios_sum.mrc'.format(new_name_meta)):
             self.stop.value = True
-            if os.path.exists(self.shared_dict_typ['done_file']):
+            if self.queue_store.count(self.shared_dict_typ['done_file']):
                 self.queue_lock.acquire()
                 try:
-                    with open(self.shared_dict_typ['done_file'], 'r') as read:
-                        self.shared_dict_typ['file_number'] = len(read.readlines())
+                    self.shared_dict_typ['file_number'] = self.queue_store.count(self.shared_dict_typ['done_file'])
                 finally:
                     self.queue_lock.release()
             else:
@@ -1988,23 +2014,30 @@ class ProcessThread(object):
         Returns:
         True, if root_name in translation file.
         """
-        check_list = []
+        self.shared_dict['translate_lock'].acquire()
         try:
-            for name in ('translation_file', 'translation_file_bad'):
-                self.shared_dict['translate_lock'].acquire()
-                try:
-                    content_translation_file = np.genfromtxt(
-                        self.settings[name],
-                        usecols=0,
-                        dtype=str
-                        )
-                finally:
-                    self.shared_dict['translate_lock'].release()
-                check_list.append(bool(root_name in content_translation_file))
-        except OSError:
-            return False
-        else:
-            return bool([entry for entry in check_list if entry])
+            return self.get_translation_index().contains(root_name)
+        finally:
+            self.shared_dict['translate_lock'].release()
+
+    def get_translation_index(self):
+        """
+        Get the translation index of this process.
+        Needs to be called while holding the translate lock.
+
+        Returns:
+        TranslationIndex object
+        """
+        if self.translation_index is None:
+            self.translation_index = ttrans.TranslationIndex(
+                file_names=[
+                    self.settings['translation_file'],
+                    self.settings['translation_file_bad'],
+                    ],
+                journal_file=os.path.join(self.settings['queue_folder'], 'Translation_journal.txt'),
+                )
+            self.translation_index.load()
+        return self.translation_index
 
     def remove_from_translate(self, root_name, output_queue_dict=None):
         """
@@ -2253,11 +2286,11 @@ class ProcessThread(object):
                     ['{0}'.format(entry) for entry in entries]
                     )
                 ))
-        self.try_write(file_name, 'a', ''.join(content))
-
         self.queue_com['log'].put(tu.create_log(self.name, 'append_to_translate', root_name, 'translate_lock'))
         self.shared_dict['translate_lock'].acquire()
         try:
+            self.try_write(file_name, 'a', ''.join(content))
+            self.get_translation_index().add(entries[0])
             if first_entry:
                 self.try_write(file_name_bad, 'a', template.format('\n'.join(first_entry)))
         finally:
@@ -2658,11 +2691,11 @@ class ProcessThread(object):
             )
 
         self.queue_com['log'].put(tu.create_log(self.name, 'run_motion', root_name_input, 'Check outlier'))
-        warnings, skip_list = tus.check_for_outlier(
+        warnings, skip_list = self.check_for_outlier(
             dict_name='Motion',
             data=data,
             file_name=queue_dict[0]['sum'][0],
-            settings=self.settings
+            directory=self.settings['motion_folder_feedback_0'],
             )
 
         if skip_list:
@@ -2709,9 +2742,9 @@ class ProcessThread(object):
             star_files_relion3_meta = output_combine[6]
 
             combine_list = [
-                [self.shared_dict['motion_txt_lock'], output_name_mic, output_name_mic_combined],
-                [self.shared_dict['motion_star_lock'], output_name_star, output_name_star_combined],
-                [self.shared_dict['motion_star_relion3_lock'], output_name_star_relion3, output_name_star_relion3_combined],
+                [output_name_mic, output_name_mic_combined],
+                [output_name_star, output_name_star_combined],
+                [output_name_star_relion3, output_name_star_relion3_combined],
                 ]
             self.queue_com['log'].put(tu.create_log(self.name, 'run_motion', root_name_input, 'Create combines'))
             self.create_combines(combine_list, output_queue_dict=output_queue_dict)
@@ -2966,11 +2999,11 @@ class ProcessThread(object):
             )
 
         try:
-            warnings, skip_list = tus.check_for_outlier(
+            warnings, skip_list = self.check_for_outlier(
                 dict_name='CTF',
                 data=data,
                 file_name=file_sum,
-                settings=self.settings
+                directory=self.settings['ctf_folder_feedback_0'],
                 )
         except ValueError:
             raise IOError('{0} - Please check, if {0} can be executed outside of TranSPHIRE'.format(self.settings['Copy']['CTF']))
@@ -3024,8 +3057,8 @@ class ProcessThread(object):
             )
 
         combine_list = [
-            [self.shared_dict['ctf_partres_lock'], output_name_partres, output_name_partres_comb],
-            [self.shared_dict['ctf_star_lock'], output_name_star, output_name_star_comb],
+            [output_name_partres, output_name_partres_comb],
+            [output_name_star, output_name_star_comb],
             ]
         self.create_combines(combine_list)
 
@@ -3366,8 +3399,7 @@ class ProcessThread(object):
                     root_name=root_name,
                     file_name=self.shared_dict_typ['list_file'],
                     )
-                with open(self.shared_dict_typ['list_file']) as read:
-                    box_files = [line.strip() for line in read.readlines() if line.strip() and '.box' in line]
+                box_files = [line for line in self.queue_store.read(self.shared_dict_typ['list_file']) if '.box' in line]
                 if not box_files:
                     error = True
                 else:                
@@ -4127,11 +4159,11 @@ class ProcessThread(object):
                     import_name
                     )
 
-                warnings, skip_list = tus.check_for_outlier(
+                warnings, skip_list = self.check_for_outlier(
                     dict_name='Picking',
                     data=data,
                     file_name=file_use,
-                    settings=self.settings
+                    directory=self.settings[entry_name],
                     )
 
                 if skip_list:
@@ -4508,12 +4540,7 @@ class ProcessThread(object):
             prog_name_window = self.settings['Copy']['Extract']
             mount_name = self.settings['Copy']['Copy to work']
 
-            with open(self.shared_dict_typ['list_file'], 'r') as read:
-                lines = [
-                    entry.strip()
-                    for entry in read.readlines()
-                    if entry.strip()
-                    ]
+            lines = self.queue_store.read(self.shared_dict_typ['list_file'])
             lines_to_use = []
             final_lines_to_use = []
             total_n = 0
@@ -4928,17 +4955,16 @@ class ProcessThread(object):
             self.try_write(self.shared_dict_typ['number_file'], 'w', '|||'.join([str(entry) for entry in [old_shrink_ratio, current_index, new_volume]]))
 
             if volume != 'XXXNoneXXX':
-                with open(self.shared_dict_typ['list_file'], 'r') as read:
-                    lines = [
-                        entry.strip()
-                        for entry in read.readlines()
-                        if entry.strip() and entry.strip() not in final_lines_to_use
-                        ]
+                lines = [
+                    entry
+                    for entry in self.queue_store.read(self.shared_dict_typ['list_file'])
+                    if entry not in final_lines_to_use
+                    ]
 
                 for entry in final_lines_to_use:
                     self.shared_dict_typ['queue_list'].remove(entry)
 
-                self.try_write(self.shared_dict_typ['list_file'], 'w', '\n'.join(lines) + '\n')
+                self.queue_store.write(self.shared_dict_typ['list_file'], lines)
 
         finally:
             self.shared_dict_typ['queue_list_time'] = time.time()
@@ -4947,6 +4973,9 @@ class ProcessThread(object):
 
     def copy_extern(self, my_typ, copy_file):
         new_names = []
+        jobs = []
+        reserved = {}
+        copy_method = None
         for copy_file_name in copy_file:
             mount_folder_name = '{0}_folder_feedback_0'.format(my_typ.lower())
             mount_name = self.settings['Copy'][my_typ]
@@ -4976,16 +5005,19 @@ class ProcessThread(object):
 
             if protocol == 'hdd':
                 new_name = None
+                file_size = os.path.getsize(copy_file_name)
                 for hdd_folder in glob.glob(
                         '{0}/*'.format(
                             self.settings[mount_folder_name]
                             )
                         ):
-                    if os.path.getsize(copy_file_name) > \
+                    # Files copied in parallel are not on the HDD yet
+                    if file_size + reserved.get(hdd_folder, 0) > \
                             shutil.disk_usage(hdd_folder).free:
                         new_name = None
                         continue
                     else:
+                        reserved[hdd_folder] = reserved.get(hdd_folder, 0) + file_size
                         new_name = os.path.join(
                             *new_prefix,
                             os.path.basename(hdd_folder),
@@ -4998,8 +5030,26 @@ class ProcessThread(object):
                 new_name = os.path.join(*new_prefix, *new_suffix)
 
             new_names.append(new_name)
-            copy_method(copy_file_name, new_name)
+            jobs.append((copy_file_name, new_name))
+
+        if not jobs:
+            return new_names
 
+        start = time.time()
+        if copy_method == self.copy_as_user:
+            results = self.transfer_engine.run_parallel(copy_method, jobs)
+        else:
+            results = [copy_method(*job) for job in jobs]
+        duration = time.time() - start
+
+        size = sum([entry[0] for entry in results if entry is not None]) / 1024**2
+        self.queue_com['log'].put(tu.create_log(
+            self.name,
+            'copy_extern',
+            '{0} files'.format(len(jobs)),
+            '{0:.1f} MB'.format(size),
+            '{0:.1f} MB/s'.format(size / max(duration, 1e-6)),
+            ))
         return new_names
 
 
@@ -5081,6 +5131,7 @@ class ProcessThread(object):
                     )
             finally:
                 self.shared_dict_typ['queue_list_lock'].release()
+            copy_file = self.finalize_tar(copy_file)
 
         elif dont_tar:
             copy_file = root_name
@@ -5113,16 +5164,17 @@ class ProcessThread(object):
                 root_name = [root_name]
             root_name = [entry for entry in root_name if os.path.isfile(entry)]
 
-            with tarfile.open(tar_file, 'a') as tar:
-                for entry in root_name:
-                    tar.add(
-                        entry,
-                        arcname=os.path.join('..', entry.replace(self.settings['project_folder'], ''))
-                        )
+            tar_size = self.tar_packer.add(
+                tar_file,
+                [
+                    (entry, os.path.join('..', entry.replace(self.settings['project_folder'], '')))
+                    for entry in root_name
+                    ]
+                )
 
             self.shared_dict_typ['queue_list_lock'].acquire()
             try:
-                if os.path.getsize(tar_file) > float(self.settings['Copy']['Tar size (Gb)']) * 1024**3:
+                if tar_size > float(self.settings['Copy']['Tar size (Gb)']) * 1024**3:
                     copy_file = tar_file
                     self.shared_dict_typ['tar_idx'] += 1
                     new_tar_file = os.path.join(
@@ -5147,6 +5199,7 @@ class ProcessThread(object):
                     return None
             finally:
                 self.shared_dict_typ['queue_list_lock'].release()
+            copy_file = self.finalize_tar(copy_file)
 
         if not isinstance(copy_file, list):
             copy_file = [copy_file]
@@ -5156,19 +5209,35 @@ class ProcessThread(object):
         self.shared_dict_typ['queue_list_time'] = time.time()
         self.queue_com['log'].put(tu.create_log(self.name, 'run_copy_extern', root_name_input, 'stop process', time.time() - start_prog))
 
-    @staticmethod
-    def get_hash(file_in, chunksize=1024**2):
-        length = 0
-        hashes = []
-        with open(file_in, 'rb') as read:
-            while True:
-                data = read.read(chunksize)
-                if not data:
-                    break
-                else:
-                    length += len(data)
-                    hashes.append(hash(data))
-        return length, hash(tuple(hashes))
+    def finalize_tar(self, tar_file):
+        """
+        Close a tar file and compress it, if requested.
+
+        tar_file - Tar file to copy
+
+        Returns:
+        List of files to copy, the tar file and its index file
+        """
+        if self.tar_packer.tar_file == tar_file:
+            self.tar_packer.close()
+
+        try:
+            do_compress = bool(self.settings['Copy']['Tar compression'] == 'True')
+        except KeyError:
+            do_compress = False
+        if do_compress:
+            compressed_file = ttar.compress(tar_file)
+            for file_name in (tar_file, ttar.get_index_file(tar_file)):
+                try:
+                    os.remove(file_name)
+                except FileNotFoundError:
+                    pass
+            tar_file = compressed_file
+
+        copy_file = [tar_file]
+        if os.path.exists(ttar.get_index_file(tar_file)):
+            copy_file.append(ttar.get_index_file(tar_file))
+        return copy_file
 
     def copy_as_user(self, file_in, file_out):
         """
@@ -5178,53 +5247,21 @@ class ProcessThread(object):
         file_out - Output file path
 
         Returns:
-        None
+        Number of copied bytes, time in seconds
         """
         self.check_ready_for_copy(file_out=file_out)
 
         tu.mkdir_p(os.path.dirname(file_out))
-        counter = 0
-        network_counter = 0
-
-        do_checksum = os.path.split(file_in)[0] != self.settings['project_folder']
-        if do_checksum:
-            try:
-                len_data_in, checksum_in = self.get_hash(file_in)
-            except IsADirectoryError:
-                do_checksum = False
-
-        while True:
-            try:
-                tu.copy(file_in, file_out)
-            except Exception:
-                if network_counter >= 5:
-                    raise
-                else:
-                    network_counter += 1
-                    time.sleep(1)
-                    continue
-
-            if not do_checksum:
-                break
 
-            len_data_out, checksum_out = self.get_hash(file_out)
-
-            if len_data_in == len_data_out:
-                if checksum_in == checksum_out:
-                    break
-                elif counter == 5:
-                    #print('PROBLEM', counter, file_in, file_out, checksum_in, checksum_out, len_data_out, len_data_in)
-                    raise Exception('PROBLEM')
-                else:
-                    #print('PROBLEM', counter, file_in, file_out, checksum_in, checksum_out, len_data_out, len_data_in)
-                    counter += 1
-            elif counter == 5:
-                #print('PROBLEM', counter, file_in, file_out, checksum_in, checksum_out, len_data_out, len_data_in)
-                raise Exception('PROBLEM')
-            else:
-                #print('PROBLEM', counter, file_in, file_out, checksum_in, checksum_out, len_data_out, len_data_in)
-                counter += 1
+        if os.path.isdir(file_in):
+            start = time.time()
+            tu.copy(file_in, file_out)
+            return 0, time.time() - start
 
+        do_checksum = os.path.split(file_in)[0] != self.settings['project_folder']
+        length, copy_time = self.transfer_engine.copy(file_in, file_out, verify=do_checksum)
+        tu.copy_stat(file_in, file_out)
+        return length, copy_time
 
     def check_ready_for_copy(self, file_out):
         """
@@ -5245,49 +5282,22 @@ class ProcessThread(object):
         file_out - Output file path
 
         Returns:
-        None
+        Number of copied bytes, time in seconds
         """
         self.check_ready_for_copy(file_out=file_out)
 
         self.mkdir_p_as_another_user(folder=os.path.dirname(file_out))
 
-
         counter = 0
         do_checksum = os.path.split(file_in)[0] != self.settings['project_folder']
-        if do_checksum:
-            with open(file_in, 'rb') as read:
-                content = read.read()
-            checksum_in = hash(content)
-            len_data_in = len(content)
-
         while True:
-            command = 'sudo -k -S -u {0} rsync {1} {2}'.format(
-                self.user,
-                file_in,
-                file_out
-                )
-            child = pe.spawnu(command)
-            child.sendline(self.password)
-            child.expect(pe.EOF)
-
-            if 'rsync:' in child.before:
-                text = child.before.replace(self.password, 'PASSWORD')
-                raise IOError(
-                    'Cannot copy file: {0}! {1}'.format(file_out, text)
-                    )
-            else:
-                pass
+            reply = self.sudo_session.copy(file_in, file_out, verify=do_checksum)
 
             if not do_checksum:
                 break
 
-            with open(file_out, 'rb') as read:
-                content = read.read()
-            len_data_out = len(content)
-            checksum_out = hash(content)
-
-            if len_data_in == len_data_out:
-                if checksum_in == checksum_out:
+            if reply['length_in'] == reply['length_out']:
+                if reply['checksum_in'] == reply['checksum_out']:
                     break
                 elif counter == 5:
                     print('PROBLEM', counter, file_in, file_out)
@@ -5299,6 +5309,14 @@ class ProcessThread(object):
                 print('PROBLEM', counter, file_in, file_out)
                 counter += 1
 
+        self.queue_com['log'].put(tu.create_log(
+            self.name,
+            'copy_as_another_user',
+            file_in,
+            '{0:.1f} MB/s'.format(reply['length_in'] / 1024**2 / max(reply['time'], 1e-6)),
+            ))
+        return reply['length_in'], reply['time']
+
     def mkdir_p_as_another_user(self, folder):
         """
         Create folders recursively as another user with the help of sudo.
@@ -5308,17 +5326,12 @@ class ProcessThread(object):
         Returns:
         None
         """
-        command = 'sudo -k -S -u {0} mkdir -p {1}'.format(self.user, folder)
-        child = pe.spawnu(command)
-        child.sendline(self.password)
-        child.expect(pe.EOF)
-        if 'mkdir:' in child.before:
-            text = child.before.replace(self.password, 'PASSWORD')
+        try:
+            self.sudo_session.mkdir(folder)
+        except IOError as e:
             raise IOError(
-                'Cannot create directory: {0}! {1}'.format(folder, text)
+                'Cannot create directory: {0}! {1}'.format(folder, e)
                 )
-        else:
-            pass
 
     def run_command(self, command, log_prefix, block_gpu, gpu_list, shell, file_to_delete=None, root_name_input='INVALID'):
         """
@@ -5334,31 +5347,14 @@ class ProcessThread(object):
         """
         log_file, err_file = tus.get_logfiles(log_prefix)
 
-        mutex_idx = 0
-        count_idx = 1
-
-        if gpu_list:
-            gpu_list = [
-                (entry.split('_')[0], entry)
-                if '_' in entry
-                else
-                (entry, entry)
-                for entry in sorted(gpu_list)
-                ]
-
-            for main, entry in gpu_list:
-                if '_' in entry:
-                    self.shared_dict['gpu_lock'][main][mutex_idx].acquire()
-                self.shared_dict['gpu_lock'][entry][mutex_idx].acquire()
-
-            for main, entry in gpu_list:
-                if '_' in entry:
-                    with self.shared_dict['gpu_lock'][main][count_idx].get_lock():
-                        self.shared_dict['gpu_lock'][main][count_idx].value += 1
-                    self.shared_dict['gpu_lock'][main][mutex_idx].release()
-                else:
-                    while self.shared_dict['gpu_lock'][main][count_idx].value != 0:
-                        self.wait(0.05)
+        try:
+            gpu_request = self.shared_dict['gpu_scheduler'].acquire(
+                gpu_list,
+                priority=tgpu.STAGE_PRIORITY.get(self.typ, 0),
+                abort=self.abort,
+                )
+        except tgpu.GpuAbort:
+            raise UserWarning('STOP: abort')
 
         try:
             if self.abort.value:
@@ -5428,12 +5424,7 @@ class ProcessThread(object):
             self.delete_file_to_delete(file_to_delete)
 
         finally:
-            if gpu_list:
-                for main, entry in gpu_list:
-                    if '_' in entry:
-                        with self.shared_dict['gpu_lock'][main][count_idx].get_lock():
-                            self.shared_dict['gpu_lock'][main][count_idx].value -= 1
-                    self.shared_dict['gpu_lock'][entry][mutex_idx].release()
+            self.shared_dict['gpu_scheduler'].release(gpu_request)
 
         return log_file, err_file
 
@@ -5450,6 +5441,58 @@ class ProcessThread(object):
                     pass
             time.sleep(0.1)
 
+    def check_for_outlier(self, dict_name, data, file_name, directory):
+        """
+        Check the current file and the median of the last values against the
+        Notification settings. The data only contains the current file, so by
+        default the median is the value of the current file.
+        With Notification -> Median over previous micrographs, the median is
+        taken from the running window of the OutlierDetector, which is filled
+        with all results of the output folder if there is no saved window.
+
+        Arguments:
+        dict_name - Name of the plot data type
+        data - Plot data array containing the current file
+        file_name - Current file
+        directory - Output folder of the plot data
+
+        Return:
+        List of warnings, list of skip reasons
+        """
+        try:
+            use_window = self.settings['Notification']['Median over previous micrographs'] == 'True'
+        except KeyError:
+            use_window = False
+        if not use_window:
+            return tus.check_for_outlier(
+                dict_name=dict_name,
+                data=data,
+                file_name=file_name,
+                settings=self.settings,
+                )
+
+        detector = self.shared_dict['outlier']
+        size = int(self.settings['Notification']['Nr. of values used for median'])
+        rows = toutlier.get_outlier_rows(dict_name, data)
+        statistics = detector.update(directory, dict_name, size, rows)
+        if statistics is None:
+            data_all, _ = tu.get_function_dict()[self.prog_name]['plot_data'](
+                self.prog_name,
+                self.prog_name,
+                self.settings,
+                directory,
+                )
+            detector.fill(directory, dict_name, size, toutlier.get_outlier_rows(dict_name, data_all))
+            statistics = detector.update(directory, dict_name, size, rows)
+
+        return tus.check_for_outlier(
+            dict_name=dict_name,
+            data=data,
+            file_name=file_name,
+            settings=self.settings,
+            statistics=statistics,
+            )
+
     def send_out_of_range_error(self, warning, file_name, error_type):
         message_const = 'If this is not the only message, you might consider changing microscope settings!'
 
@@ -5484,17 +5527,21 @@ class ProcessThread(object):
         self.write_error(msg=message_error, root_name=file_name)
 
     def create_combines(self, combine_list, output_queue_dict=None):
-        for file_lock, in_file, out_file in combine_list:
-            file_lock.acquire()
-            try:
-                with open(in_file, 'r') as read:
-                    if not os.path.exists(out_file):
-                        lines = read.readlines()
-                    else:
-                        lines = read.readlines()[-1]
-                self.try_write(out_file, 'a+', ''.join(lines))
-            finally:
-                file_lock.release()
+        """
+        Append the per micrograph files to the combined files.
+        The rows are written by the combine writer of the ProcessWorker.
+
+        Arguments:
+        combine_list - List of [per micrograph file, combined file]
+        output_queue_dict - Output queue dictionary used for the distribution
+
+        Return:
+        None
+        """
+        is_written, wait_time = self.shared_dict['combine'].combine(combine_list)
+        if not is_written:
+            self.queue_com['log'].put(tu.create_log(self.name, 'create_combines', 'No response of the combine writer after', wait_time))
+        for in_file, out_file in combine_list:
             self.file_to_distribute(file_name=in_file, output_queue_dict=output_queue_dict)
             self.file_to_distribute(file_name=out_file, output_queue_dict=output_queue_dict)
 
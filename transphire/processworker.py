@@ -15,7 +15,6 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-import numpy as np
 import json
 import pexpect as pe
 import time
@@ -27,14 +26,26 @@ import copy as cp
 from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 import multiprocessing as mp
 import multiprocessing.managers
-import queue
 
 from . import transphire_utils as tu
+from . import transphire_queue as tq
+from . import transphire_shared as tsh
+from . import transphire_gpu as tgpu
+from . import transphire_log as tlog
+from . import transphire_dataframe as tdf
+from . import transphire_health as thealth
+from . import transphire_combine as tcombine
+from . import transphire_outlier as toutlier
+from . import transphire_metrics as tmetrics
+from . import transphire_restart as trestart
+from . import transphire_find as tfind
 
 
 class MyManager(multiprocessing.managers.BaseManager):
     pass
-MyManager.register('LifoQueue', queue.LifoQueue)
+MyManager.register('LifoQueue', trestart.LifoQueue)
+MyManager.register('QueueReferences', tq.QueueReferences)
+MyManager.register('OutlierDetector', toutlier.OutlierDetector)
 
 
 class ProcessWorker(QObject):
@@ -86,6 +97,9 @@ class ProcessWorker(QObject):
         self.stop = None
         self.abort = None
         self.settings = {}
+        self.log_writer = None
+        self.metrics_collector = None
+        self.metrics_interval = 0
         self.idx_number = 0
         self.idx_values = 1
 
@@ -155,10 +169,21 @@ class ProcessWorker(QObject):
             settings[picking_name]['--weights_old'] = set_value
 
         self.settings = settings
+        self.log_writer = tlog.get_log_writer(self.settings)
         self.sig_set_project_directory.emit(self.settings['project_folder'], self.settings['log_folder'], self.settings['error_folder'])
 
+        try:
+            queue_backend = self.settings['Output']['Queue backend']
+        except KeyError:
+            queue_backend = 'Text'
+        queue_store = tq.get_queue_store(queue_backend, self.settings['queue_folder'])
+
         manager_lifo = MyManager()
         manager_lifo.start()
+        queue_references = manager_lifo.QueueReferences()
+        outlier_detector = manager_lifo.OutlierDetector(
+            os.path.join(self.settings['log_folder'], 'Outlier_windows')
+            )
         manager = mp.Manager()
         typ_dict = {}
         share_dict = {}
@@ -177,7 +202,7 @@ class ProcessWorker(QObject):
                     bad_dict[key] = manager.list()
                     queue_dict[key] = manager_lifo.LifoQueue()
                     #queue_dict[key] = manager.Queue()
-                    typ_dict[key] = manager.dict({
+                    typ_dict[key] = tsh.SharedDict({
                         'file_number': 0,
                         'spot': False,
                         'lost_input_meta': False,
@@ -198,14 +223,14 @@ class ProcessWorker(QObject):
                         'running': 0,
                         'do_update_count': 0,
                         'queue_list': manager.list(),
-                        'queue_list_lock': manager.Lock(),
-                        'queue_lock': manager.Lock(),
-                        'save_lock': manager.Lock(),
-                        'count_lock': manager.Lock(),
-                        'error_lock': manager.Lock(),
-                        'bad_lock': manager.Lock(),
-                        'share_lock': manager.Lock(),
-                        'write_lock': manager.Lock(),
+                        'queue_list_lock': mp.Lock(),
+                        'queue_lock': mp.Lock(),
+                        'save_lock': mp.Lock(),
+                        'count_lock': mp.Lock(),
+                        'error_lock': mp.Lock(),
+                        'bad_lock': mp.Lock(),
+                        'share_lock': mp.Lock(),
+                        'write_lock': mp.Lock(),
                         'spot_dict': manager.dict(self.fill_spot_dict()),
                         'settings_file': '{0}/updated_settings_{1}.txt'.format(
                             self.settings['log_folder'],
@@ -249,6 +274,7 @@ class ProcessWorker(QObject):
             self.emit_plot_signals([], monitor=True)
             self.run_monitor(
                 typ_dict=typ_dict,
+                queue_store=queue_store,
                 queue_com=queue_com,
                 full_content=full_content,
                 )
@@ -256,6 +282,7 @@ class ProcessWorker(QObject):
             self.stop = bool(self.pre_check_programs())
             self.run_process(
                 typ_dict=typ_dict,
+                queue_store=queue_store,
                 queue_com=queue_com,
                 share_dict=share_dict,
                 bad_dict=bad_dict,
@@ -264,13 +291,17 @@ class ProcessWorker(QObject):
                 full_content=full_content,
                 manager=manager,
                 restart_dict=restart_dict,
+                queue_references=queue_references,
+                outlier_detector=outlier_detector,
                 )
 
+        self.log_writer.close()
         self.sig_finished.emit()
 
     def run_monitor(
             self,
             typ_dict,
+            queue_store,
             queue_com,
             full_content
         ):
@@ -279,6 +310,7 @@ class ProcessWorker(QObject):
 
         Arguments:
         typ_dict - Dictionary for the queue types
+        queue_store - Queue store holding the Queue_* files
         queue_com - Dictionary for queue communication
 
         Returns:
@@ -302,16 +334,8 @@ class ProcessWorker(QObject):
             for entry in full_content:
                 name = entry[0]
                 key = '_'.join([key for key in name.split('_') if not check_int(key)])
-                try:
-                    with open(typ_dict[key]['save_file']) as read:
-                        nr_do = len([line for line in read.readlines() if line.strip()])
-                except FileNotFoundError:
-                    nr_do = 0
-                try:
-                    with open(typ_dict[key]['done_file']) as read:
-                        nr_done = len([line for line in read.readlines() if line.strip()])
-                except FileNotFoundError:
-                    nr_done = 0
+                nr_do = queue_store.count(typ_dict[key]['save_file'])
+                nr_done = queue_store.count(typ_dict[key]['done_file'])
                 queue_com['status'].put([
                     text,
                     [
@@ -333,6 +357,7 @@ class ProcessWorker(QObject):
 
     def run_process(self,
             typ_dict,
+            queue_store,
             queue_com,
             share_dict,
             bad_dict,
@@ -341,13 +366,18 @@ class ProcessWorker(QObject):
             full_content,
             manager,
             restart_dict,
+            queue_references,
+            outlier_detector,
         ):
         """
         Run the TranSPHIRE process.
 
         Arguments:
         typ_dict - Dictionary for the queue types
+        queue_store - Queue store holding the Queue_* files
         queue_com - Dictionary for queue communication
+        queue_references - Reference counts of the queued stacks
+        outlier_detector - Running median windows of the outlier check
 
         Returns:
         None
@@ -356,7 +386,7 @@ class ProcessWorker(QObject):
         folder_list = ['stack_folder', 'meta_folder']
         use_threads_list = ['Meta', 'Find', 'Import']
 
-        data_frame = tu.DataFrame(manager, self.settings['data_frame'])
+        data_frame = tdf.DataFrame(self.settings['data_frame'])
 
         # Decide if one will use copy to hdd
         self.settings['Copy']['Copy_to_hdd'] = self.settings['Copy']['Copy to hdd']
@@ -493,30 +523,58 @@ class ProcessWorker(QObject):
                     pass
 
         # Fill different dictionarys with process information
-        gpu_mutex_dict = dict([
-            ('{0}_{1}'.format(idx, idx_2), [manager.RLock(), mp.Value('i', 0)])
-            if idx_2 != -1
-            else
-            (str(idx), [manager.RLock(), mp.Value('i', 0)])
-            for idx in range(10)
-            for idx_2 in range(-1, 10)
-            ])
+        # Blocking GPU slot scheduler shared by all processes
+        gpu_scheduler = tgpu.GpuScheduler()
+
+        # Filesystem health of the folders, probed by one thread of this process
+        health_folders = [
+            self.settings['project_folder'],
+            self.settings['scratch_folder'],
+            self.settings['Input']['Input project path for frames'],
+            self.settings['Input']['Input project path for jpg'],
+            ]
+        for name in ('work', 'backup', 'hdd'):
+            try:
+                health_folders.append(self.settings['copy_to_{0}_folder_feedback_0'.format(name)])
+            except KeyError:
+                pass
+        fs_health = thealth.get_fs_health(self.settings, health_folders)
+        fs_health.start()
+
+        # Per stage latency metrics, the frequent events use a non blocking queue
+        metrics, self.metrics_interval = tmetrics.get_metrics(self.settings, mp.Queue())
+        if metrics.queue is not None:
+            queue_com['metrics'] = metrics.queue
+        self.metrics_collector = tmetrics.MetricsCollector()
+
+        # Single writer of the combined star and partres files
+        combine_sender = tcombine.CombineSender(mp.Queue())
+        combine_writer = tcombine.CombineWriter(
+            combine_sender,
+            index_folder=os.path.join(self.settings['log_folder'], 'Combine_index'),
+            combine_folder=self.settings['project_folder'],
+            )
+        combine_writer.start()
+
+        # Wake up events for the event driven scheduler
+        wakeup_dict = dict([(key, mp.Event()) for key in typ_dict])
 
         # Shared dictionary
         shared_dict = {
             'share': share_dict,
             'bad': bad_dict,
             'queue': queue_dict,
-            'global_update_lock': manager.Lock(),
-            'translate_lock': manager.Lock(),
-            'ctf_star_lock': manager.Lock(),
-            'ctf_partres_lock': manager.Lock(),
-            'motion_star_lock': manager.Lock(),
-            'motion_star_relion3_lock': manager.Lock(),
-            'motion_txt_lock': manager.Lock(),
-            'gpu_lock': gpu_mutex_dict,
-            'gpu_lock_lock': manager.Lock(),
-            'data_frame_lock': manager.Lock(),
+            'global_update_lock': mp.Lock(),
+            'translate_lock': mp.Lock(),
+            'gpu_scheduler': gpu_scheduler,
+            'fs_health': fs_health,
+            'metrics': metrics,
+            'combine': combine_sender,
+            'outlier': outlier_detector,
+            'data_frame_lock': mp.Lock(),
+            'queue_store': queue_store,
+            'references': queue_references,
+            'wakeup': wakeup_dict,
             'typ': typ_dict,
             }
 
@@ -575,7 +633,10 @@ class ProcessWorker(QObject):
         with open(self.settings['feedback_file'], 'w') as write:
             write.write(str(self.settings['do_feedback_loop'].value))
 
-        # Fill process queues
+        # Fill process queues, the queues are filled in the background while the processes start
+        restart_start = time.time()
+        feeder = trestart.QueueFeeder()
+        feeder.start()
         for entry in content_process:
             for process in entry:
                 for key in process:
@@ -588,6 +649,7 @@ class ProcessWorker(QObject):
                         entry=process[key][1],
                         restart_dict=restart_dict,
                         keep_list=keep_list,
+                        feeder=feeder,
                         )
         for entry in content_process:
             for process in entry:
@@ -601,7 +663,21 @@ class ProcessWorker(QObject):
                         entry=process[key][1],
                         restart_dict=restart_dict,
                         keep_list=keep_list,
+                        feeder=feeder,
                         )
+        feeder.close()
+        queue_com['log'].put(tu.create_log('Restart: Queues prepared in {0:.2f} sec'.format(time.time() - restart_start)))
+
+        # Count the queued stacks once, afterwards the queue store keeps the counts up to date
+        reference_folders = tq.get_reference_folders(self.settings)
+        reference_files = [
+            typ_dict[key][name]
+            for key in typ_dict
+            for name in ('save_file', 'list_file')
+            ]
+        if reference_folders:
+            tq.check_references(queue_references, queue_store, reference_files, reference_folders)
+            queue_store.set_references(queue_references, reference_files, reference_folders)
         queue_com['info'].put('Current settings saved to: {0}'.format(self.settings['set_folder']))
         self.check_queue(queue_com=queue_com)
 
@@ -610,7 +686,7 @@ class ProcessWorker(QObject):
             with open(shared_dict['typ']['Class2d']['feedback_lock_file'], 'r') as read:
                 in_feedback = '1' in read.read()
 
-            if in_feedback and shared_dict['queue']['Select2d'].empty() and shared_dict['queue']['Train2d'].empty():
+            if in_feedback and not feeder.counts.get('Select2d') and not feeder.counts.get('Train2d'):
                 with open(shared_dict['typ']['Class2d']['feedback_lock_file'], 'w') as write:
                     write.write('0')
         except FileNotFoundError:
@@ -751,8 +827,12 @@ class ProcessWorker(QObject):
             while True:
                 try:
                     self.check_queue(queue_com=queue_com)
+                    self.write_metrics(shared_dict)
                 except BrokenPipeError:
                     pass
+                if feeder is not None and not feeder.is_alive():
+                    self.report_restart(feeder, restart_start, queue_com)
+                    feeder = None
                 if self.stop:
                     break
                 else:
@@ -760,6 +840,9 @@ class ProcessWorker(QObject):
                 time.sleep(3)
         else:
             self.check_queue(queue_com=queue_com)
+        if feeder is not None:
+            feeder.join()
+            self.report_restart(feeder, restart_start, queue_com)
 
         # Indicate to stop all processes
         for key, settings_content in full_content:
@@ -777,6 +860,8 @@ class ProcessWorker(QObject):
         for _, _, _, thread_obj in thread_list:
             thread_obj.stop.value = True
             thread_obj.abort.value = self.abort
+        for event in wakeup_dict.values():
+            event.set()
 
         for _, name, _, thread_obj in thread_list:
             queue_com['log'].put('Waiting for {0} to finish!'.format(name))
@@ -807,6 +892,27 @@ class ProcessWorker(QObject):
             thread.join()
             del thread_obj
         time.sleep(0.1)
+        data_frame.save_df()
+        fs_health.close()
+        combine_writer.close()
+        queue_com['log'].put(tu.create_log(combine_writer.get_summary()))
+        for out_file, nr_files, nr_missing in combine_writer.regenerated:
+            queue_com['log'].put(tu.create_log('Combine writer: Regenerated', out_file, nr_files, 'missing', nr_missing))
+        for error in combine_writer.errors:
+            queue_com['error'].put('Combine writer: {0}'.format(error))
+        self.check_queue(queue_com=queue_com)
+        self.write_metrics(shared_dict, force=True)
+
+        if reference_folders:
+            differences = tq.check_references(queue_references, queue_store, reference_files, reference_folders, repair=False)
+            for key, (tracked, counted) in sorted(differences.items()):
+                queue_com['log'].put(tu.create_log('Queue references differ', key, tracked, counted))
+            self.check_queue(queue_com=queue_com)
+
+        # Write the Queue_* text files
+        for key in shared_dict['typ']:
+            for name in ('save_file', 'done_file', 'list_file'):
+                queue_store.export(shared_dict['typ'][key][name])
 
         for key, size, typ in final_sizes:
             self.sig_status.emit(
@@ -817,6 +923,34 @@ class ProcessWorker(QObject):
                 )
         time.sleep(1)
 
+    def write_metrics(self, shared_dict, force=False):
+        """
+        Export the per stage metrics, if the metrics interval is over.
+
+        Arguments:
+        shared_dict - Shared dictionary
+        force - Export independent of the interval
+
+        Return:
+        None
+        """
+        if not self.metrics_interval:
+            return
+        elif not force and time.time() - self.metrics_collector.last_export < self.metrics_interval:
+            return
+
+        queue_depths = {}
+        running = {}
+        for key in shared_dict['typ']:
+            queue_depths[key] = shared_dict['queue'][key].qsize()
+            running[key] = shared_dict['typ'][key]['running']
+        self.metrics_collector.export(
+            self.settings['log_folder'],
+            self.log_writer,
+            queue_depths,
+            running,
+            )
+
     @staticmethod
     def run_in_parallel(thread_obj):
         thread_obj.run()
@@ -1009,13 +1143,19 @@ class ProcessWorker(QObject):
                 elif key == 'info':
                     error = queue_com['info'].get()
                     self.sig_error.emit(error)
+                elif key == 'metrics':
+                    item = self.metrics_collector.add_event(queue_com['metrics'].get())
+                    if item is not None:
+                        self.log_writer.write(
+                            os.path.join(self.settings['log_folder'], 'metrics_items.jsonl'),
+                            '{0}\n'.format(json.dumps(item))
+                            )
                 elif key == 'log':
                     log = queue_com['log'].get()
-                    try:
-                        with open(os.path.join(self.settings['log_folder'], 'sys_log.txt'), 'a+') as write:
-                            write.write('{0}\n'.format(log))
-                    except FileNotFoundError:
-                        pass
+                    self.log_writer.write(
+                        os.path.join(self.settings['log_folder'], 'sys_log.txt'),
+                        '{0}\n'.format(log)
+                        )
                 else:
                     print(
                         'Processworker - check_queue:',
@@ -1048,13 +1188,64 @@ class ProcessWorker(QObject):
                 write.write('')
         return dictionary
 
-    def prefill_queue(self, shared_dict, entry, restart_dict, keep_list):
+    @staticmethod
+    def report_restart(feeder, restart_start, queue_com):
+        """
+        Report the time until all queues are filled.
+
+        Arguments:
+        feeder - Finished QueueFeeder
+        restart_start - Start time of the queue preparation
+        queue_com - Queue communication dictionary
+
+        Return:
+        None
+        """
+        message = 'Restart: {0} filled after {1:.2f} sec'.format(
+            feeder.get_summary(),
+            feeder.end_time - restart_start,
+            )
+        queue_com['log'].put(tu.create_log(message))
+        if feeder.error is not None:
+            queue_com['error'].put('Restart: Filling the queues failed: {0}\nThe remaining entries are used on the next continue.'.format(feeder.error))
+        elif feeder.fed:
+            queue_com['info'].put(message)
+
+    def reset_find_index(self, shared_dict, entry, check_state):
+        """
+        Remove the index of the found files, if the queue of the Find process
+        is restarted or the queues it fills are empty. Files in the index are
+        not found again. The queue folder with the index is already copied to
+        the restart backup folder.
+
+        Arguments:
+        shared_dict - Shared dictionary
+        entry - Find process information
+        check_state - Restart state of the Find process
+
+        Return:
+        None
+        """
+        queue_store = shared_dict['queue_store']
+        if check_state not in (1, 2):
+            for aim in entry['aim']:
+                shared_dict_aim = shared_dict['typ'][aim.split(':')[-1]]
+                for name in ('save_file', 'list_file', 'done_file'):
+                    if queue_store.count(shared_dict_aim[name]):
+                        return
+        try:
+            os.remove(tfind.get_index_file(self.settings['queue_folder']))
+        except FileNotFoundError:
+            pass
+
+    def prefill_queue(self, shared_dict, entry, restart_dict, keep_list, feeder):
         """
         Prefill the queues for continue mode
 
         Arguments:
         shared_dict - Shared dictionary
         entry - Name of the queue process
+        feeder - QueueFeeder that fills the queues
 
         Return:
         None
@@ -1071,6 +1262,8 @@ class ProcessWorker(QObject):
         share_list = shared_dict['share'][share]
         queue = shared_dict['queue'][key]
         queue_list = shared_dict_typ['queue_list']
+        queue_store = shared_dict['queue_store']
+        wakeup = shared_dict['wakeup'][key]
 
         if self.settings["Input"]["Software"] == "Just Stack":
             self.settings['copy_software_meta'] = False
@@ -1081,6 +1274,9 @@ class ProcessWorker(QObject):
         except KeyError:
             pass
 
+        if key == 'Find':
+            self.reset_find_index(shared_dict, entry, check_state)
+
         prepend_list = []
         if key.startswith('Copy_to'):
             for root, _, files in os.walk(self.settings['set_folder']):
@@ -1131,12 +1327,7 @@ class ProcessWorker(QObject):
             lines = []
             if check_state == 2 or key in special_cases:
                 for entry in (save_file, done_file):
-                    if os.path.exists(entry):
-                        with open(entry, 'r') as read:
-                            lines.extend([line.strip() for line in read.readlines() if line.strip()])
-                    else:
-                        with open(entry, 'w'):
-                            pass
+                    lines.extend(queue_store.read(entry))
 
             remove_patterns = []
             if check_state in (1, 2) and key == 'CTF':
@@ -1187,87 +1378,47 @@ class ProcessWorker(QObject):
                         '.*\.hdf'
                         ]
 
-            for pattern in remove_patterns:
-                lines = sorted([entry for entry in lines if re.search(pattern, entry) is None])
+            lines = trestart.remove_lines(lines, remove_patterns)
 
-            with open(save_file, 'w') as write:
-                write.write('\n'.join(sorted(lines)) + '\n')
-            for line in lines:
-                share_list.append(line.split('|||')[-1])
-                queue.put(line)
+            queue_store.write(save_file, sorted(lines))
+            share_list.extend([line.split('|||')[-1] for line in lines])
+            feeder.add(key, queue, lines, wakeup)
 
-            with open(done_file, 'w'):
-                pass
-            with open(list_file, 'w'):
-                pass
+            queue_store.write(done_file, [])
+            queue_store.write(list_file, [])
 
         elif check_state == 0:
             try:
                 keep_list.append(os.path.basename(self.settings['{}_folder_feedback_0'.format(key.lower())]))
             except KeyError:
                 pass
-            if os.path.exists(save_file):
-                with open(save_file, 'r') as read:
-                    lines = [line.strip() for line in read.readlines() if line.strip()]
-
+            lines = queue_store.read(save_file)
+            if lines:
                 if key.startswith('Copy_to'):
-                    if '000_Feedback_results' in keep_list:
-                        keep_feedback = True
-                    else:
-                        keep_feedback = False
+                    lines = trestart.filter_copy_lines(
+                        lines,
+                        self.settings['project_folder'],
+                        keep_list,
+                        bool('000_Feedback_results' in keep_list),
+                        )
+                    queue_store.write(save_file, lines)
 
-                    good_lines = []
-                    for line in lines:
-                        if os.path.dirname(line) == self.settings['project_folder']:
-                            good_lines.append(line)
-                        else:
-                            for entry in keep_list:
-                                if entry in line:
-                                    if '000_Feedback_results' in line and not keep_feedback:
-                                        pass
-                                    else:
-                                        good_lines.append(line)
-                    lines = [entry for entry in np.unique(good_lines) if os.path.exists(entry)]
-                    with open(save_file, 'w') as write:
-                        write.write('\n'.join(lines) + '\n')
-
-                for line in lines:
-                    if self.settings['software_meta_tar'] in line:
-                        self.settings['copy_software_meta'] = False
-                    else:
-                        pass
-                    share_list.append(line.split('|||')[-1])
-                    queue.put(line)
+                if any(self.settings['software_meta_tar'] in line for line in lines):
+                    self.settings['copy_software_meta'] = False
+                share_list.extend([line.split('|||')[-1] for line in lines])
+                feeder.add(key, queue, lines, wakeup)
             else:
-                with open(save_file, 'w'):
-                    pass
+                queue_store.create(save_file)
 
-            if os.path.exists(done_file):
-                with open(done_file, 'r') as read:
-                    lines = [line.strip() for line in read.readlines() if line.strip()]
-                    shared_dict_typ['file_number'] = len(lines)
-                for line in lines:
-                    if self.settings['software_meta_tar'] in line:
-                        self.settings['copy_software_meta'] = False
-                    else:
-                        pass
-            else:
-                with open(done_file, 'w'):
-                    pass
+            lines = queue_store.read(done_file)
+            shared_dict_typ['file_number'] = len(lines)
+            if any(self.settings['software_meta_tar'] in line for line in lines):
+                self.settings['copy_software_meta'] = False
 
-            if os.path.exists(list_file):
-                with open(list_file, 'r') as read:
-                    lines = [line.strip() for line in read.readlines() if line.strip()]
-                for line in lines:
-                    if line:
-                        queue_list.append(line)
-                    if self.settings['software_meta_tar'] in line:
-                        self.settings['copy_software_meta'] = False
-                    else:
-                        pass
-            else:
-                with open(list_file, 'w'):
-                    pass
+            lines = queue_store.read(list_file)
+            queue_list.extend(lines)
+            if any(self.settings['software_meta_tar'] in line for line in lines):
+                self.settings['copy_software_meta'] = False
 
             # Tar index
             if not queue_list:
@@ -1287,10 +1438,8 @@ class ProcessWorker(QObject):
 
 
         if prepend_list:
-            with open(save_file, 'a') as append:
-                append.write('\n'.join(prepend_list) + '\n')
-            for entry in prepend_list:
-                share_list.append(entry.split('|||')[-1])
-                queue.put(entry)
+            queue_store.append(save_file, prepend_list, allow_dublicate=True)
+            share_list.extend([entry.split('|||')[-1] for entry in prepend_list])
+            feeder.add(key, queue, prepend_list, wakeup)
 
 from .processthread import ProcessThread
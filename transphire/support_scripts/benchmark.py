@@ -0,0 +1,1992 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    Micro benchmarks for the TranSPHIRE internals.
+    Usage: python -m transphire.support_scripts.benchmark <benchmark> [options]
+"""
+import argparse
+import glob
+import multiprocessing as mp
+import multiprocessing.managers
+import os
+import queue
+import shutil
+import struct
+import subprocess
+import tempfile
+import time
+
+
+def print_result(name, value, unit):
+    print('{0:<40s} {1:>14.4f} {2}'.format(name, value, unit))
+
+
+def benchmark_queue_store(args):
+    """
+    Compare the Text and SQLite queue stores for a typical Find -> Import flow.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_queue as tq
+
+    entries = [
+        '{0}|||/data/movies/Movie_{0:06d}.tiff|||0'.format(idx)
+        for idx in range(args.number)
+        ]
+    for backend in ('Text', 'SQLite'):
+        queue_folder = tempfile.mkdtemp(dir=args.folder)
+        try:
+            store = tq.get_queue_store(backend, queue_folder)
+            save_file = os.path.join(queue_folder, 'Queue_Import')
+            done_file = os.path.join(queue_folder, 'Queue_Import_done')
+            list_file = os.path.join(queue_folder, 'Queue_Import_list')
+
+            start = time.time()
+            for entry in entries:
+                store.append(save_file, [entry])
+            print_result('{0} append'.format(backend), (time.time() - start) / args.number * 1e6, 'us/entry')
+
+            start = time.time()
+            for entry in entries:
+                store.contains(
+                    [save_file, list_file, done_file],
+                    os.path.basename(entry.split('|||')[1])
+                    )
+            print_result('{0} membership'.format(backend), (time.time() - start) / args.number * 1e6, 'us/entry')
+
+            start = time.time()
+            for entry in entries:
+                store.move(entry, save_file, done_file)
+            print_result('{0} save -> done'.format(backend), (time.time() - start) / args.number * 1e6, 'us/entry')
+
+            start = time.time()
+            store.export(done_file)
+            print_result('{0} export'.format(backend), (time.time() - start) * 1e3, 'ms')
+
+            assert store.count(done_file) == args.number
+            assert store.count(save_file) == 0
+        finally:
+            shutil.rmtree(queue_folder)
+
+
+class LifoManager(multiprocessing.managers.BaseManager):
+    pass
+LifoManager.register('LifoQueue', queue.LifoQueue)
+
+
+def scheduler_stage(scheduler, poll_time, work_time, in_queue, in_event, out_queue, out_event, stop):
+    """
+    Consumer loop of a single pipeline stage.
+    Mirrors ProcessThread.start_queue/wait_for_work with a fixed processing time.
+    """
+    while not stop.value:
+        try:
+            entry = in_queue.get(block=False)
+        except queue.Empty:
+            if scheduler == 'Event':
+                if in_event.wait(poll_time):
+                    in_event.clear()
+            else:
+                time.sleep(poll_time)
+            continue
+        time.sleep(work_time)
+        out_queue.put(entry, block=False)
+        if out_event is not None:
+            out_event.set()
+
+
+def scheduler_find(number, interval, start_delay, out_queue, out_event):
+    """
+    Find stage: Add a new movie to the Import queue every interval seconds.
+    """
+    time.sleep(start_delay)
+    for _ in range(number):
+        out_queue.put(time.time(), block=False)
+        out_event.set()
+        time.sleep(interval)
+
+
+def benchmark_scheduler(args):
+    """
+    Measure the end-to-end latency per movie across Find -> Import -> Motion -> CTF
+    for the Poll and Event scheduler.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    stages = ['Import', 'Motion', 'CTF']
+    for scheduler in ('Poll', 'Event'):
+        manager = LifoManager()
+        manager.start()
+        try:
+            queues = [manager.LifoQueue() for _ in range(len(stages) + 1)]
+            events = [mp.Event() for _ in range(len(stages) + 1)]
+            stop = mp.Value('i', 0)
+            process_list = []
+            for idx in range(len(stages)):
+                process = mp.Process(
+                    target=scheduler_stage,
+                    args=(
+                        scheduler,
+                        args.poll,
+                        args.work,
+                        queues[idx],
+                        events[idx],
+                        queues[idx + 1],
+                        events[idx + 1],
+                        stop,
+                        )
+                    )
+                process.start()
+                process_list.append(process)
+
+            process = mp.Process(
+                target=scheduler_find,
+                args=(args.number, args.interval, args.poll, queues[0], events[0])
+                )
+            process.start()
+            process_list.append(process)
+
+            latencies = []
+            while len(latencies) < args.number:
+                try:
+                    start = queues[-1].get(block=False)
+                except queue.Empty:
+                    events[-1].wait(0.01)
+                    events[-1].clear()
+                else:
+                    latencies.append(time.time() - start)
+
+            stop.value = True
+            for event in events:
+                event.set()
+            for process in process_list:
+                process.join()
+        finally:
+            manager.shutdown()
+
+        latencies = sorted(latencies)
+        print_result('{0} mean latency'.format(scheduler), sum(latencies) / len(latencies), 's/movie')
+        print_result('{0} max latency'.format(scheduler), latencies[-1], 's/movie')
+        print_result(
+            '{0} scheduling overhead'.format(scheduler),
+            sum(latencies) / len(latencies) - len(stages) * args.work,
+            's/movie'
+            )
+
+
+def shared_state_worker(typ_dict, number, start_event):
+    """
+    Typical access pattern of a ProcessThread on its shared_dict['typ'] entry.
+    """
+    start_event.wait()
+    for _ in range(number):
+        typ_dict['queue_lock'].acquire()
+        try:
+            typ_dict['running'] += 1
+            typ_dict['file_number'] = typ_dict['file_number'] + 1
+            typ_dict['running'] -= 1
+        finally:
+            typ_dict['queue_lock'].release()
+        typ_dict['is_error']
+        typ_dict['save_file']
+
+
+def benchmark_shared_state(args):
+    """
+    Compare the access cost of mp.Manager proxies and the SharedDict for many workers.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_shared as tsh
+
+    manager = mp.Manager()
+    try:
+        for backend in ('Manager', 'SharedDict'):
+            if backend == 'Manager':
+                lock = manager.Lock()
+                create = manager.dict
+            else:
+                lock = mp.Lock()
+                create = tsh.SharedDict
+            typ_dict = create({
+                'file_number': 0,
+                'running': 0,
+                'is_error': False,
+                'queue_lock': lock,
+                'save_file': 'Queue_Motion',
+                })
+
+            start_event = mp.Event()
+            process_list = [
+                mp.Process(target=shared_state_worker, args=(typ_dict, args.number, start_event))
+                for _ in range(args.workers)
+                ]
+            for process in process_list:
+                process.start()
+            start = time.time()
+            start_event.set()
+            for process in process_list:
+                process.join()
+            duration = time.time() - start
+
+            assert typ_dict['file_number'] == args.workers * args.number, typ_dict['file_number']
+            print_result('{0} total'.format(backend), duration, 's')
+            print_result(
+                '{0} per access'.format(backend),
+                duration / (args.workers * args.number * 10) * 1e6,
+                'us'
+                )
+    finally:
+        manager.shutdown()
+
+
+def write_mrc_header(file_name, x_dim, y_dim, z_dim):
+    """
+    Write a synthetic MRC file containing only the 1024 byte header.
+    """
+    header = bytearray(1024)
+    struct.pack_into('<4i', header, 0, x_dim, y_dim, z_dim, 2)
+    header[208:212] = b'MAP '
+    header[212:214] = b'\x44\x44'
+    with open(file_name, 'wb') as write:
+        write.write(header)
+
+
+def write_tiff_header(file_name, x_dim, y_dim, z_dim, compression=5):
+    """
+    Write a synthetic little endian TIFF file with z_dim IFDs and without image data.
+    LZW compression (5) by default, EER uses 65000/65001.
+    """
+    entries = [
+        (256, 4, 1, x_dim),
+        (257, 4, 1, y_dim),
+        (258, 3, 1, 8),
+        (259, 3, 1, compression),
+        (273, 4, 1, 0),
+        (278, 4, 1, y_dim),
+        (279, 4, 1, 0),
+        ]
+    ifd_size = 2 + 12 * len(entries) + 4
+    data = bytearray(b'II*\x00')
+    data += struct.pack('<I', 8)
+    for idx in range(z_dim):
+        offset = 8 + idx * ifd_size
+        data += struct.pack('<H', len(entries))
+        for tag, typ, count, value in entries:
+            if typ == 3:
+                data += struct.pack('<HHIHH', tag, typ, count, value, 0)
+            else:
+                data += struct.pack('<HHII', tag, typ, count, value)
+        if idx == z_dim - 1:
+            data += struct.pack('<I', 0)
+        else:
+            data += struct.pack('<I', offset + ifd_size)
+    with open(file_name, 'wb') as write:
+        write.write(data)
+
+
+def benchmark_header(args):
+    """
+    Compare the native header reader with the IMOD header program on synthetic files.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_header as th
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        file_names = []
+        for idx in range(args.number):
+            if idx % 3 == 0:
+                file_name = os.path.join(folder, 'Movie_{0:06d}.mrc'.format(idx))
+                write_mrc_header(file_name, 4096, 4096, args.frames)
+            elif idx % 3 == 1:
+                file_name = os.path.join(folder, 'Movie_{0:06d}.tiff'.format(idx))
+                write_tiff_header(file_name, 4096, 4096, args.frames)
+            else:
+                file_name = os.path.join(folder, 'Movie_{0:06d}.eer'.format(idx))
+                write_tiff_header(file_name, 4096, 4096, args.frames * 20, compression=65001)
+            file_names.append(file_name)
+
+        start = time.time()
+        for file_name in file_names:
+            th.read_header(file_name)
+        print_result('Native uncached', (time.time() - start) / args.number * 1e6, 'us/file')
+
+        start = time.time()
+        for file_name in file_names:
+            th.read_header(file_name)
+        print_result('Native cached', (time.time() - start) / args.number * 1e6, 'us/file')
+
+        if shutil.which(args.imod_header) is not None:
+            number = min(args.number, 100)
+            start = time.time()
+            for file_name in file_names[:number]:
+                subprocess.check_output(
+                    "{0} '{1}'".format(args.imod_header, file_name),
+                    shell=True,
+                    encoding='utf-8'
+                    )
+            print_result('IMOD header', (time.time() - start) / number * 1e6, 'us/file')
+        else:
+            print('IMOD header not found: {0}'.format(args.imod_header))
+    finally:
+        shutil.rmtree(folder)
+
+
+def benchmark_translation(args):
+    """
+    Compare np.genfromtxt lookups in the translation file with the TranslationIndex
+    and check that both report the same names.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_translation as ttrans
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        file_name = os.path.join(folder, 'Valid_micrographs_info.txt')
+        file_name_bad = os.path.join(folder, 'Discarded_micrographs_info.txt')
+        journal_file = os.path.join(folder, 'Translation_journal.txt')
+        header = '\n'.join([
+            '',
+            'data_transphire',
+            '',
+            'loop_',
+            '_pipeRootName #1',
+            '_pipeNewName #2',
+            '_pipeHoleNumber #3',
+            ]) + '\n'
+        with open(file_name, 'w') as write:
+            write.write(header)
+            for idx in range(args.number):
+                write.write('FoilHole_{0}_Data_{0}_{0}_20200101_{0:06d}  Mic_{0:06d}  {0}\n'.format(idx))
+        with open(file_name_bad, 'w') as write:
+            write.write(header)
+
+        names = ['FoilHole_{0}_Data_{0}_{0}_20200101_{0:06d}'.format(idx) for idx in range(0, args.number * 2, 2)]
+        names.extend(['data_transphire', 'loop_', '_pipeRootName', '#1'])
+
+        index = ttrans.TranslationIndex([file_name, file_name_bad], journal_file)
+        start = time.time()
+        index.load()
+        index_result = [index.contains(name) for name in names]
+        print_result('TranslationIndex', (time.time() - start) / len(names) * 1e6, 'us/lookup')
+
+        start = time.time()
+        for idx in range(args.number):
+            index.add('New_{0}'.format(idx))
+        print_result('TranslationIndex append', (time.time() - start) / args.number * 1e6, 'us/append')
+
+        try:
+            import numpy as np
+        except ImportError:
+            print('numpy not available: Skip np.genfromtxt comparison')
+            return
+
+        names_check = names[:200] + names[-4:]
+        start = time.time()
+        genfromtxt_result = []
+        for name in names_check:
+            genfromtxt_result.append(bool([
+                entry
+                for entry in (file_name, file_name_bad)
+                if name in np.genfromtxt(entry, usecols=0, dtype=str)
+                ]))
+        print_result('np.genfromtxt', (time.time() - start) / len(names_check) * 1e6, 'us/lookup')
+        assert genfromtxt_result == index_result[:200] + index_result[-4:]
+        print('Identical results for {0} names'.format(len(names_check)))
+    finally:
+        shutil.rmtree(folder)
+
+
+def write_ctffind_file(file_name, idx):
+    with open(file_name, 'w') as write:
+        write.write('# Output from CTFFind version 4.1.14, run on 2020-01-01 00:00:00\n')
+        write.write('# Input file: /data/Movie_{0:06d}.mrc ; Number of micrographs: 1\n'.format(idx))
+        write.write('# Pixel size: 1.000 Angstroms ; acceleration voltage: 300.0 keV ; spherical aberration: 2.70 mm ; amplitude contrast: 0.10\n')
+        write.write('# Columns: #1 - micrograph number; #2 - defocus 1 [Angstroms]; #3 - defocus 2; #4 - azimuth of astigmatism; #5 - additional phase shift [radians]; #6 - cross correlation; #7 - spacing (in Angstroms) up to which CTF rings were fit successfully\n')
+        write.write('1.000000 {0:.6f} {1:.6f} 45.000000 0.000000 0.050000 4.000000\n'.format(10000 + idx, 10100 + idx))
+
+
+def parse_ctffind_file(file_name):
+    with open(file_name, 'r') as read:
+        lines = read.readlines()
+    input_name = lines[1].split(':', 1)[1].split(';')[0].strip()
+    return input_name, [float(entry) for entry in lines[-1].split()]
+
+
+def benchmark_import_cache(args):
+    """
+    Import time of a growing session with and without the persistent parse cache.
+    Every round adds new files, like the plot worker sees it during a session.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_cache as tcache
+
+    try:
+        from .. import transphire_import as ti
+    except ImportError:
+        ti = None
+        parse_function = parse_ctffind_file
+        print('transphire_import not available: Use a pure python CTFFIND parser')
+    else:
+        dtype_import = ti.get_dtype_import_dict()['CTFFIND4 >=v4.1.8']
+        parse_function = lambda file_name: ti.read_ctffind_data(file_name, dtype_import)
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        cache_file = os.path.join(folder, '.benchmark_cache.pkl')
+        size = 0
+        for target_size in sorted(args.sizes):
+            while size < target_size:
+                write_ctffind_file(os.path.join(folder, 'Movie_{0:06d}.txt'.format(size)), size)
+                size += 1
+            file_names = sorted(glob.glob(os.path.join(folder, '*.txt')))
+
+            start = time.time()
+            result_plain = [parse_function(file_name) for file_name in file_names]
+            time_plain = time.time() - start
+
+            start = time.time()
+            cache = tcache.ParseCache(cache_file)
+            result_cache = [cache.get(file_name, parse_function) for file_name in file_names]
+            cache.save()
+            time_cache = time.time() - start
+            misses = cache.misses
+
+            start = time.time()
+            cache = tcache.ParseCache(cache_file)
+            result_warm = [cache.get(file_name, parse_function) for file_name in file_names]
+            cache.save()
+            time_warm = time.time() - start
+
+            assert [entry[1] for entry in result_plain] == [entry[1] for entry in result_cache] == [entry[1] for entry in result_warm]
+            print('Session size {0}: {1} new files parsed'.format(size, misses))
+            print_result('  No cache', time_plain * 1e3, 'ms/round')
+            print_result('  Cache with new files', time_cache * 1e3, 'ms/round')
+            print_result('  Cache unchanged', time_warm * 1e3, 'ms/round')
+            print_result('  Side file size', os.path.getsize(cache_file) / 1024, 'kB')
+
+        if ti is not None:
+            start = time.time()
+            ti.import_ctffind_v4_1_8('CTFFIND4 >=v4.1.8', 'CTFFIND4 >=v4.1.8', None, folder)
+            print_result('import_ctffind_v4_1_8 cold', (time.time() - start) * 1e3, 'ms')
+            start = time.time()
+            ti.import_ctffind_v4_1_8('CTFFIND4 >=v4.1.8', 'CTFFIND4 >=v4.1.8', None, folder)
+            print_result('import_ctffind_v4_1_8 warm', (time.time() - start) * 1e3, 'ms')
+    finally:
+        shutil.rmtree(folder)
+
+
+def create_preview_full(file_name, bin_shape=512, tile_shape=512):
+    """
+    Preview calculation with the full micrograph in memory, like create_jpg_file before.
+    """
+    import numpy as np
+    import mrcfile as mrc
+
+    with mrc.open(file_name) as mrc_file:
+        input_data = mrc_file.data
+    if len(input_data.shape) == 3:
+        input_data = np.sum(input_data, axis=0) / input_data.shape[0]
+    input_data = input_data - np.mean(input_data)
+
+    idx = 1
+    while np.max(input_data.shape) >= idx * 4096:
+        idx += 1
+    original_shape = idx * 4096
+    ratio = original_shape // bin_shape
+    pad_x = original_shape - input_data.shape[0]
+    pad_y = original_shape - input_data.shape[1]
+    input_data = np.pad(input_data, ((0, pad_x), (0, pad_y)), mode='median')
+    binned = input_data.reshape(bin_shape, ratio, bin_shape, ratio).mean(-1).mean(1)
+    binned = binned[:-int(1+pad_x//ratio), :-int(1+pad_y//ratio)]
+
+    tile_images = []
+    for x_val in range(original_shape // tile_shape):
+        for y_val in range(original_shape // tile_shape):
+            slices = (
+                slice(x_val*tile_shape, (x_val+1)*tile_shape, 1),
+                slice(y_val*tile_shape, (y_val+1)*tile_shape, 1),
+                )
+            tile_images.append(np.abs(np.fft.fftshift(np.fft.fft2(input_data[slices])))**2)
+    spectrum = np.sum(np.array(tile_images) / len(tile_images), axis=0)
+    return binned, spectrum
+
+
+def benchmark_preview(args):
+    """
+    Time and peak memory of the full in memory preview and the streaming preview.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import tracemalloc
+    import numpy as np
+    import mrcfile as mrc
+    from .. import transphire_preview as tp
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        file_name = os.path.join(folder, 'Synthetic.mrc')
+        shape = (args.frames, args.rows, args.columns) if args.frames > 1 else (args.rows, args.columns)
+        with mrc.new_mmap(file_name, shape=shape, mrc_mode=2) as mrc_file:
+            random = np.random.default_rng(0)
+            for start in range(0, args.rows, 512):
+                block = random.normal(size=(min(512, args.rows - start), args.columns)).astype(np.float32)
+                if args.frames > 1:
+                    mrc_file.data[:, start:start + 512] = block
+                else:
+                    mrc_file.data[start:start + 512] = block
+        print('Synthetic image {0}: {1:.1f} MB'.format('x'.join([str(entry) for entry in shape]), os.path.getsize(file_name) / 1024**2))
+
+        results = []
+        for name, function in (('Full image', create_preview_full), ('Streaming', tp.create_preview)):
+            tracemalloc.start()
+            start = time.time()
+            results.append(function(file_name))
+            duration = time.time() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print_result('{0} time'.format(name), duration, 's')
+            print_result('{0} peak memory'.format(name), peak / 1024**2, 'MB')
+
+        (binned_full, spectrum_full), (binned_stream, spectrum_stream) = results
+        print_result('Max relative difference binned', np.max(np.abs(binned_full - binned_stream)) / np.max(np.abs(binned_full)), '')
+        print_result('Max relative difference spectrum', np.max(np.abs(spectrum_full - spectrum_stream)) / np.max(spectrum_full), '')
+    finally:
+        shutil.rmtree(folder)
+
+
+def normalize_image_loop(data, apix=1.0, min_res=30):
+    """
+    Power spectrum normalization with the mask built in a python loop, like normalize_image before.
+    """
+    import numpy as np
+
+    box_x = data.shape[0]
+    box_x_half = box_x / 2
+    box_y = data.shape[1]
+    box_y_half = box_y / 2
+
+    min_freq = (apix / min_res)**2
+
+    mask = np.ones((data.shape[0], data.shape[1]), dtype=bool)
+    for idx_x in range(mask.shape[0]):
+        for idx_y in range(mask.shape[1]):
+            x = (idx_x - box_x_half) / box_x
+            y = (idx_y - box_y_half) / box_y
+            radius = x**2+y**2
+            if radius < min_freq:
+                mask[idx_x, idx_y] = 0
+    data[~mask] = np.median(data[mask])
+    return np.sqrt(data)
+
+
+def benchmark_normalize(args):
+    """
+    Compare the vectorized normalize_image with the python loop version and time rebin
+    for typical detector sizes.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import numpy as np
+    from .. import transphire_utils as tu
+
+    random = np.random.default_rng(0)
+    for size in args.sizes:
+        data = random.random((size, size))
+        tu.FREQUENCY_MASK_CACHE.clear()
+        start = time.time()
+        result = tu.normalize_image(data.copy(), apix=args.apix, real=False)
+        print_result('normalize_image {0} first call'.format(size), (time.time() - start) * 1e3, 'ms')
+        start = time.time()
+        tu.normalize_image(data.copy(), apix=args.apix, real=False)
+        print_result('normalize_image {0} cached mask'.format(size), (time.time() - start) * 1e3, 'ms')
+        if size <= args.max_loop:
+            start = time.time()
+            result_loop = normalize_image_loop(data.copy(), apix=args.apix)
+            print_result('normalize_image {0} python loop'.format(size), (time.time() - start) * 1e3, 'ms')
+            assert result.tobytes() == result_loop.tobytes()
+            print('Bit identical output for {0}x{0}'.format(size))
+
+    for size in (4096, 8192, 12288):
+        data = random.random((size, size), dtype=np.float32)
+        start = time.time()
+        tu.rebin(data, (512, 512))
+        print_result('rebin {0} -> 512'.format(size), (time.time() - start) * 1e3, 'ms')
+
+
+def gpu_spin_locks():
+    """
+    GPU locks like the spin waiting run_command before.
+    """
+    return dict([
+        ('{0}_{1}'.format(idx, idx_2), [mp.RLock(), mp.Value('i', 0)])
+        if idx_2 != -1
+        else
+        (str(idx), [mp.RLock(), mp.Value('i', 0)])
+        for idx in range(4)
+        for idx_2 in range(-1, 4)
+        ])
+
+
+def gpu_spin_acquire(locks, gpu_list):
+    gpu_list = [(entry.split('_')[0], entry) for entry in sorted(gpu_list)]
+    for main, entry in gpu_list:
+        if '_' in entry:
+            locks[main][0].acquire()
+        locks[entry][0].acquire()
+    for main, entry in gpu_list:
+        if '_' in entry:
+            with locks[main][1].get_lock():
+                locks[main][1].value += 1
+            locks[main][0].release()
+        else:
+            while locks[main][1].value != 0:
+                time.sleep(0.05)
+    return gpu_list
+
+
+def gpu_spin_release(locks, gpu_list):
+    for main, entry in gpu_list:
+        if '_' in entry:
+            with locks[main][1].get_lock():
+                locks[main][1].value -= 1
+        locks[entry][0].release()
+
+
+def gpu_worker(method, scheduler, stage, gpu_list, number, job_time, usage, results, violations):
+    import resource
+    from .. import transphire_gpu as tgpu
+
+    waits = []
+    cpu = 0
+    for _ in range(number):
+        start = time.time()
+        start_cpu = resource.getrusage(resource.RUSAGE_SELF)
+        if method == 'Scheduler':
+            request = scheduler.acquire(gpu_list, priority=tgpu.STAGE_PRIORITY.get(stage, 0))
+        else:
+            request = gpu_spin_acquire(scheduler, gpu_list)
+        stop_cpu = resource.getrusage(resource.RUSAGE_SELF)
+        waits.append(time.time() - start)
+        cpu += stop_cpu.ru_utime + stop_cpu.ru_stime - start_cpu.ru_utime - start_cpu.ru_stime
+
+        with usage.get_lock():
+            for entry in gpu_list:
+                gpu = int(entry.split('_')[0])
+                # Exclusive jobs count 100, shared jobs 1
+                usage[gpu] += 1 if '_' in entry else 100
+                if usage[gpu] > 100 and usage[gpu] % 100 != 0 or usage[gpu] >= 200:
+                    violations.value += 1
+        # Mock command
+        subprocess.call(['sleep', str(job_time)])
+        with usage.get_lock():
+            for entry in gpu_list:
+                gpu = int(entry.split('_')[0])
+                usage[gpu] -= 1 if '_' in entry else 100
+
+        if method == 'Scheduler':
+            scheduler.release(request)
+        else:
+            gpu_spin_release(scheduler, request)
+    results.put((stage, waits, cpu))
+
+
+def benchmark_gpu_scheduler(args):
+    """
+    Mixed exclusive and shared jobs on fake GPU ids with the spin waiting locks
+    and the blocking GpuScheduler.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_gpu as tgpu
+
+    # Motion uses whole GPUs, CTF and Picking share split GPUs
+    jobs = [
+        ('Motion', ['0']),
+        ('Motion', ['1']),
+        ('CTF', ['0_0']),
+        ('CTF', ['0_1']),
+        ('Picking', ['1_0']),
+        ('Picking', ['1_1']),
+        ('Class2d', ['0', '1']),
+        ]
+    for method in ('Spin', 'Scheduler'):
+        if method == 'Scheduler':
+            scheduler = tgpu.GpuScheduler(max_gpus=4, max_slots=4)
+        else:
+            scheduler = gpu_spin_locks()
+        usage = mp.Array('i', 4)
+        violations = mp.Value('i', 0)
+        results = mp.Queue()
+        start = time.time()
+        processes = [
+            mp.Process(
+                target=gpu_worker,
+                args=(method, scheduler, stage, gpu_list, args.number, args.job_time, usage, results, violations)
+                )
+            for stage, gpu_list in jobs
+            ]
+        for process in processes:
+            process.start()
+        stage_result = {}
+        for _ in processes:
+            stage, waits, cpu = results.get()
+            stage_result.setdefault(stage, [[], 0])
+            stage_result[stage][0].extend(waits)
+            stage_result[stage][1] += cpu
+        for process in processes:
+            process.join()
+        print('{0}: {1:.2f} s total, {2} violations'.format(method, time.time() - start, violations.value))
+        for stage, (waits, cpu) in sorted(stage_result.items()):
+            print_result('  {0} mean wait'.format(stage), sum(waits) / len(waits), 's')
+            print_result('  {0} max wait'.format(stage), max(waits), 's')
+            print_result('  {0} CPU while waiting'.format(stage), cpu * 1e3, 'ms')
+
+
+def gpu_hold(scheduler, name, gpu_list, priority, delay, hold_time, results):
+    time.sleep(delay)
+    start = time.time()
+    request = scheduler.acquire(gpu_list, priority=priority)
+    results.put((name, time.time() - start))
+    time.sleep(hold_time)
+    scheduler.release(request)
+
+
+def benchmark_gpu_conflicts(args):
+    """
+    Requests of the GpuScheduler that arrive while others are waiting.
+    A request needs to wait only if it conflicts with a higher ranked
+    waiting request. Every job holds its GPUs for hold_time seconds.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_gpu as tgpu
+
+    # Description, capacity, jobs (name, gpu list, priority, delay, granted at once)
+    cases = [
+        ('Free slot next to a waiting shared request', None, [
+            ('m1', ['0_0'], 0, 0, True),
+            ('m2', ['0_0'], 0, 0.1, False),
+            ('Picking', ['0_1'], 0, 0.2, True),
+            ]),
+        ('Waiting exclusive request', None, [
+            ('m1', ['0_0'], 0, 0, True),
+            ('Motion', ['0'], 5, 0.1, False),
+            ('Picking', ['0_1'], 3, 0.2, False),
+            ]),
+        ('Capacity needed by a waiting request', {0: 2}, [
+            ('m1', ['0_0'], 0, 0, True),
+            ('m2', ['0_0', '0_1'], 0, 0.1, False),
+            ('Picking', ['0_2'], 0, 0.2, False),
+            ]),
+        ('Different GPUs', None, [
+            ('m1', ['0'], 0, 0, True),
+            ('m2', ['0'], 0, 0.1, False),
+            ('Motion', ['1'], 0, 0.2, True),
+            ]),
+        ('GPU ids above 16', None, [
+            ('m1', ['17_0'], 0, 0, True),
+            ('m2', ['17_0'], 0, 0.1, False),
+            ('Picking', ['17_1', '40'], 0, 0.2, True),
+            ]),
+        ]
+    for description, capacity, jobs in cases:
+        scheduler = tgpu.GpuScheduler(capacity=capacity)
+        results = mp.Queue()
+        processes = [
+            mp.Process(target=gpu_hold, args=(scheduler, name, gpu_list, priority, delay, args.hold_time, results))
+            for name, gpu_list, priority, delay, _ in jobs
+            ]
+        for process in processes:
+            process.start()
+        waits = dict([results.get() for _ in processes])
+        for process in processes:
+            process.join()
+
+        print(description)
+        for name, gpu_list, _, _, expect_now in jobs:
+            is_now = waits[name] < args.hold_time / 2
+            print('  {0:<8} {1:<12} wait {2:.2f} s, granted at once: {3} ({4})'.format(
+                name,
+                ' '.join(gpu_list),
+                waits[name],
+                is_now,
+                'OK' if is_now == expect_now else 'FAIL',
+                ))
+
+
+def benchmark_sys_log(args):
+    """
+    Write log messages at a high rate with one open and append per message
+    and with the batched LogWriter and compare the written files.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_log as tlog
+
+    messages = [
+        '{0}\tMotion_{1}\tStarting process for Movie_{0:06d}.tiff'.format(idx, idx % 4)
+        for idx in range(args.number)
+        ]
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        for fsync in (False, True):
+            direct_file = os.path.join(folder, 'direct_{0}.txt'.format(fsync))
+            start = time.time()
+            for log in messages:
+                with open(direct_file, 'a+') as write:
+                    write.write('{0}\n'.format(log))
+                    if fsync:
+                        write.flush()
+                        os.fsync(write.fileno())
+            direct_time = time.time() - start
+
+            batch_file = os.path.join(folder, 'batch_{0}.txt'.format(fsync))
+            writer = tlog.LogWriter(max_delay=args.delay, fsync=fsync)
+            start = time.time()
+            for log in messages:
+                writer.write(batch_file, '{0}\n'.format(log))
+            enqueue_time = time.time() - start
+            writer.close()
+            batch_time = time.time() - start
+
+            with open(direct_file, 'rb') as read:
+                direct_content = read.read()
+            with open(batch_file, 'rb') as read:
+                batch_content = read.read()
+
+            print('fsync {0}: {1} messages, identical files: {2}'.format(
+                fsync,
+                args.number,
+                direct_content == batch_content
+                ))
+            print_result('  Open per message', args.number / direct_time, 'messages/s')
+            print_result('  LogWriter enqueue', args.number / enqueue_time, 'messages/s')
+            print_result('  LogWriter incl. final flush', args.number / batch_time, 'messages/s')
+            print_result('  LogWriter file writes', writer.nr_writes, '')
+
+        rotate_file = os.path.join(folder, 'sys_log.txt')
+        writer = tlog.LogWriter(max_records=100, rotate_size=64 * 1024, rotate_count=3)
+        for log in messages:
+            writer.write(rotate_file, '{0}\n'.format(log))
+        writer.close()
+        print('Rotation to 64 kB with 3 old files:')
+        for file_name in sorted(glob.glob('{0}*'.format(rotate_file))):
+            print_result('  {0}'.format(os.path.basename(file_name)), os.path.getsize(file_name) / 1024, 'kB')
+    finally:
+        shutil.rmtree(folder)
+
+
+class NamespaceDataFrame(object):
+    """
+    The former DataFrame: A pandas frame in a manager namespace, pickled for
+    every access and written to the CSV file for every update.
+    """
+
+    def __init__(self, manager, file_path, data_frame):
+        super(NamespaceDataFrame, self).__init__()
+        self.lock = manager.RLock()
+        self.namespace = manager.Namespace()
+        self.namespace.df = data_frame
+        self.file_path = file_path
+
+    def set_values(self, index, value_dict):
+        import pandas as pd
+        with self.lock:
+            data_frame = self.namespace.df
+            if index not in data_frame.index:
+                data_frame = data_frame.reindex(range(5 * (index // 5 + 1)))
+            for column, value in value_dict.items():
+                if column not in data_frame:
+                    data_frame[column] = pd.Series(dtype=object)
+                data_frame.loc[index, column] = value
+            data_frame.to_csv(self.file_path)
+            self.namespace.df = data_frame
+
+    def get_values(self, index, columns):
+        with self.lock:
+            return self.namespace.df.loc[index, list(columns)]
+
+
+def data_frame_worker(data_frame, worker, number, columns, results):
+    waits = []
+    start = time.time()
+    for idx in range(number):
+        row = worker * number + idx
+        value_dict = {column: '{0}_{1}'.format(column, row) for column in columns}
+        step = time.time()
+        data_frame.set_values(row, value_dict)
+        values = data_frame.get_values(row, columns)
+        waits.append(time.time() - step)
+        assert list(values) == list(value_dict.values()), (list(values), value_dict)
+    results.put((time.time() - start, waits))
+
+
+def benchmark_data_frame(args):
+    """
+    Concurrent row updates and reads of the shared DataFrame by several
+    processes with a filled table of a long session.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import pandas as pd
+    from .. import transphire_dataframe as tdf
+
+    columns = ['column_{0}'.format(idx) for idx in range(args.columns)]
+    filled = pd.DataFrame(
+        [['{0}_{1}'.format(column, row) for column in columns] for row in range(args.rows)],
+        index=range(args.rows),
+        columns=columns,
+        dtype=object,
+        )
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        for method in ('Namespace', 'Shared'):
+            file_path = os.path.join(folder, '{0}.csv'.format(method))
+            if method == 'Namespace':
+                manager = mp.Manager()
+                data_frame = NamespaceDataFrame(manager, file_path, filled.copy())
+            else:
+                data_frame = tdf.DataFrame(file_path)
+                data_frame.set_df(filled.copy())
+            offset = args.rows // args.number + 1
+            results = mp.Queue()
+            start = time.time()
+            processes = [
+                mp.Process(
+                    target=data_frame_worker,
+                    args=(data_frame, offset + worker, args.number, columns, results)
+                    )
+                for worker in range(args.workers)
+                ]
+            for process in processes:
+                process.start()
+            waits = []
+            for _ in processes:
+                waits.extend(results.get()[1])
+            for process in processes:
+                process.join()
+            total_time = time.time() - start
+            waits.sort()
+
+            print('{0}: {1} workers, {2} updates each, {3} rows filled'.format(
+                method,
+                args.workers,
+                args.number,
+                args.rows
+                ))
+            print_result('  Throughput', len(waits) / total_time, 'updates/s')
+            print_result('  Median update + read', waits[len(waits) // 2] * 1e3, 'ms')
+            print_result('  Max update + read', waits[-1] * 1e3, 'ms')
+            if method == 'Namespace':
+                manager.shutdown()
+            else:
+                data_frame.save_df()
+                result = pd.read_csv(file_path, index_col=0, dtype=object)
+                print('  CSV complete after compaction: {0}'.format(
+                    bool(result.notna().sum().sum() == (args.rows + args.workers * args.number) * len(columns))
+                    ))
+    finally:
+        shutil.rmtree(folder)
+
+
+def transfer_old_hash(file_in, chunksize=1024**2):
+    length = 0
+    hashes = []
+    with open(file_in, 'rb') as read:
+        while True:
+            data = read.read(chunksize)
+            if not data:
+                break
+            else:
+                length += len(data)
+                hashes.append(hash(data))
+    return length, hash(tuple(hashes))
+
+
+def transfer_old_copy(file_in, file_out):
+    len_data_in, checksum_in = transfer_old_hash(file_in)
+    shutil.copy2(file_in, file_out)
+    len_data_out, checksum_out = transfer_old_hash(file_out)
+    assert (len_data_in, checksum_in) == (len_data_out, checksum_out)
+    return len_data_in, 0
+
+
+def transfer_worker(method, workers, jobs, results):
+    import resource
+    from .. import transphire_transfer as ttransfer
+
+    start = time.time()
+    if method == 'Old':
+        for job in jobs:
+            transfer_old_copy(*job)
+    else:
+        engine = ttransfer.TransferEngine(max_workers=workers)
+        engine.run_parallel(engine.copy, jobs)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    results.put((time.time() - start, usage.ru_utime + usage.ru_stime))
+
+
+def benchmark_transfer(args):
+    """
+    Copy the same files to several destinations at the same time like the
+    Copy_to_work/backup/hdd processes with the old hash + shutil copy and the
+    TransferEngine.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        source = os.path.join(folder, 'source')
+        os.mkdir(source)
+        file_names = []
+        for idx in range(args.number):
+            file_name = os.path.join(source, 'Movie_{0:03d}.tiff'.format(idx))
+            with open(file_name, 'wb') as write:
+                write.write(os.urandom(args.size * 1024**2))
+            file_names.append(file_name)
+        total_size = args.number * args.size * args.destinations
+
+        for method, workers in (('Old', 1), ('Engine', 1), ('Engine', args.workers)):
+            results = mp.Queue()
+            processes = []
+            for idx in range(args.destinations):
+                destination = os.path.join(folder, '{0}_{1}_{2}'.format(method, workers, idx))
+                os.mkdir(destination)
+                jobs = [
+                    (file_name, os.path.join(destination, os.path.basename(file_name)))
+                    for file_name in file_names
+                    ]
+                processes.append(mp.Process(target=transfer_worker, args=(method, workers, jobs, results)))
+            start = time.time()
+            for process in processes:
+                process.start()
+            cpu = 0
+            for _ in processes:
+                cpu += results.get()[1]
+            for process in processes:
+                process.join()
+            total_time = time.time() - start
+            for idx in range(args.destinations):
+                shutil.rmtree(os.path.join(folder, '{0}_{1}_{2}'.format(method, workers, idx)))
+
+            print('{0} with {1} parallel copies per destination: {2} files of {3} MB to {4} destinations'.format(
+                method,
+                workers,
+                args.number,
+                args.size,
+                args.destinations,
+                ))
+            print_result('  Throughput', total_size / total_time, 'MB/s')
+            print_result('  CPU time', cpu, 's')
+    finally:
+        shutil.rmtree(folder)
+
+
+def sudo_copy_worker(method, args, jobs, results):
+    import resource
+    from .. import transphire_sudo as tsudo
+
+    start = time.time()
+    copy_times = []
+    if method == 'Spawn per file':
+        for file_in, file_out in jobs:
+            file_start = time.time()
+            with open(file_in, 'rb') as read:
+                content = read.read()
+            checksum_in = hash(content)
+            subprocess.run(
+                [args.sudo, '-k', '-S', '-u', args.user, 'cp', file_in, file_out],
+                input='{0}\n'.format(args.password),
+                universal_newlines=True,
+                )
+            with open(file_out, 'rb') as read:
+                content = read.read()
+            assert checksum_in == hash(content)
+            del content
+            copy_times.append(time.time() - file_start)
+    else:
+        session = tsudo.SudoSession(args.user, args.password, sudo=args.sudo)
+        for file_in, file_out in jobs:
+            copy_times.append(session.copy(file_in, file_out)['time'])
+        session.close()
+    worker = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    helper = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    results.put((time.time() - start, copy_times, worker, helper))
+
+
+def benchmark_sudo_copy(args):
+    """
+    Verified copies as another user with one sudo call and whole file hashes
+    per file and with the persistent sudo helper session.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        file_names = []
+        for idx in range(args.number):
+            file_name = os.path.join(folder, 'Movie_{0:03d}.tiff'.format(idx))
+            with open(file_name, 'wb') as write:
+                write.write(os.urandom(args.size * 1024**2))
+            file_names.append(file_name)
+
+        for method in ('Spawn per file', 'Session'):
+            destination = tempfile.mkdtemp(dir=folder)
+            jobs = [
+                (file_name, os.path.join(destination, os.path.basename(file_name)))
+                for file_name in file_names
+                ]
+            results = mp.Queue()
+            process = mp.Process(target=sudo_copy_worker, args=(method, args, jobs, results))
+            process.start()
+            total_time, copy_times, worker, helper = results.get()
+            process.join()
+            shutil.rmtree(destination)
+
+            print('{0}: {1} files of {2} MB'.format(method, args.number, args.size))
+            print_result('  Throughput', args.number * args.size / total_time, 'MB/s')
+            print_result('  Mean per file', args.size / (sum(copy_times) / len(copy_times)), 'MB/s')
+            print_result('  Peak RSS worker', worker / 1024, 'MB')
+            if method == 'Session':
+                print_result('  Peak RSS sudo helper', helper / 1024, 'MB')
+    finally:
+        shutil.rmtree(folder)
+
+
+def benchmark_tar(args):
+    """
+    Append synthetic movie files one by one to a tar file by opening it for
+    every file and with the TarPacker, with and without compression.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import random
+    import tarfile
+    from .. import transphire_tar as ttar
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        file_names = []
+        for idx in range(args.number):
+            file_name = os.path.join(folder, 'Movie_{0:04d}.mrc'.format(idx))
+            # Half noise, half empty detector area
+            size = args.size * 1024**2
+            with open(file_name, 'wb') as write:
+                write.write(os.urandom(size // 2))
+                write.write(b'\0' * (size - size // 2))
+            file_names.append(file_name)
+        total_size = args.number * args.size
+
+        for method in ('Open per file', 'TarPacker', 'TarPacker + compression'):
+            tar_file = os.path.join(folder, 'archive.tar')
+            start = time.time()
+            if method == 'Open per file':
+                for file_name in file_names:
+                    with tarfile.open(tar_file, 'a') as tar:
+                        tar.add(file_name, arcname=os.path.basename(file_name))
+            else:
+                packer = ttar.TarPacker()
+                for file_name in file_names:
+                    packer.add(tar_file, [(file_name, os.path.basename(file_name))])
+                packer.close()
+            pack_time = time.time() - start
+            archive = tar_file
+            if method.endswith('compression'):
+                archive = ttar.compress(tar_file)
+            total_time = time.time() - start
+
+            print('{0}: {1} files of {2} MB'.format(method, args.number, args.size))
+            print_result('  Packing', total_size / pack_time, 'MB/s')
+            print_result('  Packing + compression', total_size / total_time, 'MB/s')
+            print_result('  Archive size', os.path.getsize(archive) / 1024**2, 'MB')
+
+            if method != 'Open per file':
+                name = os.path.basename(random.choice(file_names))
+                output_file = os.path.join(folder, 'extracted')
+                start = time.time()
+                ttar.extract(archive, name, output_file)
+                extract_time = time.time() - start
+                with open(output_file, 'rb') as read, open(os.path.join(folder, name), 'rb') as read_ref:
+                    identical = read.read() == read_ref.read()
+                print_result('  Index extraction of one file', extract_time * 1e3, 'ms')
+                print('  Extracted file identical: {0}'.format(identical))
+                with tarfile.open(archive) as tar:
+                    print('  Readable by tarfile: {0}'.format(len(tar.getnames()) == args.number))
+                os.remove(output_file)
+            for file_name in glob.glob('{0}*'.format(tar_file)):
+                os.remove(file_name)
+    finally:
+        shutil.rmtree(folder)
+
+
+def health_probe(delays, counter, folder):
+    from .. import transphire_health as thealth
+
+    with counter.get_lock():
+        counter.value += 1
+    time.sleep(delays.get(os.path.basename(folder), 0))
+    return thealth.probe(folder)
+
+
+def health_worker(method, probe, health, folders, stop, idx, checks, latencies):
+    quota_folders, mount_folder = folders[:-1], folders[-1]
+    while not stop.is_set():
+        start = time.time()
+        if method == 'Direct':
+            # Like the old check_quota and check_if_mounted
+            for folder in quota_folders:
+                probe(folder)
+                probe(folder)
+            probe(mount_folder)
+        else:
+            for folder in quota_folders:
+                health.get(folder)
+            health.is_mounted(mount_folder)
+        checks[idx] += 1
+        latencies[idx] = max(latencies[idx], time.time() - start)
+        # Rest of the loop iteration of a process
+        time.sleep(0.01)
+
+
+def benchmark_health(args):
+    """
+    Quota and mount checks of many processes with direct filesystem probes
+    and with the shared FsHealth snapshot, for healthy, slow and hanging
+    mounts. The scratch folder is slow or hanging.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import functools
+    from .. import transphire_health as thealth
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        folders = []
+        for name in ('project', 'scratch', 'input'):
+            folders.append(os.path.join(folder, name))
+            os.mkdir(folders[-1])
+
+        for scenario, delay in (('Healthy', 0), ('Slow mount', args.delay), ('Hanging mount', 3600)):
+            for method in ('Direct', 'FsHealth'):
+                counter = mp.Value('q', 0)
+                probe = functools.partial(health_probe, {'scratch': delay}, counter)
+                health = None
+                if method == 'FsHealth':
+                    health = thealth.FsHealth(folders, ttl=args.ttl, timeout=args.timeout, probe_func=probe)
+                    health.start()
+
+                stop = mp.Event()
+                checks = mp.RawArray('q', args.workers)
+                latencies = mp.RawArray('d', args.workers)
+                processes = [
+                    mp.Process(
+                        target=health_worker,
+                        args=(method, probe, health, folders, stop, idx, checks, latencies),
+                        )
+                    for idx in range(args.workers)
+                    ]
+                start = time.time()
+                for process in processes:
+                    process.start()
+                time.sleep(args.duration)
+                stop.set()
+                stuck = 0
+                deadline = time.time() + 2 * max(0.1, min(delay, 1))
+                for process in processes:
+                    process.join(max(0, deadline - time.time()))
+                    if process.is_alive():
+                        stuck += 1
+                        process.terminate()
+                        process.join()
+                total_time = time.time() - start
+
+                status = None
+                if health is not None:
+                    status = health.get(folders[1])['status']
+                    health.close()
+
+                print('{0}, {1}: {2} processes for {3} s'.format(scenario, method, args.workers, args.duration))
+                print_result('  Checks', sum(checks) / total_time, '1/s')
+                print_result('  Maximum check latency', max(latencies) * 1e3, 'ms')
+                print_result('  Filesystem probes', counter.value / total_time, '1/s')
+                print('  Blocked processes: {0}'.format(stuck))
+                if status is not None:
+                    print('  Scratch status: {0}'.format({
+                        thealth.STATUS_UNKNOWN: 'unknown',
+                        thealth.STATUS_OK: 'ok',
+                        thealth.STATUS_MISSING: 'missing',
+                        thealth.STATUS_TIMEOUT: 'timeout',
+                        thealth.STATUS_ERROR: 'error',
+                        }[status]))
+    finally:
+        shutil.rmtree(folder)
+
+
+def metrics_worker(sender, stage, number, run_time):
+    for idx in range(number):
+        root_name = 'Movie_{0:06d}'.format(idx)
+        sender.dequeue(stage, root_name)
+        sender.start(stage, root_name)
+        time.sleep(run_time)
+        sender.end(stage, root_name, True)
+
+
+def benchmark_metrics(args):
+    """
+    Send the queue events of several processes to the MetricsCollector,
+    check the percentiles against the known run times and export them.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_log as tlog
+    from .. import transphire_metrics as tmetrics
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        queue = mp.Queue()
+        sender = tmetrics.MetricsSender(queue)
+        collector = tmetrics.MetricsCollector()
+        stages = ['Stage_{0}'.format(idx) for idx in range(args.stages)]
+
+        start = time.time()
+        for stage in stages:
+            for idx in range(args.number):
+                sender.enqueue(stage, 'Movie_{0:06d}'.format(idx))
+        enqueue_time = time.time() - start
+
+        processes = [
+            mp.Process(target=metrics_worker, args=(sender, stage, args.number, args.run_time))
+            for stage in stages
+            ]
+        for process in processes:
+            process.start()
+
+        nr_events = args.stages * args.number * 4
+        items = 0
+        collect_time = 0
+        for _ in range(nr_events):
+            event = queue.get()
+            start = time.time()
+            if collector.add_event(event) is not None:
+                items += 1
+            collect_time += time.time() - start
+        for process in processes:
+            process.join()
+
+        log_writer = tlog.LogWriter()
+        start = time.time()
+        collector.export(folder, log_writer, dict([(stage, 0) for stage in stages]))
+        log_writer.close()
+        export_time = time.time() - start
+
+        summary = collector.get_summary()
+        print('{0} stages with {1} items of {2} s run time'.format(args.stages, args.number, args.run_time))
+        print_result('  Send event', enqueue_time / (args.stages * args.number) * 1e6, 'us')
+        print_result('  Collect event', collect_time / nr_events * 1e6, 'us')
+        print_result('  Export', export_time * 1e3, 'ms')
+        print_result('  Run time p50 of {0}'.format(stages[0]), summary[stages[0]]['run_p50'], 's')
+        print_result('  Run time p99 of {0}'.format(stages[0]), summary[stages[0]]['run_p99'], 's')
+        print_result('  Wait time p99 of {0}'.format(stages[0]), summary[stages[0]]['wait_p99'], 's')
+        print('  Finished items: {0}'.format(items))
+        with open(os.path.join(folder, 'metrics.prom'), 'r') as read:
+            print('  Prometheus lines: {0}'.format(len(read.readlines())))
+    finally:
+        shutil.rmtree(folder)
+
+
+def combine_worker(method, combine, folder, worker_idx, number, write_delay, result_queue):
+    from .. import transphire_combine as tcombine
+
+    latencies = []
+    for idx in range(number):
+        combine_list = []
+        for out_idx in range(3):
+            in_file = os.path.join(folder, 'fragments', 'Movie_{0:02d}_{1:06d}_{2}.star'.format(worker_idx, idx, out_idx))
+            with open(in_file, 'w') as write:
+                write.write('\ndata_\n\nloop_\n_rlnMicrographName #1\n_rlnDefocusU #2\nMovie_{0:02d}_{1:06d}.mrc {2}\n'.format(worker_idx, idx, out_idx))
+            combine_list.append([in_file, os.path.join(folder, 'Combined_{0}.star'.format(out_idx))])
+
+        start = time.time()
+        if method == 'lock':
+            # Previous implementation: one locked read and append per file
+            for in_file, out_file in combine_list:
+                combine[out_file].acquire()
+                try:
+                    with open(in_file, 'r') as read:
+                        if not os.path.exists(out_file):
+                            lines = read.readlines()
+                        else:
+                            lines = read.readlines()[-1]
+                    time.sleep(write_delay)
+                    tcombine.write_file(out_file, 'a+', ''.join(lines))
+                finally:
+                    combine[out_file].release()
+        else:
+            combine.combine(combine_list)
+        latencies.append(time.time() - start)
+    result_queue.put(latencies)
+
+
+def benchmark_combine(args):
+    """
+    Append the per micrograph files of several processes to the combined
+    files with one lock per file and with the CombineWriter. The latency
+    of a call includes the time waiting for the other processes. Every
+    write is delayed by write_delay seconds to mimic a network filesystem.
+    Afterwards the combined files are regenerated from the per micrograph
+    files and compared.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_combine as tcombine
+    from .. import transphire_metrics as tmetrics
+
+    write_file = tcombine.write_file
+    def slow_write_file(file_name, opener, content):
+        time.sleep(args.write_delay)
+        write_file(file_name, opener, content)
+
+    for method in ('lock', 'writer'):
+        folder = tempfile.mkdtemp(dir=args.folder)
+        try:
+            os.mkdir(os.path.join(folder, 'fragments'))
+            out_files = [os.path.join(folder, 'Combined_{0}.star'.format(idx)) for idx in range(3)]
+            writer = None
+            if method == 'lock':
+                combine = dict([(out_file, mp.Lock()) for out_file in out_files])
+            else:
+                combine = tcombine.CombineSender(mp.Queue())
+                writer = tcombine.CombineWriter(combine, os.path.join(folder, 'index'), folder)
+                tcombine.write_file = slow_write_file
+                writer.start()
+
+            result_queue = mp.Queue()
+            processes = [
+                mp.Process(target=combine_worker, args=(method, combine, folder, idx, args.number, args.write_delay, result_queue))
+                for idx in range(args.workers)
+                ]
+            start = time.time()
+            for process in processes:
+                process.start()
+            latencies = []
+            for _ in processes:
+                latencies.extend(result_queue.get())
+            for process in processes:
+                process.join()
+            total_time = time.time() - start
+            if writer is not None:
+                writer.close()
+                tcombine.write_file = write_file
+
+            latencies.sort()
+            print('{0}: {1} processes with {2} micrographs and 3 combined files, {3} s per write'.format(
+                method, args.workers, args.number, args.write_delay
+                ))
+            print_result('  Micrographs', len(latencies) / total_time, '1/s')
+            print_result('  Latency p50', tmetrics.percentile(latencies, 0.5) * 1e3, 'ms')
+            print_result('  Latency p99', tmetrics.percentile(latencies, 0.99) * 1e3, 'ms')
+            print_result('  Latency max', latencies[-1] * 1e3, 'ms')
+            with open(out_files[0], 'r') as read:
+                lines = read.readlines()
+            print('  Rows in {0}: {1}'.format(
+                os.path.basename(out_files[0]),
+                len([line for line in lines if line.startswith('Movie_')])
+                ))
+            if writer is not None:
+                print('  {0}'.format(writer.get_summary()))
+                regenerated = '{0}.regenerated'.format(out_files[0])
+                start = time.time()
+                tcombine.regenerate_combined_file(regenerated, writer.get_index_file(out_files[0]))
+                print_result('  Regenerate', (time.time() - start) * 1e3, 'ms')
+                with open(regenerated, 'r') as read:
+                    print('  Regenerated file identical: {0}'.format(read.readlines() == lines))
+        finally:
+            shutil.rmtree(folder)
+
+
+def benchmark_combine_tickets(args):
+    """
+    Acknowledgement of late, out of order and lost messages of the
+    CombineSender. A message is only acknowledged after its rows are
+    written and a late or lost message does not hold back the others.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    from .. import transphire_combine as tcombine
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        sender = tcombine.CombineSender(mp.Queue(), timeout=args.timeout)
+        writer = tcombine.CombineWriter(sender, os.path.join(folder, 'index'), folder)
+        writer.start()
+        out_file = os.path.join(folder, 'Combined.star')
+
+        def items(idx):
+            return [(out_file, 'Movie_{0}'.format(idx), 'header\nMovie_{0}\n'.format(idx))]
+
+        checks = []
+        late_ticket = sender.get_ticket()
+        lost_ticket = sender.get_ticket()
+        tickets = [sender.get_ticket() for _ in range(args.number)]
+        for idx, ticket in reversed(list(enumerate(tickets))):
+            sender.put('combine', ticket, items(idx))
+        start = time.time()
+        results = [sender.wait(ticket, start)[0] for ticket in tickets]
+        checks.append(('Out of order tickets written', all(results)))
+        checks.append(('Late ticket not acknowledged early', not sender.is_written(late_ticket)))
+
+        time.sleep(args.late)
+        start = time.time()
+        sender.put('combine', late_ticket, items(args.number))
+        is_written, wait_time = sender.wait(late_ticket, start)
+        checks.append(('Late ticket written', is_written))
+        print_result('  Late ticket wait', wait_time * 1e3, 'ms')
+
+        fragment = os.path.join(folder, 'Movie_fragment.star')
+        with open(fragment, 'w') as write:
+            write.write('header\nMovie_{0}\n'.format(args.number + 1))
+        is_written, wait_time = sender.combine([[fragment, out_file]])
+        checks.append(('Ticket after the late ticket written', is_written))
+        checks.append(('Lost ticket not acknowledged', not sender.is_written(lost_ticket)))
+
+        start = time.time()
+        writer.close()
+        close_time = time.time() - start
+        checks.append(('Writer closed', close_time < args.timeout))
+        print_result('  Close', close_time * 1e3, 'ms')
+
+        with open(out_file, 'r') as read:
+            nr_rows = len([line for line in read.readlines() if line.startswith('Movie_')])
+        checks.append(('All rows written', nr_rows == args.number + 2))
+        for name, result in checks:
+            print('  {0}: {1}'.format(name, result))
+    finally:
+        shutil.rmtree(folder)
+
+
+def benchmark_outlier(args):
+    """
+    Replay a synthetic CTF session through check_for_outlier.
+    By default the processes pass the plot data of the current micrograph
+    only, which is timed as the default path. With Notification -> Median
+    over previous micrographs, the running window of the OutlierDetector is
+    used. Its decisions are compared with the median of the last values of
+    the full plot data. Some micrographs arrive out of order or are
+    processed again.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import numpy as np
+    from .. import transphire_import as ti
+    from .. import transphire_outlier as toutlier
+    from .. import transphire_software as tus
+
+    def normalize(entries):
+        return [[key, 'nan' if value != value else float(value), low, high] for key, value, low, high in entries]
+
+    dtype = ti.get_dtype_dict()['CTF']
+    keys = toutlier.get_outlier_keys('CTF')
+    settings = {'Notification': {'Nr. of values used for median': str(args.median)}}
+    for key in keys:
+        settings['Notification']['CTF {0} warning'.format(key)] = '0.3 0.7'
+        settings['Notification']['CTF {0} skip'.format(key)] = '0.05 0.95'
+
+    rng = np.random.RandomState(0)
+    names = ['/data/FoilHole_{0:07d}_Data.mrc'.format(idx) for idx in range(args.number)]
+    order = list(names)
+    for idx in range(0, args.number - 3, 7):
+        order[idx], order[idx+3] = order[idx+3], order[idx]
+    order.extend([names[idx] for idx in rng.randint(0, args.number, args.number // 20)])
+
+    folder = tempfile.mkdtemp(dir=args.folder)
+    try:
+        detector = toutlier.OutlierDetector(os.path.join(folder, 'Outlier_windows'))
+        full = np.zeros(0, dtype=dtype)
+        time_default = 0
+        time_full = 0
+        time_window = 0
+        mismatches = 0
+        for name in order:
+            current = np.zeros(1, dtype=dtype)
+            current[0]['file_name'] = name
+            for key in keys:
+                current[0][key] = rng.rand()
+
+            full = full[full['file_name'] != name]
+            full = np.sort(np.append(full, current), order='file_name')
+
+            start = time.time()
+            tus.check_for_outlier('CTF', current, name, settings)
+            time_default += time.time() - start
+
+            start = time.time()
+            decision_full = tus.check_for_outlier('CTF', full, name, settings)
+            time_full += time.time() - start
+
+            start = time.time()
+            rows = toutlier.get_outlier_rows('CTF', current)
+            statistics = detector.update(folder, 'CTF', args.median, rows)
+            if statistics is None:
+                detector.fill(folder, 'CTF', args.median, [])
+                statistics = detector.update(folder, 'CTF', args.median, rows)
+            decision_window = tus.check_for_outlier('CTF', current, name, settings, statistics=statistics)
+            time_window += time.time() - start
+
+            for entries_full, entries_window in zip(decision_full, decision_window):
+                if normalize(entries_full) != normalize(entries_window):
+                    mismatches += 1
+                    break
+
+        print('{0} micrographs, {1} checks, median of {2} values'.format(args.number, len(order), args.median))
+        print_result('  Default, current micrograph', time_default / len(order) * 1e3, 'ms/check')
+        print('  Median over previous micrographs:')
+        print_result('    Full plot data', time_full / len(order) * 1e3, 'ms/check')
+        print_result('    Running window', time_window / len(order) * 1e3, 'ms/check')
+        print('    Different decisions: {0}'.format(mismatches))
+    finally:
+        shutil.rmtree(folder)
+
+
+def mic_number_loop(array, settings, as_int=True):
+    """
+    get_mic_number before the name cache, one parse per name and refresh.
+    """
+    import numpy as np
+    error = False
+    if as_int: out_type = int
+    else: out_type = str
+    if settings['Output']['Rename micrographs'] == 'True':
+        number_list = []
+        prefix = settings['Output']['Rename prefix']
+        suffix = settings['Output']['Rename suffix']
+        for entry in array:
+            entry = os.path.basename(entry)
+            if suffix == '': first_part_split = entry.rsplit('.', 1)
+            else: first_part_split = entry.rsplit(suffix, 1)
+            first_part = first_part_split[0]
+            if prefix == '': number = first_part
+            else: number = first_part.split(prefix)[-1]
+            if as_int:
+                try: number = int(number)
+                except ValueError: error = True; break
+            number_list.append(number)
+    else:
+        number_list = np.arange(len(array))
+    if error: number_list = np.arange(len(array))
+    return np.array(number_list).astype(out_type)
+
+
+def benchmark_mic_number(args):
+    """
+    Refresh cost of the micrograph numbers of the plots for different
+    numbers of micrographs. A refresh adds --new micrographs to the plot
+    data and every refresh calls get_mic_number --plots times, like the
+    plots of a single plot data type.
+    The results of both are compared.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    import numpy as np
+    from .. import transphire_import as ti
+    from .. import transphire_plot as tp
+
+    dtype = ti.get_dtype_dict()['CTF']
+    settings = {
+        'Output': {
+            'Rename micrographs': 'True',
+            'Rename prefix': args.prefix,
+            'Rename suffix': args.suffix,
+            },
+        }
+    for size in args.sizes:
+        tp.MIC_NUMBER_CACHE.clear()
+        data = np.zeros(size + args.new * args.refreshes, dtype=dtype)
+        data['file_name'] = [
+            '/project/Motion/{0}{1:06d}{2}.mrc'.format(args.prefix, idx, args.suffix)
+            for idx in range(len(data))
+            ]
+        data = data[np.random.RandomState(0).permutation(len(data))]
+
+        time_loop = 0
+        time_cache = 0
+        time_first = 0
+        mismatches = 0
+        for refresh in range(args.refreshes + 1):
+            current = np.sort(data[:size + refresh * args.new], order='file_name')
+            for _ in range(args.plots):
+                start = time.time()
+                numbers_loop = mic_number_loop(current['file_name'], settings)
+                time_loop += time.time() - start
+
+                start = time.time()
+                numbers_cache = tp.get_mic_number(current['file_name'], settings)
+                duration = time.time() - start
+                if refresh == 0 and time_first == 0:
+                    time_first = duration
+                time_cache += duration
+
+                if not np.array_equal(numbers_loop, numbers_cache) or numbers_loop.dtype != numbers_cache.dtype:
+                    mismatches += 1
+
+        nr_calls = (args.refreshes + 1) * args.plots
+        print('{0} micrographs, {1} refreshes with {2} new micrographs, {3} calls per refresh'.format(
+            size, args.refreshes, args.new, args.plots
+            ))
+        print_result('  Loop', time_loop / nr_calls * 1e3, 'ms/call')
+        print_result('  Cache first call', time_first * 1e3, 'ms/call')
+        print_result('  Cache', time_cache / nr_calls * 1e3, 'ms/call')
+        print('  Different results: {0}'.format(mismatches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TranSPHIRE micro benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    parser_queue = subparsers.add_parser('queue_store', help='Text vs SQLite queue store')
+    parser_queue.add_argument('--number', type=int, default=2000, help='Number of queue entries')
+    parser_queue.add_argument('--folder', default=None, help='Folder for the temporary queue files')
+    parser_queue.set_defaults(func=benchmark_queue_store)
+
+    parser_scheduler = subparsers.add_parser('scheduler', help='Poll vs Event scheduler latency')
+    parser_scheduler.add_argument('--number', type=int, default=10, help='Number of movies')
+    parser_scheduler.add_argument('--interval', type=float, default=1, help='Time between two movies in seconds')
+    parser_scheduler.add_argument('--work', type=float, default=0.1, help='Processing time per stage in seconds')
+    parser_scheduler.add_argument('--poll', type=float, default=5, help='Poll interval and event timeout in seconds')
+    parser_scheduler.set_defaults(func=benchmark_scheduler)
+
+    parser_shared = subparsers.add_parser('shared_state', help='mp.Manager proxies vs SharedDict')
+    parser_shared.add_argument('--workers', type=int, default=40, help='Number of worker processes')
+    parser_shared.add_argument('--number', type=int, default=500, help='Number of iterations per worker')
+    parser_shared.set_defaults(func=benchmark_shared_state)
+
+    parser_header = subparsers.add_parser('header', help='Native header reader vs IMOD header')
+    parser_header.add_argument('--number', type=int, default=3000, help='Number of synthetic files')
+    parser_header.add_argument('--frames', type=int, default=40, help='Number of frames per file')
+    parser_header.add_argument('--imod_header', default='header', help='IMOD header executable')
+    parser_header.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_header.set_defaults(func=benchmark_header)
+
+    parser_translation = subparsers.add_parser('translation', help='np.genfromtxt vs TranslationIndex lookups')
+    parser_translation.add_argument('--number', type=int, default=10000, help='Number of micrographs in the translation file')
+    parser_translation.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_translation.set_defaults(func=benchmark_translation)
+
+    parser_import_cache = subparsers.add_parser('import_cache', help='Import time vs session size with and without parse cache')
+    parser_import_cache.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 20000], help='Session sizes to measure')
+    parser_import_cache.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_import_cache.set_defaults(func=benchmark_import_cache)
+
+    parser_preview = subparsers.add_parser('preview', help='Full image vs streaming preview of a micrograph')
+    parser_preview.add_argument('--rows', type=int, default=8184, help='Number of rows')
+    parser_preview.add_argument('--columns', type=int, default=11520, help='Number of columns')
+    parser_preview.add_argument('--frames', type=int, default=1, help='Number of frames')
+    parser_preview.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_preview.set_defaults(func=benchmark_preview)
+
+    parser_normalize = subparsers.add_parser('normalize', help='Vectorized vs python loop normalize_image and rebin')
+    parser_normalize.add_argument('--sizes', type=int, nargs='+', default=[512, 1024, 2048, 4096], help='Power spectrum sizes')
+    parser_normalize.add_argument('--apix', type=float, default=1.06, help='Pixel size in angstrom')
+    parser_normalize.add_argument('--max_loop', type=int, default=1024, help='Largest size to compare with the python loop')
+    parser_normalize.set_defaults(func=benchmark_normalize)
+
+    parser_gpu = subparsers.add_parser('gpu_scheduler', help='Spin waiting GPU locks vs GpuScheduler with fake GPUs')
+    parser_gpu.add_argument('--number', type=int, default=10, help='Number of jobs per worker')
+    parser_gpu.add_argument('--job_time', type=float, default=0.2, help='Run time of the mock command in seconds')
+    parser_gpu.set_defaults(func=benchmark_gpu_scheduler)
+
+    parser_gpu_conflicts = subparsers.add_parser('gpu_conflicts', help='Conflicts between waiting requests of the GpuScheduler')
+    parser_gpu_conflicts.add_argument('--hold_time', type=float, default=1, help='Time a job holds its GPUs in seconds')
+    parser_gpu_conflicts.set_defaults(func=benchmark_gpu_conflicts)
+
+    parser_sys_log = subparsers.add_parser('sys_log', help='Open per message vs batched LogWriter')
+    parser_sys_log.add_argument('--number', type=int, default=20000, help='Number of log messages')
+    parser_sys_log.add_argument('--delay', type=float, default=1, help='Maximum buffer time in seconds')
+    parser_sys_log.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_sys_log.set_defaults(func=benchmark_sys_log)
+
+    parser_data_frame = subparsers.add_parser('data_frame', help='Manager namespace vs shared log DataFrame under contention')
+    parser_data_frame.add_argument('--workers', type=int, default=8, help='Number of worker processes')
+    parser_data_frame.add_argument('--number', type=int, default=25, help='Number of updates per worker')
+    parser_data_frame.add_argument('--rows', type=int, default=5000, help='Number of filled rows')
+    parser_data_frame.add_argument('--columns', type=int, default=20, help='Number of columns')
+    parser_data_frame.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_data_frame.set_defaults(func=benchmark_data_frame)
+
+    parser_transfer = subparsers.add_parser('transfer', help='Hash + shutil copy vs TransferEngine')
+    parser_transfer.add_argument('--number', type=int, default=8, help='Number of files')
+    parser_transfer.add_argument('--size', type=int, default=128, help='File size in MB')
+    parser_transfer.add_argument('--destinations', type=int, default=3, help='Number of destinations copied at the same time')
+    parser_transfer.add_argument('--workers', type=int, default=4, help='Parallel copies per destination')
+    parser_transfer.add_argument('--folder', default='/dev/shm', help='Folder for the temporary files, e.g. a tmpfs')
+    parser_transfer.set_defaults(func=benchmark_transfer)
+
+    parser_sudo = subparsers.add_parser('sudo_copy', help='sudo per file vs persistent sudo helper session')
+    parser_sudo.add_argument('--number', type=int, default=8, help='Number of files')
+    parser_sudo.add_argument('--size', type=int, default=256, help='File size in MB')
+    parser_sudo.add_argument('--user', default=os.environ.get('USER', 'root'), help='User to copy as')
+    parser_sudo.add_argument('--password', default='', help='sudo password')
+    parser_sudo.add_argument('--sudo', default='sudo', help='sudo executable')
+    parser_sudo.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_sudo.set_defaults(func=benchmark_sudo_copy)
+
+    parser_tar = subparsers.add_parser('tar', help='Open per file tar appends vs TarPacker')
+    parser_tar.add_argument('--number', type=int, default=200, help='Number of files')
+    parser_tar.add_argument('--size', type=int, default=4, help='File size in MB')
+    parser_tar.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_tar.set_defaults(func=benchmark_tar)
+
+    parser_health = subparsers.add_parser('health', help='Direct quota and mount checks vs shared FsHealth with slow and hanging mounts')
+    parser_health.add_argument('--workers', type=int, default=50, help='Number of processes')
+    parser_health.add_argument('--duration', type=float, default=3, help='Run time per scenario in seconds')
+    parser_health.add_argument('--delay', type=float, default=0.5, help='Response time of the slow mount in seconds')
+    parser_health.add_argument('--ttl', type=float, default=1, help='Health check interval in seconds')
+    parser_health.add_argument('--timeout', type=float, default=0.2, help='Health check timeout in seconds')
+    parser_health.add_argument('--folder', default=None, help='Folder for the temporary folders')
+    parser_health.set_defaults(func=benchmark_health)
+
+    parser_metrics = subparsers.add_parser('metrics', help='Cost and accuracy of the per stage metrics')
+    parser_metrics.add_argument('--number', type=int, default=1000, help='Number of items per stage')
+    parser_metrics.add_argument('--stages', type=int, default=4, help='Number of stages')
+    parser_metrics.add_argument('--run-time', type=float, default=0.001, help='Run time per item in seconds')
+    parser_metrics.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_metrics.set_defaults(func=benchmark_metrics)
+
+    parser_combine = subparsers.add_parser('combine', help='Locked appends vs CombineWriter for the combined star files')
+    parser_combine.add_argument('--workers', type=int, default=16, help='Number of processes')
+    parser_combine.add_argument('--number', type=int, default=200, help='Number of micrographs per process')
+    parser_combine.add_argument('--write_delay', type=float, default=0.002, help='Additional time per write in seconds')
+    parser_combine.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_combine.set_defaults(func=benchmark_combine)
+
+    parser_combine_tickets = subparsers.add_parser('combine_tickets', help='Late, out of order and lost messages of the CombineSender')
+    parser_combine_tickets.add_argument('--number', type=int, default=100, help='Number of out of order messages')
+    parser_combine_tickets.add_argument('--late', type=float, default=2, help='Delay of the late message in seconds')
+    parser_combine_tickets.add_argument('--timeout', type=float, default=10, help='Maximum wait time of the sender in seconds')
+    parser_combine_tickets.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_combine_tickets.set_defaults(func=benchmark_combine_tickets)
+
+    parser_outlier = subparsers.add_parser('outlier', help='Outlier check of the current micrograph and the optional running median window on a replayed session')
+    parser_outlier.add_argument('--number', type=int, default=2000, help='Number of micrographs')
+    parser_outlier.add_argument('--median', type=int, default=5, help='Number of values used for the median')
+    parser_outlier.add_argument('--folder', default=None, help='Folder for the temporary files')
+    parser_outlier.set_defaults(func=benchmark_outlier)
+
+    parser_mic_number = subparsers.add_parser('mic_number', help='Name parsing loop vs cached get_mic_number for the plot refresh')
+    parser_mic_number.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of micrographs')
+    parser_mic_number.add_argument('--new', type=int, default=10, help='Number of new micrographs per refresh')
+    parser_mic_number.add_argument('--refreshes', type=int, default=5, help='Number of refreshes')
+    parser_mic_number.add_argument('--plots', type=int, default=5, help='Number of calls per refresh')
+    parser_mic_number.add_argument('--prefix', default='', help='Rename prefix')
+    parser_mic_number.add_argument('--suffix', default='_transphire', help='Rename suffix')
+    parser_mic_number.set_defaults(func=benchmark_mic_number)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1069 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+    End-to-end pipeline benchmark without a microscope and without GPUs.
+    A synthetic microscope writes EPU or plain stack sessions and mock
+    executables replace MotionCor2, CTFFIND4, crYOLO, WINDOW, ISAC2 and the
+    EMAN2/IMOD/MPI helpers. The real ProcessWorker runs on top of them.
+
+    Usage: python -m transphire.support_scripts.pipeline_benchmark <command> [options]
+
+    python -m transphire.support_scripts.pipeline_benchmark mocks --bin /tmp/bench/bin
+    python -m transphire.support_scripts.pipeline_benchmark run --settings used_settings.json \\
+        --project /tmp/bench/project --output /tmp/bench/microscope --bin /tmp/bench/bin --number 100 --rate 30
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import shutil
+import stat
+import struct
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .benchmark import print_result, write_mrc_header, write_tiff_header
+
+
+MOCK_PREFIX = {
+    'MotionCor2': 'motioncor2',
+    'CTFFIND4': 'ctffind',
+    'crYOLO': 'cryolo',
+    'WINDOW': 'window',
+    'ISAC2': 'isac',
+    'e2proc2d.py': 'e2proc2d',
+    'e2bdb.py': 'e2bdb',
+    'mpirun': 'mpirun',
+    'IMOD header': 'header',
+    }
+
+MOCK_NAMES = {
+    'motioncor2': 'MotionCor2',
+    'ctffind': 'ctffind',
+    'cryolo': 'cryolo_predict.py',
+    'window': 'sp_window.py',
+    'isac': 'sp_isac2_gpu.py',
+    'e2proc2d': 'e2proc2d.py',
+    'e2bdb': 'e2bdb.py',
+    'mpirun': 'mpirun',
+    'header': 'header',
+    }
+
+MOCK_DELAYS = {
+    'motioncor2': 2.0,
+    'ctffind': 1.0,
+    'cryolo': 1.0,
+    'window': 0.5,
+    'isac': 10.0,
+    'e2proc2d': 0,
+    'e2bdb': 0,
+    'mpirun': 0,
+    'header': 0,
+    }
+
+MOCK_WRAPPER = """#!/bin/sh
+# TranSPHIRE pipeline benchmark mock for {kind}
+TRANSPHIRE_MOCK_DELAY={delay} TRANSPHIRE_MOCK_JITTER={jitter} \\
+PYTHONPATH={package}${{PYTHONPATH:+:$PYTHONPATH}} \\
+exec {python} -m transphire.support_scripts.pipeline_benchmark mock {kind} "$@"
+"""
+
+DESCRIPTION_FILE = 'microscope.json'
+GENERATED_FILE = 'generated.jsonl'
+
+EPU_XML = ''.join([
+    '<?xml version="1.0" encoding="utf-8"?>',
+    '<MicroscopeImage xmlns="http://schemas.datacontract.org/2004/07/Fei.SharedObjects" ',
+    'xmlns:i="http://www.w3.org/2001/XMLSchema-instance">',
+    '<camera><ExposureTime>{exposure}</ExposureTime>',
+    '<ReadoutArea xmlns:a="http://schemas.datacontract.org/2004/07/System.Drawing">',
+    '<a:height>{y_dim}</a:height><a:width>{x_dim}</a:width></ReadoutArea></camera>',
+    '<CustomData xmlns:a="http://schemas.microsoft.com/2003/10/Serialization/Arrays">',
+    '<a:KeyValueOfstringanyType><a:Key>AppliedDefocus</a:Key>',
+    '<a:Value i:type="b:double" xmlns:b="http://www.w3.org/2001/XMLSchema">{defocus}</a:Value>',
+    '</a:KeyValueOfstringanyType>',
+    '<a:KeyValueOfstringanyType><a:Key>Dose</a:Key>',
+    '<a:Value i:type="b:double" xmlns:b="http://www.w3.org/2001/XMLSchema">{dose}</a:Value>',
+    '</a:KeyValueOfstringanyType>',
+    '<a:KeyValueOfstringanyType><a:Key>PhasePlateUsed</a:Key>',
+    '<a:Value i:type="b:boolean" xmlns:b="http://www.w3.org/2001/XMLSchema">false</a:Value>',
+    '</a:KeyValueOfstringanyType>',
+    '<a:KeyValueOfstringanyType><a:Key>SuperResolutionFactor</a:Key>',
+    '<a:Value i:type="b:int" xmlns:b="http://www.w3.org/2001/XMLSchema">1</a:Value>',
+    '</a:KeyValueOfstringanyType></CustomData>',
+    '<microscopeData><gun><AccelerationVoltage>300000</AccelerationVoltage></gun>',
+    '<optics><BeamShift xmlns:a="http://schemas.datacontract.org/2004/07/Fei.Types">',
+    '<a:_x>{shift_x}</a:_x><a:_y>{shift_y}</a:_y></BeamShift>',
+    '<BeamTilt xmlns:a="http://schemas.datacontract.org/2004/07/Fei.Types">',
+    '<a:_x>{tilt_x}</a:_x><a:_y>{tilt_y}</a:_y></BeamTilt>',
+    '<Defocus>{defocus}</Defocus></optics>',
+    '<stage><Position><A>0</A><B>0</B><X>{stage_x}</X><Y>{stage_y}</Y><Z>{stage_z}</Z></Position></stage>',
+    '</microscopeData>',
+    '<SpatialScale><pixelSize><x><numericValue>{pixel_size}</numericValue></x>',
+    '<y><numericValue>{pixel_size}</numericValue></y></pixelSize></SpatialScale>',
+    '<FractionationSettings xmlns:b="http://schemas.datacontract.org/2004/07/Fei.Applications.Common.Omp.Interface">',
+    '<b:NumberOffractions>{frames}</b:NumberOffractions></FractionationSettings>',
+    '</MicroscopeImage>',
+    ])
+
+
+def write_movie(file_name, x_dim, y_dim, z_dim, chunk):
+    """
+    Write a synthetic movie with a valid header and random data.
+    The file is written to a hidden temporary file and renamed afterwards,
+    so the Find process never sees a partial movie.
+
+    Arguments:
+    file_name - Output file, .mrc/.mrcs or .tif/.tiff
+    x_dim - Number of columns
+    y_dim - Number of rows
+    z_dim - Number of frames
+    chunk - Random bytes used to fill the data
+
+    Return:
+    Size of the file in bytes
+    """
+    temp_file = os.path.join(
+        os.path.dirname(file_name),
+        '.{0}.tmp'.format(os.path.basename(file_name))
+        )
+    if os.path.splitext(file_name)[-1].lower() in ('.tif', '.tiff'):
+        # 8 bit counting data
+        write_tiff_header(temp_file, x_dim, y_dim, z_dim, compression=1)
+        size = x_dim * y_dim * z_dim
+    else:
+        # 32 bit float
+        write_mrc_header(temp_file, x_dim, y_dim, z_dim)
+        size = x_dim * y_dim * z_dim * 4
+
+    with open(temp_file, 'ab') as write:
+        while size > 0:
+            write.write(chunk[:size])
+            size -= len(chunk)
+    os.replace(temp_file, file_name)
+    return os.path.getsize(file_name)
+
+
+def write_mrc_image(file_name, shape, seed=None):
+    """
+    Write a float32 MRC image or stack with gaussian noise.
+
+    Arguments:
+    file_name - Output file
+    shape - (y, x) or (z, y, x) shape
+    seed - Seed for the noise
+
+    Return:
+    None
+    """
+    if len(shape) == 2:
+        shape = (1, shape[0], shape[1])
+    z_dim, y_dim, x_dim = shape
+    data = np.random.RandomState(seed).normal(size=shape).astype('<f4')
+    header = bytearray(1024)
+    struct.pack_into('<4i', header, 0, x_dim, y_dim, z_dim, 2)
+    struct.pack_into('<3i', header, 28, x_dim, y_dim, z_dim)
+    struct.pack_into('<3f', header, 40, x_dim, y_dim, z_dim)
+    struct.pack_into('<3f', header, 76, data.min(), data.max(), data.mean())
+    struct.pack_into('<i', header, 92, 0)
+    struct.pack_into('<3i', header, 64, 1, 2, 3)
+    header[208:212] = b'MAP '
+    header[212:214] = b'\x44\x44'
+    with open(file_name, 'wb') as write:
+        write.write(header)
+        write.write(data.tobytes())
+
+
+def write_png(file_name, shape, seed=None):
+    """
+    Write a gray scale PNG image with gaussian noise.
+
+    Arguments:
+    file_name - Output file
+    shape - (y, x) shape
+    seed - Seed for the noise
+
+    Return:
+    None
+    """
+    import matplotlib.image as mi
+    data = np.random.RandomState(seed).normal(size=shape)
+    mi.imsave(file_name, data, cmap='gist_gray')
+
+
+def read_dimensions(file_name, default=(512, 512, 1)):
+    """
+    Dimensions of an image file.
+    Files that are not supported by the TranSPHIRE header reader are read as MRC.
+
+    Arguments:
+    file_name - File to read
+    default - Return value if the file cannot be read
+
+    Return:
+    x_dim, y_dim, z_dim
+    """
+    from .. import transphire_header as th
+    try:
+        return th.read_header(file_name)
+    except (th.HeaderError, OSError):
+        pass
+    try:
+        with open(file_name, 'rb') as read:
+            return struct.unpack('<3i', read.read(12))
+    except (OSError, struct.error):
+        return default
+
+
+def get_seed(name):
+    return sum(ord(char) * (idx + 1) for idx, char in enumerate(name)) % 2**31
+
+
+def get_epu_names(idx, start_time, interval, shots, holes):
+    """
+    EPU names of a movie.
+
+    Arguments:
+    idx - Index of the movie
+    start_time - Time of the first movie
+    interval - Time between two movies
+    shots - Shots per hole
+    holes - Holes per grid square
+
+    Return:
+    Grid square name, movie root name
+    """
+    acquisition = datetime.datetime.fromtimestamp(start_time + idx * interval)
+    hole, shot = divmod(idx, shots)
+    grid, _ = divmod(hole, holes)
+    return (
+        'GridSquare_{0}'.format(1000000 + grid),
+        'FoilHole_{0}_Data_{1}_{2}_{3}'.format(
+            2000000 + hole,
+            3000000 + shot,
+            idx,
+            acquisition.strftime('%Y%m%d_%H%M%S'),
+            ),
+        )
+
+
+def write_session(args):
+    """
+    Write the description and the EPU session files of a synthetic microscope.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    Description dictionary
+    """
+    output = os.path.abspath(args.output)
+    description = {
+        'software': args.software,
+        'camera': args.camera,
+        'type': 'Stack',
+        'extension': args.extension,
+        'x_dim': args.size[0],
+        'y_dim': args.size[1],
+        'frames': args.frames,
+        'frames_folder': os.path.join(output, 'frames'),
+        }
+    if args.software == 'Just Stack':
+        description['jpg_folder'] = description['frames_folder']
+    else:
+        description['jpg_folder'] = os.path.join(output, 'epu')
+
+    for folder in (description['frames_folder'], description['jpg_folder']):
+        os.makedirs(folder, exist_ok=True)
+    if args.software != 'Just Stack':
+        with open(os.path.join(description['jpg_folder'], 'EpuSession.dm'), 'w') as write:
+            write.write('<EpuSessionXml><Name>TranSPHIRE benchmark</Name></EpuSessionXml>\n')
+    with open(os.path.join(output, DESCRIPTION_FILE), 'w') as write:
+        json.dump(description, write, indent=1)
+    return description
+
+
+def generate_movies(description, number, rate, output, shots=4, holes=16, stop=None, log=print):
+    """
+    Write movies at a fixed rate.
+    Every movie is written before its jpg and xml files, like EPU does.
+
+    Arguments:
+    description - Description dictionary of write_session
+    number - Number of movies
+    rate - Movies per minute, 0 writes as fast as possible
+    output - Output folder of the generator
+    shots - Shots per hole
+    holes - Holes per grid square
+    stop - threading.Event to stop early
+    log - Print function
+
+    Return:
+    Number of written movies
+    """
+    interval = 60 / rate if rate > 0 else 0
+    chunk = os.urandom(16 * 1024**2)
+    jpg_file = os.path.join(output, '.template.jpg')
+    if not os.path.exists(jpg_file):
+        import matplotlib.image as mi
+        mi.imsave(jpg_file, np.random.RandomState(0).normal(size=(128, 128)), cmap='gist_gray', format='jpg')
+
+    start = time.time()
+    suffix = '_fractions' if description['camera'] in ('K2', 'K3') else '_Fractions'
+    with open(os.path.join(output, GENERATED_FILE), 'a') as write_log:
+        for idx in range(number):
+            if stop is not None and stop.is_set():
+                return idx
+            wait = start + idx * interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+
+            if description['software'] == 'Just Stack':
+                root_name = 'Movie_{0:06d}'.format(idx)
+                movie = os.path.join(description['frames_folder'], '{0}.{1}'.format(root_name, description['extension']))
+                write_movie(movie, description['x_dim'], description['y_dim'], description['frames'], chunk)
+            else:
+                grid, root_name = get_epu_names(idx, start, max(interval, 1), shots, holes)
+                jpg_folder = os.path.join(description['jpg_folder'], 'Images-Disc1', grid, 'Data')
+                frames_folder = os.path.join(description['frames_folder'], 'Images-Disc1', grid, 'Data')
+                if not os.path.isdir(jpg_folder):
+                    os.makedirs(jpg_folder, exist_ok=True)
+                    os.makedirs(frames_folder, exist_ok=True)
+                    grid_root = os.path.join(
+                        os.path.dirname(jpg_folder),
+                        '{0}_{1}'.format(grid, root_name[-15:]),
+                        )
+                    shutil.copyfile(jpg_file, '{0}.jpg'.format(grid_root))
+                    with open('{0}.xml'.format(grid_root), 'w') as write:
+                        write.write('<MicroscopeImage></MicroscopeImage>\n')
+
+                rng = random.Random(idx)
+                xml = EPU_XML.format(
+                    exposure=1.0,
+                    x_dim=description['x_dim'],
+                    y_dim=description['y_dim'],
+                    defocus=-rng.uniform(0.8e-6, 2.5e-6),
+                    dose=50 * 1e20,
+                    shift_x=rng.uniform(-0.1, 0.1),
+                    shift_y=rng.uniform(-0.1, 0.1),
+                    tilt_x=rng.uniform(-0.01, 0.01),
+                    tilt_y=rng.uniform(-0.01, 0.01),
+                    stage_x=rng.uniform(-1e-3, 1e-3),
+                    stage_y=rng.uniform(-1e-3, 1e-3),
+                    stage_z=rng.uniform(-1e-5, 1e-5),
+                    pixel_size=1.0e-10,
+                    frames=description['frames'],
+                    )
+                movie = os.path.join(frames_folder, '{0}{1}.{2}'.format(root_name, suffix, description['extension']))
+                write_movie(movie, description['x_dim'], description['y_dim'], description['frames'], chunk)
+                with open(os.path.join(frames_folder, '{0}{1}.xml'.format(root_name, suffix)), 'w') as write:
+                    write.write(xml)
+                with open(os.path.join(jpg_folder, '{0}.xml'.format(root_name)), 'w') as write:
+                    write.write(xml)
+                # The jpg triggers the Find process, so it is written last
+                shutil.copyfile(jpg_file, os.path.join(jpg_folder, '.{0}.jpg'.format(root_name)))
+                os.replace(
+                    os.path.join(jpg_folder, '.{0}.jpg'.format(root_name)),
+                    os.path.join(jpg_folder, '{0}.jpg'.format(root_name)),
+                    )
+
+            write_log.write('{0}\n'.format(json.dumps({'root_name': root_name, 'time': time.time()})))
+            write_log.flush()
+            if (idx + 1) % 10 == 0:
+                log('Generated {0}/{1} movies'.format(idx + 1, number))
+    return number
+
+
+def command_generate(args):
+    """
+    Write a synthetic microscope session.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    description = write_session(args)
+    start = time.time()
+    written = generate_movies(description, args.number, args.rate, os.path.abspath(args.output), args.shots, args.holes)
+    run_time = time.time() - start
+    print_result('Movies', written, '')
+    print_result('Rate', written / run_time * 60 if run_time else 0, 'movies/min')
+
+
+def command_mocks(args):
+    """
+    Write the wrapper scripts of the mock programs.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    delays = dict(MOCK_DELAYS)
+    for entry in args.delay:
+        kind, value = entry.split('=')
+        if kind not in delays:
+            raise ValueError('Unknown mock {0}! Choose from: {1}'.format(kind, ', '.join(sorted(delays))))
+        delays[kind] = float(value)
+
+    names = dict([(kind, [name]) for kind, name in MOCK_NAMES.items()])
+    if args.settings:
+        with open(args.settings, 'r') as read:
+            paths = json.load(read)['Path']
+        for key, value in paths.items():
+            for prefix, kind in MOCK_PREFIX.items():
+                if key.startswith(prefix) and value and os.path.basename(value) not in names[kind]:
+                    names[kind].append(os.path.basename(value))
+
+    package = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.makedirs(args.bin, exist_ok=True)
+    for kind, kind_names in sorted(names.items()):
+        for name in kind_names:
+            file_name = os.path.join(args.bin, name)
+            with open(file_name, 'w') as write:
+                write.write(MOCK_WRAPPER.format(
+                    kind=kind,
+                    delay=delays[kind],
+                    jitter=args.jitter,
+                    package=package,
+                    python=sys.executable,
+                    ))
+            os.chmod(file_name, os.stat(file_name).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+            print('{0:<20s} {1:>8.2f} s {2}'.format(kind, delays[kind], file_name))
+
+
+def parse_options(arguments):
+    """
+    Split a command line into option -> values.
+
+    Arguments:
+    arguments - List of arguments
+
+    Return:
+    Dictionary option -> list of values, list of positional arguments
+    """
+    options = {}
+    positional = []
+    key = None
+    for entry in arguments:
+        if re.match(r'^--?[A-Za-z_]', entry):
+            if '=' in entry and entry.startswith('--'):
+                key, value = entry.split('=', 1)
+                options[key] = [value]
+                key = None
+            else:
+                key = entry
+                options[key] = []
+        elif key is not None:
+            options[key].append(entry)
+        else:
+            positional.append(entry)
+    return options, positional
+
+
+def get_option(options, key, default):
+    try:
+        return options[key][0]
+    except (KeyError, IndexError):
+        return default
+
+
+def mock_delay(seed):
+    delay = float(os.environ.get('TRANSPHIRE_MOCK_DELAY', 0))
+    jitter = float(os.environ.get('TRANSPHIRE_MOCK_JITTER', 0))
+    if delay > 0:
+        time.sleep(max(0, delay * (1 + random.Random(seed).uniform(-jitter, jitter))))
+
+
+def mock_motioncor2(arguments):
+    options, _ = parse_options(arguments)
+    file_input = None
+    for key in ('-InMrc', '-InTiff', '-InEer'):
+        if key in options:
+            file_input = options[key][0]
+    file_output = options['-OutMrc'][0]
+    file_log = options['-LogFile'][0]
+    x_dim, y_dim, z_dim = read_dimensions(file_input, (4096, 4096, 40))
+    z_dim = max(z_dim, 2)
+    seed = get_seed(os.path.basename(file_output))
+    mock_delay(seed)
+
+    binning = float(get_option(options, '-FtBin', 1))
+    shape = (max(1, int(y_dim / binning)), max(1, int(x_dim / binning)))
+    root_name = os.path.splitext(file_output)[0]
+    write_mrc_image(file_output, shape, seed)
+    do_dw = all(
+        float(get_option(options, key, 0)) != 0
+        for key in ('-FmDose', '-PixSize', '-kV')
+        )
+    if do_dw:
+        write_mrc_image('{0}_DW.mrc'.format(root_name), shape, seed + 1)
+    if get_option(options, '-OutStack', '0') == '1':
+        write_mrc_image('{0}_Stk.mrc'.format(root_name), (z_dim, shape[0] // 4, shape[1] // 4), seed + 2)
+
+    rng = np.random.RandomState(seed)
+    shifts = np.cumsum(rng.normal(scale=0.5, size=(z_dim, 2)), axis=0)
+    shifts -= shifts[z_dim // 2]
+    with open('{0}0-Full.log'.format(file_log), 'w') as write:
+        write.write('# full-frame alignment\n')
+        write.write('# Pixel size: {0}\n'.format(get_option(options, '-PixSize', 1)))
+        write.write('# Number of patches: 0\n')
+        write.write('# Frame    x Shft    y Shft\n')
+        for idx, (shift_x, shift_y) in enumerate(shifts):
+            write.write('{0:6d} {1:9.2f} {2:9.2f}\n'.format(idx + 1, shift_x, shift_y))
+
+    print('MotionCor2 mock')
+    print('Input file: {0}'.format(file_input))
+    print('Number of frames: {0}'.format(z_dim))
+    print('Full-frame alignment shift')
+    for idx, (shift_x, shift_y) in enumerate(shifts):
+        print('...... Frame ({0:3d}) shift: {1:9.3f} {2:9.3f}'.format(idx + 1, shift_x, shift_y))
+    print('Computational time: {0:.6f} sec'.format(float(os.environ.get('TRANSPHIRE_MOCK_DELAY', 0))))
+
+
+def mock_ctffind(arguments):
+    lines = [line.strip() for line in sys.stdin.read().splitlines()]
+    file_input = lines[0]
+    idx_output = 3 if lines[1] == 'yes' else 1
+    file_output = lines[idx_output]
+    pixel_size, voltage, cs, amp_contrast, spectrum, min_res, max_res, min_def, max_def = \
+        [float(entry) for entry in lines[idx_output+1:idx_output+10]]
+    seed = get_seed(os.path.basename(file_output))
+    mock_delay(seed)
+
+    rng = random.Random(seed)
+    root_name = os.path.splitext(file_output)[0]
+    spectrum = int(spectrum)
+    write_mrc_image(file_output, (spectrum, spectrum), seed)
+
+    defocus = rng.uniform(min_def + 0.2 * (max_def - min_def), min_def + 0.5 * (max_def - min_def))
+    astigmatism = rng.uniform(0, 0.05 * defocus)
+    with open('{0}.txt'.format(root_name), 'w') as write:
+        write.write('# Output from CTFFIND version 4.1.14 (mock), run on {0}\n'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+        write.write('# Input file: {0} ; Number of micrographs: 1\n'.format(file_input))
+        write.write('# Pixel size: {0:.3f} Angstroms ; acceleration voltage: {1:.1f} keV ; spherical aberration: {2:.2f} mm ; amplitude contrast: {3:.2f}\n'.format(pixel_size, voltage, cs, amp_contrast))
+        write.write('# Box size: {0} pixels ; min. res.: {1:.1f} Angstroms ; max. res.: {2:.1f} Angstroms ; min. def.: {3:.1f} um; max. def. {4:.1f} um\n'.format(spectrum, min_res, max_res, min_def, max_def))
+        write.write('# Columns: #1 - micrograph number; #2 - defocus 1 [Angstroms]; #3 - defocus 2; #4 - azimuth of astigmatism; #5 - additional phase shift [radians]; #6 - cross correlation; #7 - spacing (in Angstroms) up to which CTF rings were fit successfully\n')
+        write.write('{0:.6f} {1:.6f} {2:.6f} {3:.6f} {4:.6f} {5:.6f} {6:.6f}\n'.format(
+            1, defocus + astigmatism, defocus - astigmatism, rng.uniform(-90, 90), 0, rng.uniform(0.05, 0.3), rng.uniform(2.5, 6)
+            ))
+
+    frequency = np.linspace(0, 0.5 / pixel_size, spectrum // 2)
+    ctf = np.sin(np.pi * 0.0251 * defocus * frequency**2)**2
+    with open('{0}_avrot.txt'.format(root_name), 'w') as write:
+        write.write('# Output from CTFFIND version 4.1.14 (mock)\n')
+        write.write('# 6 lines per micrograph: #1 - spatial frequency (1/Angstroms); #2 - 1D rotational average of spectrum (assuming no astigmatism); #3 - 1D rotational average of spectrum; #4 - CTF fit; #5 - cross-correlation between spectrum and CTF fit; #6 - 2sigma of expected cross correlation of noise\n')
+        for row in (frequency, ctf, ctf, ctf, np.ones_like(ctf) * 0.5, np.ones_like(ctf) * 0.1):
+            write.write('{0}\n'.format(' '.join('{0:.6f}'.format(value) for value in row)))
+
+    print('        **   Welcome to Ctffind (mock)   **')
+    print('Estimated defocus values        : {0:.2f} , {1:.2f} Angstroms'.format(defocus + astigmatism, defocus - astigmatism))
+
+
+def mock_cryolo(arguments):
+    options, _ = parse_options(arguments)
+    files_input = options['-i']
+    output_dir = options['-o'][0]
+    particles = int(os.environ.get('TRANSPHIRE_MOCK_PARTICLES', 150))
+    box_size = int(os.environ.get('TRANSPHIRE_MOCK_BOX', 200))
+    mock_delay(get_seed(' '.join(files_input)))
+
+    for folder in ('CBOX', 'EMAN', 'STAR'):
+        os.makedirs(os.path.join(output_dir, folder), exist_ok=True)
+    for file_input in files_input:
+        root_name = os.path.splitext(os.path.basename(file_input))[0]
+        x_dim, y_dim, _ = read_dimensions(file_input)
+        rng = np.random.RandomState(get_seed(root_name))
+        number = max(0, int(rng.normal(particles, particles * 0.2)))
+        coords = np.column_stack([
+            rng.uniform(0, max(1, x_dim - box_size), number),
+            rng.uniform(0, max(1, y_dim - box_size), number),
+            ])
+        confidence = rng.uniform(0.3, 1, number)
+        with open(os.path.join(output_dir, 'CBOX', '{0}.cbox'.format(root_name)), 'w') as write:
+            for (coord_x, coord_y), value in zip(coords, confidence):
+                write.write('{0:.0f}\t{1:.0f}\t{2}\t{2}\t{3:.4f}\t{4:.0f}\t{4:.0f}\n'.format(coord_x, coord_y, box_size, value, box_size * 0.9))
+        with open(os.path.join(output_dir, 'EMAN', '{0}.box'.format(root_name)), 'w') as write:
+            for coord_x, coord_y in coords:
+                write.write('{0:.0f}\t{1:.0f}\t{2}\t{2}\n'.format(coord_x, coord_y, box_size))
+        with open(os.path.join(output_dir, 'STAR', '{0}.star'.format(root_name)), 'w') as write:
+            write.write('\ndata_\n\nloop_\n_rlnCoordinateX #1\n_rlnCoordinateY #2\n')
+            for coord_x, coord_y in coords:
+                write.write('{0:.1f}\t{1:.1f}\n'.format(coord_x + box_size / 2, coord_y + box_size / 2))
+        print('{0}: {1} particles'.format(root_name, number))
+    # crYOLO writes the TensorFlow messages to stderr
+    sys.stderr.write('Using TensorFlow backend (mock).\n')
+    print('Picking done (mock)')
+
+
+def bdb_file(name):
+    """
+    File of a bdb:<folder>/<name> path.
+
+    Arguments:
+    name - bdb path
+
+    Return:
+    File name
+    """
+    path = name[len('bdb:'):]
+    return os.path.join(os.path.dirname(path), 'EMAN2DB', '{0}.bdb'.format(os.path.basename(path)))
+
+
+def read_bdb(name):
+    try:
+        with open(bdb_file(name), 'r') as read:
+            return int(read.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def write_bdb(name, number):
+    file_name = bdb_file(name)
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name, 'w') as write:
+        write.write('{0}\n'.format(number))
+
+
+def mock_window(arguments):
+    options, positional = parse_options(arguments)
+    _, boxes, _, output_dir = positional[:4]
+    selection = options['--selection_list'][0]
+    box_size = int(get_option(options, '--box_size', 256))
+    mic_name = os.path.splitext(os.path.basename(selection))[0]
+    box_file = boxes.replace('*', mic_name)
+    try:
+        with open(box_file, 'r') as read:
+            number = len([line for line in read if line.strip()])
+    except OSError:
+        number = 0
+    mock_delay(get_seed(mic_name))
+
+    rejected = number // 20
+    processed = number - rejected
+    file_name = os.path.basename(output_dir.rstrip('/'))
+    os.makedirs(output_dir, exist_ok=True)
+    write_mrc_image(
+        os.path.join(output_dir, '{0}_ptcls.mrcs'.format(file_name)),
+        (max(1, processed), box_size, box_size),
+        get_seed(mic_name),
+        )
+    write_bdb('bdb:{0}'.format(os.path.join(output_dir, '{0}_ptcls'.format(file_name))), processed)
+
+    print('Micrograph summary:')
+    print('Processed : {0}'.format(processed))
+    print('Rejected by out of boundary : {0}'.format(rejected))
+    print('')
+    print('Global summary:')
+    print('Processed : {0}'.format(processed))
+    print('Rejected by out of boundary : {0}'.format(rejected))
+
+
+def mock_isac(arguments):
+    options, positional = parse_options(arguments)
+    stack, output_dir = positional[:2]
+    number = read_bdb(stack)
+    mock_delay(get_seed(output_dir))
+
+    os.makedirs(output_dir, exist_ok=True)
+    accepted = int(number * 0.8)
+    with open(os.path.join(output_dir, 'processed_images.txt'), 'w') as write:
+        write.write(''.join('{0}\n'.format(idx) for idx in range(accepted)))
+    with open(os.path.join(output_dir, 'not_processed_images.txt'), 'w') as write:
+        write.write(''.join('{0}\n'.format(idx) for idx in range(accepted, number)))
+    images_per_group = int(get_option(options, '--img_per_grp', 100))
+    classes = max(1, accepted // max(1, images_per_group))
+    write_mrc_image(os.path.join(output_dir, 'ordered_class_averages.hdf'), (classes, 76, 76), get_seed(output_dir))
+    print('ISAC2 (mock): {0} particles, {1} accepted, {2} classes'.format(number, accepted, classes))
+
+
+def mock_e2proc2d(arguments):
+    options, positional = parse_options(arguments)
+    file_input, file_output = positional[:2]
+    x_dim, y_dim, z_dim = read_dimensions(file_input)
+    if os.path.splitext(file_output)[-1].lower() != '.png':
+        shutil.copyfile(file_input, file_output)
+        return
+
+    shrink = max(1, int(float(get_option(options, '--meanshrink', 1))))
+    shape = (max(4, y_dim // shrink), max(4, x_dim // shrink))
+    if '--unstacking' in options:
+        root_name, extension = os.path.splitext(file_output)
+        for idx in range(z_dim):
+            write_png('{0}-{1:03d}{2}'.format(root_name, idx + 1, extension), shape, idx)
+    else:
+        write_png(file_output, shape, get_seed(file_output))
+
+
+def mock_e2bdb(arguments):
+    options, positional = parse_options(arguments)
+    number = sum(read_bdb(entry) for entry in positional if entry.startswith('bdb:'))
+    write_bdb(options['--makevstack'][0], number)
+    print('{0} particles'.format(number))
+
+
+def mock_mpirun(arguments):
+    while arguments and arguments[0].startswith('-'):
+        if arguments[0] in ('-np', '-n', '--np', '-H', '--host', '-hostfile', '--hostfile', '-x'):
+            arguments = arguments[2:]
+        else:
+            arguments = arguments[1:]
+    os.execvp(arguments[0], arguments)
+
+
+def mock_header(arguments):
+    _, positional = parse_options(arguments)
+    x_dim, y_dim, z_dim = read_dimensions(positional[0])
+    print(' Number of columns, rows, sections ..... {0:8d}{1:8d}{2:8d}'.format(x_dim, y_dim, z_dim))
+
+
+MOCKS = {
+    'motioncor2': mock_motioncor2,
+    'ctffind': mock_ctffind,
+    'cryolo': mock_cryolo,
+    'window': mock_window,
+    'isac': mock_isac,
+    'e2proc2d': mock_e2proc2d,
+    'e2bdb': mock_e2bdb,
+    'mpirun': mock_mpirun,
+    'header': mock_header,
+    }
+
+
+def command_mock(args):
+    """
+    Run a mock program.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    MOCKS[args.kind](args.arguments)
+
+
+def read_items(file_name):
+    """
+    Read the finished items of the metrics_items.jsonl file.
+
+    Arguments:
+    file_name - metrics_items.jsonl file
+
+    Return:
+    List of item dictionaries
+    """
+    items = []
+    try:
+        with open(file_name, 'r') as read:
+            for line in read:
+                try:
+                    items.append(json.loads(line))
+                except ValueError:
+                    # Partially written line
+                    pass
+    except FileNotFoundError:
+        pass
+    return items
+
+
+def read_translation(file_name):
+    """
+    New name -> root name of the translation file.
+
+    Arguments:
+    file_name - Valid_micrographs_info.txt
+
+    Return:
+    Dictionary
+    """
+    names = {}
+    try:
+        with open(file_name, 'r') as read:
+            for line in read:
+                columns = line.split()
+                if len(columns) < 2 or columns[0].startswith('_') or columns[0] in ('data_transphire', 'loop_'):
+                    continue
+                names[os.path.basename(columns[1])] = columns[0]
+    except FileNotFoundError:
+        pass
+    return names
+
+
+def get_movie_name(root_name, generated, translation):
+    """
+    Movie of a queue item.
+
+    Arguments:
+    root_name - Root name of the item
+    generated - Dictionary movie name -> creation time
+    translation - Dictionary new name -> movie name
+
+    Return:
+    Movie name or None
+    """
+    for entry in re.split(r'\|\|\||;;;|\s+', root_name):
+        name = os.path.basename(entry)
+        while True:
+            if name in generated:
+                return name
+            elif name in translation:
+                return translation[name]
+            stripped = re.sub(r'(_DW|_Fractions|_fractions|_partres|_ptcls)?(\.[^.]*)?$', '', name, count=1)
+            if stripped == name or not stripped:
+                break
+            name = stripped
+    return None
+
+
+def print_report(items, generated, translation, run_time):
+    """
+    Throughput and latency per stage.
+
+    Arguments:
+    items - Finished items of metrics_items.jsonl
+    generated - Dictionary movie name -> creation time
+    translation - Dictionary new name -> movie name
+    run_time - Run time of the benchmark
+
+    Return:
+    None
+    """
+    from .. import transphire_metrics as tmet
+
+    stages = {}
+    for item in items:
+        stages.setdefault(item['stage'], []).append(item)
+
+    print('')
+    print_result('Movies generated', len(generated), '')
+    print_result('Run time', run_time, 's')
+    if generated:
+        print_result('Generation rate', len(generated) / max(1e-9, max(generated.values()) - min(generated.values()) or 1e-9) * 60, 'movies/min')
+    print('')
+    print('{0:<14s} {1:>6s} {2:>6s} {3:>10s} {4:>9s} {5:>9s} {6:>9s} {7:>9s} {8:>9s} {9:>9s}'.format(
+        'Stage', 'ok', 'error', 'items/min', 'wait p50', 'wait p95', 'run p50', 'run p95', 'age p50', 'age p95'
+        ))
+    # Pipeline order
+    for stage, stage_items in sorted(stages.items(), key=lambda entry: min(item['enqueue'] or item['end'] for item in entry[1])):
+        ok = [item for item in stage_items if item['status'] == 'ok']
+        wait = sorted(item['dequeue'] - item['enqueue'] for item in ok if item['dequeue'] is not None and item['enqueue'] is not None)
+        run = sorted(item['end'] - item['start'] for item in ok if item['start'] is not None)
+        age = []
+        for item in ok:
+            movie = get_movie_name(item['root_name'], generated, translation)
+            if movie is not None:
+                age.append(item['end'] - generated[movie])
+        age.sort()
+        if len(ok) > 1:
+            first = min(item['start'] or item['end'] for item in ok)
+            last = max(item['end'] for item in ok)
+            throughput = len(ok) / max(1e-9, last - first) * 60
+        else:
+            throughput = 0
+
+        values = []
+        for data in (wait, run, age):
+            for quantile in (0.5, 0.95):
+                value = tmet.percentile(data, quantile)
+                values.append('{0:9.2f}'.format(value) if value is not None else '{0:>9s}'.format('-'))
+        print('{0:<14s} {1:>6d} {2:>6d} {3:>10.2f} {4}'.format(
+            stage, len(ok), len(stage_items) - len(ok), throughput, ' '.join(values)
+            ))
+    print('')
+    print('wait: queue wait time, run: processing time, age: time since the movie was written (s)')
+
+
+def command_run(args):
+    """
+    Run the real ProcessWorker on a synthetic microscope with mock programs
+    and report the throughput and latency per stage.
+
+    Arguments:
+    args - Parsed command line arguments
+
+    Return:
+    None
+    """
+    # Matplotlib and the worker need a QApplication, also without a display
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    from .. import transphire_daemon as td
+    from .. import transphire_utils as tu
+    from ..processworker import ProcessWorker
+
+    with open(args.settings, 'r') as read:
+        settings = json.load(read)
+
+    description = write_session(args)
+    project = os.path.abspath(args.project)
+    settings['Monitor'] = False
+    settings['Output']['Project directory'] = project
+    settings['Output']['Project name'] = args.name
+    settings['Output']['Scratch directory'] = os.path.abspath(args.scratch) if args.scratch else project
+    settings['Output']['Number of feedbacks'] = '0'
+    settings['Output']['Metrics interval'] = str(args.metrics_interval)
+    settings['Input']['Software'] = description['software']
+    settings['Input']['Camera'] = description['camera']
+    settings['Input']['Type'] = description['type']
+    settings['Input']['Input frames extension'] = description['extension']
+    settings['Input']['Number of frames'] = str(description['frames'])
+    settings['Input']['Input project path for frames'] = description['frames_folder']
+    settings['Input']['Input project path for jpg'] = description['jpg_folder']
+    for copy_name in ('work', 'backup', 'hdd'):
+        settings['Copy']['Copy to {0}'.format(copy_name)] = 'False'
+    if args.import_mode is not None:
+        settings['Copy']['Delete data after import?'] = args.import_mode
+    for entry in args.set:
+        # Section names might contain a =, e.g. ISAC2 >=v1.2
+        section, entry = entry.split(':', 1)
+        name, value = entry.split('=', 1)
+        settings[section][name] = value
+
+    bin_folder = os.path.abspath(args.bin)
+    for key, value in settings['Path'].items():
+        if not value:
+            continue
+        mock_file = os.path.join(bin_folder, os.path.basename(value))
+        if os.path.isfile(mock_file):
+            settings['Path'][key] = mock_file
+    os.environ['PATH'] = '{0}:{1}'.format(bin_folder, os.environ.get('PATH', ''))
+
+    restart_dict = td.prepare_settings(settings, project, continue_run=True)
+
+    worker = ProcessWorker(
+        password='',
+        content_process=tu.get_content_pipeline(settings['Pipeline']),
+        mount_directory=project,
+        )
+    worker.sig_error.connect(lambda text: print('ERROR: {0}'.format(text)) if not text.startswith('NEW SESSION') else None)
+    worker.sig_notification.connect(lambda text: print('NOTIFICATION: {0}'.format(text)))
+
+    stop_generator = threading.Event()
+    generator = threading.Thread(
+        target=generate_movies,
+        args=(description, args.number, args.rate, os.path.abspath(args.output)),
+        kwargs={'shots': args.shots, 'holes': args.holes, 'stop': stop_generator},
+        daemon=True,
+        )
+    pipeline = threading.Thread(target=worker.run, args=(settings, restart_dict), daemon=True)
+
+    items_file = os.path.join(settings['log_folder'], 'metrics_items.jsonl')
+    start = time.time()
+    pipeline.start()
+    generator.start()
+    last_count = 0
+    last_change = time.time()
+    while True:
+        time.sleep(1)
+        app.processEvents()
+        count = len(read_items(items_file))
+        if count != last_count:
+            last_count = count
+            last_change = time.time()
+        if not pipeline.is_alive():
+            print('ProcessWorker stopped, check the error folder: {0}'.format(settings['error_folder']))
+            break
+        elif time.time() - start > args.timeout:
+            print('Timeout after {0} s'.format(args.timeout))
+            break
+        elif not generator.is_alive() and time.time() - last_change > args.idle:
+            break
+
+    stop_generator.set()
+    run_time = time.time() - start
+    worker.stop = True
+    pipeline.join()
+    app.processEvents()
+
+    generated = {}
+    with open(os.path.join(os.path.abspath(args.output), GENERATED_FILE), 'r') as read:
+        for line in read:
+            entry = json.loads(line)
+            if entry['time'] >= start:
+                generated[entry['root_name']] = entry['time']
+    print_report(
+        read_items(items_file),
+        generated,
+        read_translation(settings['translation_file']),
+        run_time,
+        )
+    print('Project folder: {0}'.format(settings['project_folder']))
+
+
+def add_microscope_arguments(parser):
+    parser.add_argument('--output', required=True, help='Output folder of the synthetic microscope')
+    parser.add_argument('--software', default='EPU >=1.9', choices=['EPU >=1.9', 'Just Stack'], help='Folder layout')
+    parser.add_argument('--camera', default='Falcon3', choices=['Falcon3', 'K3'], help='Camera, decides about the _Fractions/_fractions suffix')
+    parser.add_argument('--extension', default='mrc', choices=['mrc', 'tiff'], help='Movie format')
+    parser.add_argument('--size', type=int, nargs=2, default=[1024, 1024], help='Movie width and height')
+    parser.add_argument('--frames', type=int, default=20, help='Number of frames per movie')
+    parser.add_argument('--number', type=int, default=50, help='Number of movies')
+    parser.add_argument('--rate', type=float, default=30, help='Movies per minute, 0 for as fast as possible')
+    parser.add_argument('--shots', type=int, default=4, help='Shots per hole')
+    parser.add_argument('--holes', type=int, default=16, help='Holes per grid square')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TranSPHIRE end-to-end pipeline benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    parser_generate = subparsers.add_parser('generate', help='Write a synthetic EPU or stack session')
+    add_microscope_arguments(parser_generate)
+    parser_generate.set_defaults(func=command_generate)
+
+    parser_mocks = subparsers.add_parser('mocks', help='Write the mock programs')
+    parser_mocks.add_argument('--bin', required=True, help='Output folder of the mock programs')
+    parser_mocks.add_argument('--settings', default=None, help='Settings file, the mocks are named like the programs in its Path section')
+    parser_mocks.add_argument('--delay', action='append', default=[], help='Run time of a mock in seconds, e.g. motioncor2=2.5, can be repeated')
+    parser_mocks.add_argument('--jitter', type=float, default=0.2, help='Random relative variation of the run times')
+    parser_mocks.set_defaults(func=command_mocks)
+
+    parser_mock = subparsers.add_parser('mock', help='Run a mock program, used by the wrapper scripts')
+    parser_mock.add_argument('kind', choices=sorted(MOCKS), help='Mock program')
+    parser_mock.add_argument('arguments', nargs=argparse.REMAINDER, help='Arguments of the program')
+    parser_mock.set_defaults(func=command_mock)
+
+    parser_run = subparsers.add_parser('run', help='Run the ProcessWorker on a synthetic microscope')
+    add_microscope_arguments(parser_run)
+    parser_run.add_argument('--settings', required=True, help='used_settings.json of a previous session')
+    parser_run.add_argument('--project', required=True, help='Project directory')
+    parser_run.add_argument('--name', default='Benchmark', help='Project name')
+    parser_run.add_argument('--scratch', default=None, help='Scratch directory, default project directory')
+    parser_run.add_argument('--bin', required=True, help='Folder of the mock programs')
+    parser_run.add_argument('--import-mode', default=None, choices=['False', 'True', 'Symlink'], help='Delete data after import? setting, default from the settings file')
+    parser_run.add_argument('--set', action='append', default=[], help='Override a setting, Section:Name=Value, e.g. Copy:Class2d=False, can be repeated')
+    parser_run.add_argument('--metrics-interval', type=float, default=5, help='Metrics export interval in seconds')
+    parser_run.add_argument('--idle', type=float, default=60, help='Stop after all movies are written and no item finished for this time in seconds')
+    parser_run.add_argument('--timeout', type=float, default=3600, help='Maximum run time in seconds')
+    parser_run.set_defaults(func=command_run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
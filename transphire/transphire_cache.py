@@ -0,0 +1,166 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import pickle
+
+
+PARSE_CACHE_VERSION = 1
+
+
+class ParseCache(object):
+    """
+    Persistent cache for parsed output files of the import functions.
+
+    Parse results are keyed by (path, size, mtime) and stored in a pickle side
+    file, so a plot round only parses files that are new or changed since the
+    last round. Failed parses are not cached and raise again on the next call.
+    The side file is replaced atomically and a broken or outdated side file is
+    ignored, so the worst case is parsing everything again.
+    """
+
+    def __init__(self, file_name, tag='', enabled=True):
+        """
+        Initialize object variables.
+
+        Arguments:
+        file_name - Side file to store the cache
+        tag - Cache is discarded if the tag changes, e.g. the dtype used for parsing
+        enabled - If False, every call parses the file directly
+
+        Return:
+        None
+        """
+        super(ParseCache, self).__init__()
+        self.file_name = file_name
+        self.tag = tag
+        self.enabled = enabled
+        self.content = {}
+        self.used = set()
+        self.changed = False
+        self.hits = 0
+        self.misses = 0
+        if self.enabled:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.file_name, 'rb') as read:
+                version, tag, content = pickle.load(read)
+        except FileNotFoundError:
+            return
+        except Exception:
+            # Broken side file, e.g. by a crash: Start from scratch
+            self.changed = True
+            return
+
+        if version == PARSE_CACHE_VERSION and tag == self.tag:
+            self.content = content
+        else:
+            self.changed = True
+
+    def get(self, file_name, function, *args, **kwargs):
+        """
+        Return the parsed content of a file.
+
+        Arguments:
+        file_name - File to parse
+        function - Parse function, called with file_name, *args, **kwargs
+
+        Return:
+        Return value of the parse function
+        """
+        if not self.enabled:
+            return function(file_name, *args, **kwargs)
+
+        stat = os.stat(file_name)
+        key = (stat.st_size, stat.st_mtime_ns)
+        self.used.add(file_name)
+        try:
+            cache_key, value = self.content[file_name]
+        except KeyError:
+            pass
+        else:
+            if cache_key == key:
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        value = function(file_name, *args, **kwargs)
+        self.content[file_name] = (key, value)
+        self.changed = True
+        return value
+
+    def save(self):
+        """
+        Write the cache to the side file.
+        Entries of files that have not been requested since the load are dropped.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        if not self.enabled:
+            return
+
+        for file_name in set(self.content) - self.used:
+            del self.content[file_name]
+            self.changed = True
+
+        if not self.changed:
+            return
+
+        temp_file = '{0}.{1}.tmp'.format(self.file_name, os.getpid())
+        try:
+            with open(temp_file, 'wb') as write:
+                pickle.dump(
+                    (PARSE_CACHE_VERSION, self.tag, self.content),
+                    write,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                    )
+            os.replace(temp_file, self.file_name)
+        except OSError:
+            # Read-only or full output directory: Keep working without the side file
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+        else:
+            self.changed = False
+
+
+def get_parse_cache(directory_name, name, tag='', import_name=''):
+    """
+    Create the parse cache of an import function.
+    Imports of a single file do not use the cache to avoid loading the side file.
+
+    Arguments:
+    directory_name - Directory of the imported files
+    name - Name of the import function
+    tag - Cache is discarded if the tag changes
+    import_name - Import name passed to the import function
+
+    Return:
+    ParseCache object
+    """
+    return ParseCache(
+        os.path.join(directory_name, '.{0}_cache.pkl'.format(name)),
+        tag=tag,
+        enabled=not import_name and os.path.isdir(directory_name),
+        )
@@ -0,0 +1,400 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import concurrent.futures
+import io
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+
+from . import transphire_utils as tu
+from . import transphire_metrics as tmetrics
+
+
+COMBINE_TIMEOUT = 120
+# A waiting sender gives up after COMBINE_TIMEOUT, long before the slot of
+# its ticket is used again
+ACKNOWLEDGE_SLOTS = 65536
+
+
+def read_fragment(file_name):
+    with open(file_name, 'r') as read:
+        return read.read()
+
+
+def get_lines(text, full):
+    """
+    Lines of a fragment that are added to the combined file.
+
+    Arguments:
+    text - Content of the per micrograph file
+    full - Use the full content including the header
+
+    Return:
+    Text to append
+    """
+    if full:
+        return text
+    else:
+        return io.StringIO(text).readlines()[-1]
+
+
+@tu.rerun_function_in_case_of_error
+def write_file(file_name, opener, content):
+    with open(file_name, opener) as write:
+        write.write(content)
+
+
+def regenerate_combined_file(out_file, index_file):
+    """
+    Create a combined file from the per micrograph files in the index file.
+    The header is taken from the first per micrograph file and every
+    per micrograph file is used once.
+
+    Arguments:
+    out_file - Combined file to create
+    index_file - File with one per micrograph file per line
+
+    Return:
+    Number of used files, list of missing files
+    """
+    with open(index_file, 'r') as read:
+        fragments = list(collections.OrderedDict.fromkeys([
+            line.strip() for line in read.readlines() if line.strip()
+            ]))
+
+    parts = []
+    missing = []
+    for fragment in fragments:
+        try:
+            text = read_fragment(fragment)
+        except FileNotFoundError:
+            missing.append(fragment)
+            continue
+        if text:
+            parts.append(get_lines(text, not parts))
+
+    temp_file = '{0}.tmp'.format(out_file)
+    write_file(temp_file, 'w', ''.join(parts))
+    os.replace(temp_file, out_file)
+    return len(parts), missing
+
+
+class CombineSender(object):
+    """
+    Send the per micrograph files to the CombineWriter of the ProcessWorker.
+    The call returns after the rows are written, so the combined file can be
+    distributed afterwards.
+    Every message has a ticket and the writer marks every written ticket
+    separately, so a late or lost message does not hold back the others.
+    """
+
+    def __init__(self, queue, timeout=COMBINE_TIMEOUT):
+        """
+        Initialize object variables.
+
+        Arguments:
+        queue - multiprocessing.Queue that is read by the writer
+        timeout - Maximum time in seconds to wait for the writer
+
+        Return:
+        None
+        """
+        super(CombineSender, self).__init__()
+        self.queue = queue
+        self.timeout = timeout
+        self.tickets = mp.Value('q', 0)
+        self.written = mp.Array('q', ACKNOWLEDGE_SLOTS, lock=False)
+        self.condition = mp.Condition()
+
+    def get_ticket(self):
+        with self.tickets.get_lock():
+            self.tickets.value += 1
+            return self.tickets.value
+
+    def is_written(self, ticket):
+        return self.written[ticket % ACKNOWLEDGE_SLOTS] == ticket
+
+    def put(self, kind, ticket, items):
+        self.queue.put((kind, ticket, time.time(), items))
+
+    def wait(self, ticket, start):
+        """
+        Wait until the rows of a ticket are written.
+
+        Arguments:
+        ticket - Ticket of the message
+        start - Time the message was sent
+
+        Return:
+        True if written in time, wait time in seconds
+        """
+        with self.condition:
+            is_written = self.condition.wait_for(lambda: self.is_written(ticket), self.timeout)
+        return is_written, time.time() - start
+
+    def send(self, kind, items):
+        ticket = self.get_ticket()
+        start = time.time()
+        self.put(kind, ticket, items)
+        return self.wait(ticket, start)
+
+    def combine(self, combine_list):
+        """
+        Append the rows of per micrograph files to the combined files.
+
+        Arguments:
+        combine_list - List of [per micrograph file, combined file]
+
+        Return:
+        True if written in time, wait time in seconds
+        """
+        items = [
+            (out_file, in_file, read_fragment(in_file))
+            for in_file, out_file in combine_list
+            ]
+        return self.send('combine', items)
+
+    def regenerate(self, out_files):
+        """
+        Regenerate combined files from their per micrograph files.
+
+        Arguments:
+        out_files - List of combined files
+
+        Return:
+        True if written in time, wait time in seconds
+        """
+        return self.send('regenerate', list(out_files))
+
+
+class CombineWriter(object):
+    """
+    Single owner of the combined star and partres files.
+
+    The processes send the content of their per micrograph files and the
+    writer appends everything that arrived in the meantime with one write
+    per combined file. Different combined files are written at the same
+    time by a thread pool, every file by exactly one thread. The header is
+    only written if the combined file does not exist yet, like before with
+    one locked append per micrograph.
+    The used per micrograph files are listed in an index file per combined
+    file, so a missing combined file is created again on start.
+    """
+
+    def __init__(self, sender, index_folder, combine_folder, max_samples=10000):
+        """
+        Initialize object variables.
+
+        Arguments:
+        sender - CombineSender used by the processes
+        index_folder - Folder for the index files
+        combine_folder - Folder of the combined files
+        max_samples - Number of latencies used for the percentiles
+
+        Return:
+        None
+        """
+        super(CombineWriter, self).__init__()
+        self.sender = sender
+        self.index_folder = index_folder
+        self.combine_folder = combine_folder
+        self.thread = None
+        self.pool = None
+
+        self.nr_items = 0
+        self.nr_batches = 0
+        self.max_batch = 0
+        self.write_time = 0
+        self.latencies = collections.deque(maxlen=max_samples)
+        self.errors = []
+        self.regenerated = []
+
+    def get_index_file(self, out_file):
+        return os.path.join(self.index_folder, os.path.basename(out_file))
+
+    def start(self):
+        tu.mkdir_p(self.index_folder)
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        self.regenerate_missing()
+        while True:
+            message = self.sender.queue.get()
+            if message is None:
+                break
+
+            # Everything that arrived during the last write goes into the same batch
+            batch = [message]
+            is_closed = False
+            while True:
+                try:
+                    message = self.sender.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is None:
+                    is_closed = True
+                    break
+                batch.append(message)
+
+            self.write_batch(batch)
+            if is_closed:
+                break
+
+    def regenerate_missing(self):
+        try:
+            index_files = os.listdir(self.index_folder)
+        except FileNotFoundError:
+            return
+        for file_name in sorted(index_files):
+            out_file = os.path.join(self.combine_folder, file_name)
+            if not os.path.exists(out_file):
+                self.regenerate(out_file)
+
+    def regenerate(self, out_file):
+        try:
+            nr_files, missing = regenerate_combined_file(out_file, self.get_index_file(out_file))
+        except FileNotFoundError:
+            self.errors.append('{0}: No index file'.format(out_file))
+        except Exception as e:
+            self.errors.append('{0}: {1}'.format(out_file, e))
+        else:
+            self.regenerated.append((out_file, nr_files, len(missing)))
+
+    def write_batch(self, batch):
+        """
+        Write the rows of a batch of messages.
+
+        Arguments:
+        batch - List of messages of the CombineSender
+
+        Return:
+        None
+        """
+        start = time.time()
+        combines = collections.OrderedDict()
+        regenerates = []
+        for kind, _, _, items in batch:
+            if kind == 'combine':
+                for out_file, in_file, text in items:
+                    combines.setdefault(out_file, []).append((in_file, text))
+            else:
+                regenerates.extend(items)
+
+        list(self.pool.map(self.append, combines.keys(), combines.values()))
+
+        for out_file in regenerates:
+            self.regenerate(out_file)
+
+        end = time.time()
+        self.write_time += end - start
+        self.nr_batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        for _, _, timestamp, items in batch:
+            self.nr_items += len(items)
+            self.latencies.append(end - timestamp)
+        self.acknowledge([message[1] for message in batch])
+
+    def append(self, out_file, entries):
+        """
+        Append the rows of per micrograph files to a combined file.
+
+        Arguments:
+        out_file - Combined file
+        entries - List of (per micrograph file, content)
+
+        Return:
+        None
+        """
+        try:
+            is_new = not os.path.exists(out_file)
+            parts = []
+            fragments = []
+            for in_file, text in entries:
+                if not text:
+                    self.errors.append('{0}: Empty file {1}'.format(out_file, in_file))
+                    continue
+                parts.append(get_lines(text, is_new and not parts))
+                fragments.append('{0}\n'.format(in_file))
+            if parts:
+                write_file(out_file, 'a+', ''.join(parts))
+                write_file(self.get_index_file(out_file), 'w' if is_new else 'a', ''.join(fragments))
+        except Exception as e:
+            self.errors.append('{0}: {1}'.format(out_file, e))
+
+    def acknowledge(self, tickets):
+        """
+        Wake up the senders of the written tickets.
+
+        Arguments:
+        tickets - List of written tickets
+
+        Return:
+        None
+        """
+        with self.sender.condition:
+            for ticket in tickets:
+                self.sender.written[ticket % ACKNOWLEDGE_SLOTS] = ticket
+            self.sender.condition.notify_all()
+
+    def close(self):
+        """
+        Write the remaining rows and stop the writer.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        if self.thread is not None:
+            self.sender.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            self.pool.shutdown()
+            self.pool = None
+
+    def get_summary(self):
+        """
+        Summary of the written rows.
+
+        Arguments:
+        None
+
+        Return:
+        Text
+        """
+        latencies = sorted(self.latencies)
+        if latencies:
+            latency = 'latency p50 {0:.1f} ms, p99 {1:.1f} ms'.format(
+                tmetrics.percentile(latencies, 0.5) * 1e3,
+                tmetrics.percentile(latencies, 0.99) * 1e3,
+                )
+        else:
+            latency = 'no latency'
+        return 'Combine writer: {0} rows in {1} batches (max {2} messages), {3:.2f} sec writing, {4}'.format(
+            self.nr_items,
+            self.nr_batches,
+            self.max_batch,
+            self.write_time,
+            latency,
+            )
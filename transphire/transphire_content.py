@@ -775,6 +775,7 @@ def default_notification():
         ['Scratch quota stop (%)', '95', float, '', 'PLAIN', 'Main', ''],
         ['Time until notification', '25', float, '', 'PLAIN', 'Main', ''],
         ['Nr. of values used for median', '5', int, '', 'PLAIN', 'Main', ''],
+        ['Median over previous micrographs', ['False', 'True'], bool, '', 'COMBO', 'Main', 'Take the median for the warnings over the last "Nr. of values used for median" micrographs of the session. By default, only the values of the current micrograph are used. Changes which warnings are sent.'],
         ]
     dtype_dict = ti.get_dtype_dict()
     skip_set = set([
@@ -1370,6 +1371,7 @@ def default_input():
         ['Input frames extension', ['mrc', 'dm4', 'tif', 'tiff'], str, '', 'COMBO', 'Main', 'Extension of the original micrograph movies.'],
         ['Number of frames', '0', int, '', 'PLAIN', 'Main', 'Expected number of frames of the input micrograph movies. This is used to verify that the micrograph movie is not corrupted. Use -1 to skip frame checking and take them as they are. Faster option and recommended for the "Just Stack" option.'],
         ['Type', ['Stack', 'Frames'], str, '', 'COMBO', 'Rare', 'Stack type used for data collection.'],
+        ['Find method', ['Auto', 'Inotify', 'Delta scan', 'Full scan'], str, '', 'COMBO', 'Rare', 'Discovery of new files. Delta scan walks the directory tree and only checks new or changed files based on a persistent index. Inotify gets notified by the kernel about new files, which does not work for files written by other hosts on network mounts. Auto uses Inotify for local file systems and Delta scan otherwise. Full scan checks every file on every search.'],
         ]
     return items
 
@@ -1396,6 +1398,14 @@ def default_general():
         ['Start number', '0', int, 'Rename micrographs:True', 'PLAIN', 'Rare', 'First number to use for the renaming process.'],
         ['Estimated mic number', '10000', int, 'Rename micrographs:True', 'PLAIN', 'Rare', 'Estimated number of micrographs. This is used for the leading number of zeros in the renamed start number.'],
         ['Number of feedbacks', '5', int, '', 'PLAIN', 'Rare', 'Number of iterations to re-train crYOLO in an ISAC feedback loop. The feedback loop will use the ISAC output and do a crYOLO retrain with sparse picking. A value of 0 means no feedback.'],
+        ['Queue backend', ['SQLite', 'Text'], str, '', 'COMBO', 'Rare', 'Storage of the processing queues. SQLite keeps an indexed database in the queue folder and exports the Queue_* text files when the run stops. Text reads and writes the Queue_* text files for every queue operation.'],
+        ['Scheduler', ['Event', 'Poll'], str, '', 'COMBO', 'Rare', 'Scheduling of idle processes. Event wakes up a waiting process as soon as a new entry is added to its queue. Poll checks the queue every 5 seconds.'],
+        ['Log flush interval', '1', float, '', 'PLAIN', 'Rare', 'Maximum time in seconds that messages for the sys_log.txt and the error files are buffered before they are written in one batch.'],
+        ['Log rotation size', '0', float, '', 'PLAIN', 'Rare', 'Size in MB after which the sys_log.txt is moved to sys_log.txt.1. Up to 5 old files are kept. A value of 0 means no rotation.'],
+        ['Log fsync', ['False', 'True'], bool, '', 'COMBO', 'Rare', 'Sync every written batch of log and error messages to disk. Slower, but nothing is lost if the machine crashes.'],
+        ['Health check interval', '10', float, '', 'PLAIN', 'Rare', 'Time in seconds between two quota and mount checks of the project, scratch, input and copy folders. The checks are done by one thread and the processes use the last result.'],
+        ['Health check timeout', '5', float, '', 'PLAIN', 'Rare', 'Time in seconds after that a quota or mount check counts as hanging. The processes wait with a Quota or Connection Error until the folder responds again.'],
+        ['Metrics interval', '30', float, '', 'PLAIN', 'Rare', 'Time in seconds between two exports of the per stage wait and run time percentiles, throughput and queue depth to metrics.prom (Prometheus text format) and metrics.jsonl in the log folder. The timestamps of every item are written to metrics_items.jsonl. A value of 0 disables the metrics.'],
         ]
     return items
 
@@ -1466,6 +1476,8 @@ def default_copy(settings_folder):
         ['Tar to backup', ['False', 'True'], bool, '', 'COMBO', 'Advanced', 'Copy the information to backup drive in tar format if "Copy to backup" is specified.'],
         ['Tar to hdd', ['False', 'True'], bool, '', 'COMBO', 'Advanced', 'Copy the information to HDD drive in tar format if "Copy to HDD" is specified.'],
         ['Tar size (Gb)', '2', float, '', 'PLAIN', 'Advanced', 'Size of the tar files before copying.'],
+        ['Tar compression', ['False', 'True'], bool, '', 'COMBO', 'Advanced', 'Compress the tar files with gzip in parallel before copying. The index file copied next to the tar file contains the positions of the files for a fast extraction.'],
+        ['Parallel copies', '4', int, '', 'PLAIN', 'Advanced', 'Maximum number of files that are copied to one destination at the same time, e.g. the files of a particle stack. Not used if the destination needs sudo.'],
         ['Delete data after import?', ['True', 'Symlink', 'False'], bool, '', 'COMBO', 'Main', 'Delete the data from the camera computer after the import. If Symlink is specified, a symbolik is used for import using the Linux "ln" command. The data is only deleted after import if the value is set to "True"'],
         ['Delete stack after compression?', ['True', 'False'], bool, '', 'COMBO', 'Advanced', 'Delete the mrc stack after compression.'],
         ['Delete compressed stack after copy?', ['False', 'True'], bool, '', 'COMBO', 'Advanced', 'Delete the compressed stack after copying to another location.'],
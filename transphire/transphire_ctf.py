@@ -21,13 +21,13 @@ import glob
 import os
 import shutil
 import numpy as np
-import mrcfile as mrc
 import matplotlib
 matplotlib.use('QT5Agg')
 import matplotlib.image as mi
 
 from . import transphire_import as ti
 from . import transphire_utils as tu
+from . import transphire_preview as tp
 
 
 def get_ctf_command(file_sum, file_input, new_name, settings, queue_com, set_name, name):
@@ -1081,51 +1081,17 @@ def create_jpg_file(input_mrc_file, settings, ctf_name):
     arr_3 = None
 
     if input_mrc_file and os.path.splitext(input_mrc_file)[1] in ('.mrc', '.mrcs'):
-        try:
-            with mrc.open(input_mrc_file) as mrc_file:
-                input_data = mrc_file.data
-        except ValueError:
-            with mrc.open(input_mrc_file, 'r+', permissive=True) as mrc_file:
-                mrc_file.header.map = mrc.constants.MAP_ID
-            with mrc.open(input_mrc_file) as mrc_file:
-                input_data = mrc_file.data
-        if len(input_data.shape) == 3:
-            input_data = np.sum(input_data, axis=0) / input_data.shape[0]
-        input_data = input_data - np.mean(input_data)
-        input_data = tu.normalize_image(input_data)
-
-        if input_data.shape[0] > 512:
-            idx = 1
-            while True:
-                if np.max(input_data.shape) < idx * 4096:
-                    break
-                idx += 1
-            original_shape = idx * 4096
-            bin_shape = 512
-            ratio = original_shape / bin_shape
-            pad_x = original_shape - input_data.shape[0]
-            pad_y = original_shape - input_data.shape[1]
-            shape = (bin_shape, bin_shape)
-            input_data = np.pad(input_data, ((0, pad_x), (0, pad_y)), mode='median')
-            shape = (bin_shape, bin_shape)
-            output_data = tu.rebin(input_data, shape)[:-int(1+pad_x//ratio), :-int(1+pad_y//ratio)]
+        with tp.open_image(input_mrc_file) as mrc_file:
+            is_large = tp.get_image_shape(mrc_file.data)[0] > 512
+        if is_large:
+            output_data, _ = tp.create_preview(input_mrc_file, bin_shape=512, power_spectrum=False)
         else:
-            output_data = input_data
+            output_data = tp.read_image(input_mrc_file)
 
         arr_1 = output_data
 
     if input_ctf_file:
-        try:
-            with mrc.open(input_ctf_file) as mrc_file:
-                input_data = mrc_file.data
-        except ValueError:
-            with mrc.open(input_ctf_file, 'r+', permissive=True) as mrc_file:
-                mrc_file.header.map = mrc.constants.MAP_ID
-            with mrc.open(input_ctf_file) as mrc_file:
-                input_data = mrc_file.data
-        if len(input_data.shape) == 3:
-            input_data = np.sum(input_data, axis=0) / input_data.shape[0]
-        input_data = input_data - np.mean(input_data)
+        input_data = tp.read_image(input_ctf_file)
 
         if input_data.shape[0] > 512*2:
             shape = (512*2, 512*2)
@@ -0,0 +1,449 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from . import transphire_utils as tu
+
+
+SETTINGS_FILE = 'used_settings.json'
+SOCKET_FILE = 'transphire.sock'
+STATUS_FILE = 'headless_status.json'
+COMMANDS = ('status', 'stop', 'abort')
+
+
+def find_settings_file(path):
+    """
+    Find the settings of a previous run.
+
+    Arguments:
+    path - used_settings.json file, settings set folder or project folder
+
+    Return:
+    Path of the used_settings.json file
+    """
+    if os.path.isfile(path):
+        return path
+
+    settings_file = os.path.join(path, SETTINGS_FILE)
+    if os.path.isfile(settings_file):
+        return settings_file
+
+    # Project folder: Use the latest settings set
+    set_folder_raw = os.path.join(path, 'XXX_Settings')
+    try:
+        set_names = sorted([
+            entry
+            for entry in os.listdir(set_folder_raw)
+            if os.path.isfile(os.path.join(set_folder_raw, entry, SETTINGS_FILE))
+            ])
+    except FileNotFoundError:
+        set_names = []
+
+    if not set_names:
+        raise FileNotFoundError('No {0} found in {1}!'.format(SETTINGS_FILE, path))
+    return os.path.join(set_folder_raw, set_names[-1], SETTINGS_FILE)
+
+
+def get_restart_dict(settings, restart_names):
+    """
+    Restart dictionary of the continue mode.
+    Restarting a process restarts the subsequent processes like in the
+    continue dialog of the GUI.
+
+    Arguments:
+    settings - TranSPHIRE settings
+    restart_names - List of process names to restart, feedback restarts the feedback loop
+
+    Return:
+    Restart dictionary
+    """
+    ctf_name = settings['Copy']['CTF']
+    try:
+        is_movie = settings[ctf_name]['Use movies'] == 'True'
+    except KeyError:
+        is_movie = False
+
+    unique_types = list(tu.get_unique_types())
+    restart_dict = dict([(name, 0) for name in ['feedback'] + unique_types])
+    for key in restart_names:
+        if key not in restart_dict:
+            raise ValueError('Unknown restart name: {0}! Choose from: {1}'.format(
+                key,
+                ', '.join(['feedback'] + unique_types)
+                ))
+        restart_dict[key] = 2
+        if key == 'feedback':
+            restart_dict['Picking'] = 2
+            continue
+        elif key == 'Compress':
+            continue
+
+        for name in unique_types[unique_types.index(key)+1:]:
+            if key == 'Motion' and name == 'CTF' and is_movie:
+                continue
+            elif key in ('CTF', 'Picking') and name in ('CTF', 'Picking'):
+                continue
+            elif key in ('Train2d', 'Auto3d') and name in ('Train2d', 'Auto3d'):
+                continue
+            elif restart_dict[name] == 0:
+                restart_dict[name] = 1
+    restart_dict['is_ctf_movie'] = is_movie
+    return restart_dict
+
+
+def prepare_settings(settings, mount_directory, continue_run=False, restart_names=None):
+    """
+    Create the project folders to start the processing with the settings
+    of a previous run. The external files of the previous run are kept.
+
+    Arguments:
+    settings - Settings of a previous run, will be modified
+    mount_directory - Folder containing the mount points
+    continue_run - Continue the run, if the project folder already exists (default False)
+    restart_names - List of process names to restart in continue mode (default None)
+
+    Return:
+    Restart dictionary
+    """
+    if restart_names is None:
+        restart_names = []
+    old_set = settings.get('current_set')
+    old_external_log = settings.get('external_log')
+
+    project_folder = os.path.join(
+        settings['Output']['Project directory'],
+        settings['Output']['Project name'],
+        'TranSPHIRE_results'
+        )
+    if os.path.exists(project_folder):
+        if not continue_run:
+            raise IOError('Output project folder {0} already exists!'.format(project_folder))
+        restart_dict = get_restart_dict(settings, restart_names)
+    else:
+        restart_dict = {}
+
+    folder_dict = tu.set_project_folders(settings, mount_directory)
+    for name in ['project_folder', 'scratch_folder'] + list(folder_dict.keys()):
+        tu.mkdir_p(settings[name])
+
+    external_files = {}
+    try:
+        with open(old_external_log, 'r') as read:
+            external_files = json.load(read)[old_set]
+    except (FileNotFoundError, KeyError, TypeError):
+        pass
+
+    try:
+        with open(settings['external_log'], 'r') as read:
+            current_data = json.load(read)
+    except FileNotFoundError:
+        current_data = {}
+    current_data[settings['current_set']] = external_files
+    with open(settings['external_log'], 'w') as write:
+        json.dump(current_data, write, indent=1)
+
+    with open(os.path.join(settings['set_folder'], SETTINGS_FILE), 'w') as write:
+        json.dump(settings, write, indent=1)
+    return restart_dict
+
+
+def send_command(socket_file, command, timeout=10):
+    """
+    Send a command to a running headless instance.
+
+    Arguments:
+    socket_file - Status socket of the instance
+    command - status, stop or abort
+    timeout - Timeout in seconds (default 10)
+
+    Return:
+    Answer dictionary
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_file)
+        client.sendall('{0}\n'.format(command).encode())
+        with client.makefile('r') as read:
+            return json.loads(read.readline())
+
+
+class StatusHandler(socketserver.StreamRequestHandler):
+    """
+    Answer a single command of a status socket client.
+    """
+
+    def handle(self):
+        command = self.rfile.readline().decode().strip() or 'status'
+        if command == 'status':
+            answer = self.server.headless.get_status()
+        elif command in ('stop', 'abort'):
+            self.server.headless.request_stop(abort=bool(command == 'abort'))
+            answer = {'command': command, 'accepted': True}
+        else:
+            answer = {'command': command, 'accepted': False, 'error': 'Unknown command! Choose from: {0}'.format(', '.join(COMMANDS))}
+        self.wfile.write('{0}\n'.format(json.dumps(answer)).encode())
+
+
+class StatusServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class HeadlessRun(object):
+    """
+    Run the ProcessWorker without the GUI.
+
+    The worker runs in the main thread, so its signals call the connected
+    functions directly and no Qt event loop is needed. The status of the
+    processes is printed, written to a status file in the log folder and
+    served on a unix socket. A client can request the status or stop the
+    run with send_command. SIGINT and SIGTERM stop the run, a second signal
+    aborts the running processes.
+    """
+
+    def __init__(self, settings, restart_dict, mount_directory, password='', socket_file=None, quiet=False):
+        """
+        Initialize object variables.
+
+        Arguments:
+        settings - TranSPHIRE settings prepared with prepare_settings
+        restart_dict - Restart dictionary
+        mount_directory - Folder containing the mount points
+        password - Sudo password (default '')
+        socket_file - Status socket, default transphire.sock in the log folder
+        quiet - Do not print the status changes (default False)
+
+        Return:
+        None
+        """
+        super(HeadlessRun, self).__init__()
+        from .processworker import ProcessWorker
+
+        self.settings = settings
+        self.restart_dict = restart_dict
+        self.quiet = quiet
+        if socket_file is None:
+            socket_file = os.path.join(settings['log_folder'], SOCKET_FILE)
+        self.socket_file = socket_file
+        self.status_file = os.path.join(settings['log_folder'], STATUS_FILE)
+
+        self.lock = threading.Lock()
+        self.processes = collections.OrderedDict()
+        self.errors = collections.deque(maxlen=50)
+        self.notifications = collections.deque(maxlen=50)
+        self.state = 'Starting'
+        self.start_time = None
+        self.last_write = 0
+        self.server = None
+        self.nr_signals = 0
+
+        self.worker = ProcessWorker(
+            password=password,
+            content_process=tu.get_content_pipeline(settings['Pipeline']),
+            mount_directory=mount_directory,
+            )
+        self.worker.sig_status.connect(self.set_status)
+        self.worker.sig_error.connect(self.add_error)
+        self.worker.sig_notification.connect(self.add_notification)
+        self.worker.sig_finished.connect(self.set_finished)
+
+    def log(self, *args):
+        if not self.quiet:
+            print(tu.create_log(*args), flush=True)
+
+    def set_status(self, text, numbers, device, color):
+        with self.lock:
+            self.processes[device] = {
+                'status': text,
+                'numbers': numbers,
+                'time': time.time(),
+                }
+        self.log(device, text, numbers)
+        self.write_status()
+
+    def add_error(self, text):
+        if text.startswith('NEW SESSION'):
+            self.state = 'Running'
+        with self.lock:
+            self.errors.append([time.time(), text])
+        self.log('ERROR:', text)
+
+    def add_notification(self, text):
+        with self.lock:
+            self.notifications.append([time.time(), text])
+        self.log('NOTIFICATION:', text)
+
+    def set_finished(self):
+        self.state = 'Finished'
+        self.write_status(force=True)
+
+    def request_stop(self, abort=False):
+        """
+        Stop the run.
+
+        Arguments:
+        abort - Abort the running processes instead of waiting for them (default False)
+
+        Return:
+        None
+        """
+        self.log('Stop requested', '(abort)' if abort else '')
+        if abort:
+            self.worker.abort = True
+        self.worker.stop = True
+        self.state = 'Stopping'
+
+    def handle_signal(self, signum, frame):
+        self.nr_signals += 1
+        self.request_stop(abort=bool(self.nr_signals > 1))
+
+    def get_status(self):
+        """
+        Current status of the run.
+
+        Arguments:
+        None
+
+        Return:
+        Status dictionary
+        """
+        with self.lock:
+            return {
+                'state': self.state,
+                'pid': os.getpid(),
+                'project_folder': self.settings['project_folder'],
+                'current_set': self.settings['current_set'],
+                'log_folder': self.settings['log_folder'],
+                'error_folder': self.settings['error_folder'],
+                'start_time': self.start_time,
+                'run_time': time.time() - self.start_time if self.start_time else 0,
+                'processes': dict(self.processes),
+                'errors': list(self.errors)[-10:],
+                'notifications': list(self.notifications)[-10:],
+                }
+
+    def write_status(self, force=False):
+        if not force and time.time() - self.last_write < 1:
+            return
+        temp_file = '{0}.tmp'.format(self.status_file)
+        try:
+            with open(temp_file, 'w') as write:
+                json.dump(self.get_status(), write, indent=1)
+            os.replace(temp_file, self.status_file)
+        except FileNotFoundError:
+            # Log folder does not exist (anymore)
+            pass
+        self.last_write = time.time()
+
+    def start_server(self):
+        try:
+            os.remove(self.socket_file)
+        except FileNotFoundError:
+            pass
+        try:
+            self.server = StatusServer(self.socket_file, StatusHandler)
+        except OSError as err:
+            print('Status socket {0} not available: {1}'.format(self.socket_file, err))
+            self.server = None
+            return
+        self.server.headless = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.log('Status socket:', self.socket_file)
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            try:
+                os.remove(self.socket_file)
+            except FileNotFoundError:
+                pass
+            self.server = None
+
+    def run(self):
+        """
+        Run the processes until they are stopped.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        old_handlers = {}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            old_handlers[signum] = signal.signal(signum, self.handle_signal)
+        self.start_time = time.time()
+        self.start_server()
+        try:
+            self.worker.run(self.settings, self.restart_dict)
+        finally:
+            self.stop_server()
+            for signum, handler in old_handlers.items():
+                signal.signal(signum, handler)
+            self.write_status(force=True)
+
+
+def run_headless(settings_path, mount_directory, continue_run=False, restart_names=None, password='', socket_file=None, quiet=False):
+    """
+    Start the processing with the settings of a previous run without the GUI.
+
+    Arguments:
+    settings_path - used_settings.json file, settings set folder or project folder
+    mount_directory - Folder containing the mount points
+    continue_run - Continue the run, if the project folder already exists (default False)
+    restart_names - List of process names to restart in continue mode (default None)
+    password - Sudo password (default '')
+    socket_file - Status socket, default transphire.sock in the log folder
+    quiet - Do not print the status changes (default False)
+
+    Return:
+    None
+    """
+    # The plots are created by matplotlib with the Qt backend
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+    settings_file = find_settings_file(settings_path)
+    print('Load settings:', settings_file)
+    with open(settings_file, 'r') as read:
+        settings = json.load(read)
+    settings['Monitor'] = False
+
+    restart_dict = prepare_settings(
+        settings,
+        mount_directory,
+        continue_run=continue_run,
+        restart_names=restart_names,
+        )
+
+    headless = HeadlessRun(
+        settings=settings,
+        restart_dict=restart_dict,
+        mount_directory=mount_directory,
+        password=password,
+        socket_file=socket_file,
+        quiet=quiet,
+        )
+    headless.run()
+    print('Project folder:', settings['project_folder'])
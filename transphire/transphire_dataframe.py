@@ -0,0 +1,258 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import os
+import multiprocessing as mp
+
+import numpy as np
+import pandas as pd
+
+
+def thread_safe(func):
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            self._sync()
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def to_json(value):
+    try:
+        return value.item()
+    except AttributeError:
+        return str(value)
+
+
+class DataFrame(object):
+    """
+    Table shared by the forked processes with row level updates.
+
+    Every process keeps the table as a dictionary of columns. Changes are
+    appended as one JSON line per row update to a log file next to the CSV
+    file and the other processes replay only the log lines that were added
+    since their last access. The log size and a generation counter live in
+    shared memory, so an access without changes does not touch the disk.
+    After compact_records log lines, the table is written to the CSV file and
+    the log is truncated; the generation counter tells the other processes to
+    reload the CSV file.
+    The table must be created before the fork.
+    """
+
+    def __init__(self, file_path, compact_records=1000):
+        """
+        Initialize object variables.
+
+        Arguments:
+        file_path - CSV file of the table
+        compact_records - Number of log lines that trigger a rewrite of the CSV file
+
+        Return:
+        None
+        """
+        super(DataFrame, self).__init__()
+        self._lock = mp.RLock()
+        self._file_path = file_path
+        self._log_path = '{0}.log'.format(file_path)
+        self._compact_records = compact_records
+        self._increment = 5
+
+        self._generation = mp.RawValue('q', 0)
+        self._log_size = mp.RawValue('q', 0)
+        self._log_records = mp.RawValue('q', 0)
+
+        self._columns = {}
+        self._nr_rows = 0
+        self._local_generation = 0
+        self._offset = 0
+
+        try:
+            self._log_size.value = os.path.getsize(self._log_path)
+        except FileNotFoundError:
+            pass
+        self.load_df()
+
+    def _sync(self):
+        if self._local_generation != self._generation.value:
+            self._load()
+        elif self._offset < self._log_size.value:
+            self._replay()
+
+    def _load(self):
+        self._columns = {}
+        self._nr_rows = 0
+        if os.path.exists(self._file_path):
+            data_frame = pd.read_csv(self._file_path, index_col=0, dtype=object)
+            self._set_data_frame(data_frame)
+        self._local_generation = self._generation.value
+        self._offset = 0
+        self._replay()
+
+    def _set_data_frame(self, data_frame):
+        self._columns = {}
+        self._nr_rows = 0
+        if data_frame.shape[0]:
+            index = [int(entry) for entry in data_frame.index]
+            self._nr_rows = max(index) + 1
+        else:
+            index = []
+        for column in data_frame.columns:
+            self._add_column(column)
+            values = self._columns[column]
+            for row, value in zip(index, data_frame[column].values):
+                values[row] = value
+
+    def _replay(self):
+        try:
+            with open(self._log_path, 'rb') as read:
+                read.seek(self._offset)
+                data = read.read(self._log_size.value - self._offset)
+        except FileNotFoundError:
+            data = b''
+        self._offset += len(data)
+        for line in data.decode('utf-8').splitlines():
+            try:
+                index, value_dict = json.loads(line)
+            except ValueError:
+                # Incomplete last line of a crashed run
+                continue
+            self._set(index, value_dict)
+
+    def _append_log(self, index, value_dict):
+        line = '{0}\n'.format(json.dumps([index, value_dict], default=to_json)).encode('utf-8')
+        with open(self._log_path, 'ab') as write:
+            write.write(line)
+        self._log_size.value += len(line)
+        self._log_records.value += 1
+        self._offset = self._log_size.value
+
+    def _add_column(self, name):
+        self._columns[name] = [np.nan] * self._nr_rows
+
+    def _add_rows(self, length):
+        for values in self._columns.values():
+            values.extend([np.nan] * length)
+        self._nr_rows += length
+
+    def _check(self, index, columns):
+        if not 0 <= index < self._nr_rows:
+            rows_to_add = self._increment * (index // self._increment + 1) - self._nr_rows
+            self._add_rows(rows_to_add)
+
+        for column in columns:
+            if column not in self._columns:
+                self._add_column(column)
+
+    def _set(self, index, value_dict):
+        self._check(index, value_dict.keys())
+        for column, value in value_dict.items():
+            self._columns[column][index] = value
+
+    def _to_data_frame(self):
+        return pd.DataFrame(
+            {column: values for column, values in self._columns.items()},
+            index=range(self._nr_rows),
+            columns=list(self._columns),
+            dtype=object,
+            )
+
+    def _compact(self):
+        temp_file = '{0}.{1}.tmp'.format(self._file_path, os.getpid())
+        self._to_data_frame().to_csv(temp_file)
+        os.replace(temp_file, self._file_path)
+        with open(self._log_path, 'wb'):
+            pass
+        self._log_size.value = 0
+        self._log_records.value = 0
+        self._generation.value += 1
+        self._local_generation = self._generation.value
+        self._offset = 0
+
+    @thread_safe
+    def get_df(self):
+        return self._to_data_frame()
+
+    @thread_safe
+    def set_df(self, data_frame):
+        self._set_data_frame(data_frame)
+        self._compact()
+
+    @thread_safe
+    def save_df(self):
+        self._compact()
+
+    def load_df(self):
+        with self._lock:
+            self._load()
+
+    @thread_safe
+    def value_in_column(self, value, column):
+        return value in self._columns[column]
+
+    @thread_safe
+    def get_values(self, index, columns):
+        if isinstance(columns, str):
+            columns = [columns]
+        index = int(index)
+        self._check(index, columns)
+
+        return pd.Series(
+            [self._columns[column][index] for column in columns],
+            index=list(columns),
+            name=index,
+            dtype=object,
+            )
+
+    @thread_safe
+    def set_values(self, index, value_dict, do_save=True):
+        index = int(index)
+        self._set(index, value_dict)
+        self._append_log(index, value_dict)
+        if do_save and self._log_records.value >= self._compact_records:
+            self._compact()
+
+    @thread_safe
+    def append_values(self, value_dict, do_save=True):
+        values = self._columns[next(iter(value_dict))]
+        index = 0
+        for row in range(len(values) - 1, -1, -1):
+            if not pd.isna(values[row]):
+                index = row + 1
+                break
+        self.set_values(index, value_dict, do_save)
+
+    @thread_safe
+    def get_index_where(self, column, value, func_type):
+        col = np.array(self._columns[column], dtype=object)
+        try:
+            col = col.astype(float)
+        except (TypeError, ValueError):
+            pass
+
+        if func_type == 'eq':
+            mask = col == value
+        elif func_type == 'gg':
+            mask = col > value
+        elif func_type == 'll':
+            mask = col < value
+        elif func_type == 'ge':
+            mask = col >= value
+        elif func_type == 'le':
+            mask = col <= value
+        else:
+            raise NameError
+        return pd.Index(np.flatnonzero(mask))
@@ -0,0 +1,356 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import ctypes
+import ctypes.util
+import os
+import struct
+
+from . import transphire_utils as tu
+
+
+NETWORK_FILESYSTEMS = (
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'fuse.sshfs', 'fuse.glusterfs',
+    'lustre', 'gpfs', 'beegfs', 'ceph', 'fuse.ceph', 'afs', '9p',
+    )
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF
+IN_EVENT_HEADER = struct.Struct('iIII')
+
+
+def get_filesystem_type(directory):
+    """
+    Get the file system type of the mount point containing the directory.
+
+    Arguments:
+    directory - Directory to check
+
+    Return:
+    File system type or None, if not available
+    """
+    directory = os.path.realpath(directory)
+    best_match = ''
+    fs_type = None
+    try:
+        with open('/proc/mounts', 'r') as read:
+            for line in read:
+                try:
+                    _, mount_point, typ = line.split()[:3]
+                except ValueError:
+                    continue
+                mount_point = mount_point.replace('\\040', ' ')
+                if (directory == mount_point or directory.startswith(mount_point.rstrip('/') + '/')) \
+                        and len(mount_point) > len(best_match):
+                    best_match = mount_point
+                    fs_type = typ
+    except OSError:
+        pass
+    return fs_type
+
+
+def get_index_file(queue_folder):
+    return os.path.join(queue_folder, 'Find_index.txt')
+
+
+def get_find_method(method, directory):
+    """
+    Resolve the Auto find method.
+    Inotify does not see changes made by other hosts on network file systems.
+
+    Arguments:
+    method - Requested method
+    directory - Directory to watch
+
+    Return:
+    Find method to use
+    """
+    if method != 'Auto':
+        return method
+    elif not InotifyWatcher.is_available():
+        return 'Delta scan'
+    elif get_filesystem_type(directory) in NETWORK_FILESYSTEMS:
+        return 'Delta scan'
+    else:
+        return 'Inotify'
+
+
+class FileIndex(object):
+    """
+    Persistent (path, size, mtime) index of resolved Find candidates.
+    Entries are appended to the index file, the last entry of a path wins.
+    """
+
+    def __init__(self, index_file):
+        super(FileIndex, self).__init__()
+        self.index_file = index_file
+        self.index = {}
+        try:
+            with open(self.index_file, 'r') as read:
+                for line in read:
+                    try:
+                        path, size, mtime = line.rstrip('\n').rsplit('\t', 2)
+                        self.index[path] = (int(size), int(mtime))
+                    except ValueError:
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, entry):
+        path, size, mtime = entry
+        return self.index.get(path) == (size, mtime)
+
+    def add(self, path, size, mtime, persist=True):
+        if self.index.get(path) == (size, mtime):
+            return
+        self.index[path] = (size, mtime)
+        if persist:
+            self.persist(path, size, mtime)
+
+    def persist(self, path, size, mtime):
+        tu.mkdir_p(os.path.dirname(self.index_file))
+        with open(self.index_file, 'a') as write:
+            write.write('{0}\t{1}\t{2}\n'.format(path, size, mtime))
+
+
+class InotifyWatcher(object):
+    """
+    Recursive inotify watcher based on the libc inotify interface.
+    """
+    libc = None
+
+    @classmethod
+    def is_available(cls):
+        if cls.libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+            except (OSError, AttributeError, TypeError):
+                cls.libc = False
+            else:
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+                cls.libc = libc
+        return bool(cls.libc)
+
+    def __init__(self):
+        super(InotifyWatcher, self).__init__()
+        if not self.is_available():
+            raise OSError('inotify not available')
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed: {0}'.format(directory))
+        self.watches[wd] = directory
+
+    def read_events(self):
+        """
+        Read all pending events.
+
+        Arguments:
+        None
+
+        Return:
+        Set of changed files, set of new directories, overflow flag
+        """
+        files = set()
+        directories = set()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = IN_EVENT_HEADER.unpack_from(data, offset)
+                offset += IN_EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & IN_IGNORED:
+                    self.watches.pop(wd, None)
+                elif wd in self.watches and name:
+                    path = os.path.join(self.watches[wd], name)
+                    if mask & IN_ISDIR:
+                        directories.add(path)
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        files.add(path)
+        return files, directories, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FindEngine(object):
+    """
+    Incremental discovery of Find candidates.
+
+    Delta scan: scandir walk of the directory tree that only stats candidate
+    files and skips everything with an unchanged (path, size, mtime) entry in
+    the index.
+    Inotify: One delta scan to set up the watches, afterwards only files
+    reported by inotify and candidates that were not resolved yet are checked.
+    Full scan: Return every candidate on every call.
+    """
+
+    def __init__(self, directory, method, index_file, is_candidate):
+        """
+        Initialize object variables.
+
+        Arguments:
+        directory - Directory to search
+        method - Find method (Auto, Inotify, Delta scan, Full scan)
+        index_file - File to store the persistent index
+        is_candidate - Function that decides by name, if a file is a candidate
+
+        Return:
+        None
+        """
+        super(FindEngine, self).__init__()
+        self.directory = directory
+        self.method = get_find_method(method, directory)
+        self.index = FileIndex(index_file)
+        self.is_candidate = is_candidate
+        self.pending = set()
+        self.watcher = None
+        self.do_full_scan = True
+
+    def scan(self, directory, candidates, stop, watch=False):
+        # Add the watch before listing the directory to not miss new files in between.
+        if watch and self.watcher is not None:
+            try:
+                self.watcher.add_watch(directory)
+            except OSError:
+                # No more watches available: Continue without inotify
+                self.method = 'Delta scan'
+                self.watcher.close()
+                self.watcher = None
+                watch = False
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return
+
+        for entry in entries:
+            if stop is not None and stop.value:
+                break
+            elif entry.name.startswith('.'):
+                continue
+            elif entry.is_dir():
+                self.scan(entry.path, candidates, stop, watch=watch)
+            elif self.is_candidate(entry.path):
+                candidates.append(entry.path)
+
+    def stat(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        else:
+            return path, stat.st_size, stat.st_mtime_ns
+
+    def candidates(self, stop=None):
+        """
+        Find the new or changed candidates.
+
+        Arguments:
+        stop - Shared stop value
+
+        Return:
+        List of (path, size, mtime) tuples
+        """
+        if not os.path.exists(self.directory):
+            raise FileNotFoundError('Find directory does not exist')
+
+        paths = []
+        if self.method == 'Inotify' and self.watcher is not None and not self.do_full_scan:
+            files, directories, overflow = self.watcher.read_events()
+            if overflow:
+                self.do_full_scan = True
+            else:
+                paths.extend(sorted(self.pending | set([entry for entry in files if self.is_candidate(entry)])))
+                for directory in sorted(directories):
+                    self.scan(directory, paths, stop, watch=True)
+
+        if self.do_full_scan or self.method != 'Inotify':
+            watch = False
+            if self.method == 'Inotify':
+                if self.watcher is not None:
+                    self.watcher.close()
+                try:
+                    self.watcher = InotifyWatcher()
+                except OSError:
+                    self.method = 'Delta scan'
+                else:
+                    watch = True
+            self.scan(self.directory, paths, stop, watch=watch)
+            self.do_full_scan = False
+
+        candidates = []
+        for path in sorted(set(paths)):
+            entry = self.stat(path)
+            if entry is None:
+                continue
+            elif self.method != 'Full scan' and entry in self.index:
+                continue
+            else:
+                candidates.append(entry)
+        self.pending = set([entry[0] for entry in candidates])
+        return candidates
+
+    def resolve(self, entry, persist=True):
+        """
+        Mark a candidate as resolved, so it is not checked again unless it changes.
+
+        Arguments:
+        entry - (path, size, mtime) tuple
+        persist - Keep the entry in the index file for restarts
+
+        Return:
+        None
+        """
+        self.pending.discard(entry[0])
+        self.index.add(*entry, persist=persist)
+
+    def persist(self, entry):
+        """
+        Keep a resolved candidate in the index file for restarts.
+        Used for candidates that were resolved with persist=False until
+        they are added to the queue.
+
+        Arguments:
+        entry - (path, size, mtime) tuple
+
+        Return:
+        None
+        """
+        self.index.persist(*entry)
@@ -0,0 +1,360 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import multiprocessing as mp
+
+
+# Stages at the front of the pipeline go first to keep the per micrograph latency low.
+STAGE_PRIORITY = {
+    'Motion': 5,
+    'CTF': 4,
+    'Picking': 3,
+    'Extract': 2,
+    'Select2d': 2,
+    'Class2d': 1,
+    'Train2d': 1,
+    'Auto3d': 0,
+    }
+
+
+class GpuAbort(Exception):
+    """
+    Raised, if the abort flag is set while waiting for a GPU.
+    """
+    pass
+
+
+def parse_gpu_list(gpu_list):
+    """
+    Convert the GPU ids used in the commands to scheduler requests.
+    A plain id (e.g. 0) requests the whole GPU exclusively, a split id
+    (e.g. 0_1) requests the shared slot 1 of GPU 0.
+
+    Arguments:
+    gpu_list - List of GPU id strings
+
+    Return:
+    Sorted list of (gpu, slot) tuples, slot is None for exclusive requests
+    """
+    request = set()
+    for entry in gpu_list:
+        if '_' in entry:
+            gpu, slot = entry.split('_', 1)
+            request.add((int(gpu), int(slot)))
+        else:
+            request.add((int(entry), None))
+    return sorted(request, key=lambda entry: (entry[0], -1 if entry[1] is None else entry[1]))
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    else:
+        return True
+
+
+class GpuScheduler(object):
+    """
+    Blocking slot scheduler for the GPUs, shared by forked processes.
+
+    Every GPU can be held exclusively by one job or by shared jobs, each in
+    its own slot, up to the capacity of the GPU. A request for several GPUs is
+    granted all at once.
+    Waiting requests are ranked by arrival, every priority level moves a
+    request priority_weight requests ahead, so low priority stages still get
+    their turn. A request only waits for a higher ranked waiting request if
+    they conflict: One of them wants a GPU exclusively, both want the same
+    slot or the shared jobs of both do not fit the capacity of the GPU.
+    Exclusive jobs are therefore not starved by a stream of shared jobs,
+    while free slots of a GPU are still granted at the same time.
+    GPU ids are mapped to an internal index on first use, so only the number
+    of different GPUs is limited.
+    Waiting is done on a condition variable instead of polling. Slots of dead
+    processes are released on the next timeout.
+    """
+
+    def __init__(self, max_gpus=64, max_slots=64, max_waiters=256, capacity=None, priority_weight=10):
+        """
+        Initialize object variables.
+
+        Arguments:
+        max_gpus - Number of different GPU ids that can be scheduled, at most 64
+        max_slots - Number of shared slots per GPU, at most 64
+        max_waiters - Maximum number of waiting requests that are ranked
+        capacity - Dictionary GPU id -> maximum number of shared jobs (default max_slots)
+        priority_weight - Number of requests a priority level moves ahead
+
+        Return:
+        None
+        """
+        super(GpuScheduler, self).__init__()
+        self.max_gpus = min(max_gpus, 64)
+        self.max_slots = min(max_slots, 64)
+        self.max_waiters = max_waiters
+        self.priority_weight = priority_weight
+        self.capacity_dict = {}
+        if capacity is not None:
+            for gpu, value in capacity.items():
+                self.capacity_dict[int(gpu)] = max(1, int(value))
+        self.condition = mp.Condition(mp.Lock())
+        # GPU id of every internal index, -1 for unused indices
+        self.gpu_ids = mp.RawArray('q', self.max_gpus)
+        for idx in range(self.max_gpus):
+            self.gpu_ids[idx] = -1
+        self.exclusive = mp.RawArray('q', self.max_gpus)
+        self.slots = mp.RawArray('q', self.max_gpus * self.max_slots)
+        self.capacity = mp.RawArray('q', self.max_gpus)
+        # Waiting requests: active, rank, GPU bit mask, exclusive GPU bit mask, slot bit mask per GPU
+        self.waiter_active = mp.RawArray('b', max_waiters)
+        self.waiter_rank = mp.RawArray('q', max_waiters)
+        self.waiter_mask = mp.RawArray('Q', max_waiters)
+        self.waiter_exclusive = mp.RawArray('Q', max_waiters)
+        self.waiter_slots = mp.RawArray('Q', max_waiters * self.max_gpus)
+        self.ticket = mp.RawValue('q', 0)
+
+    def get_index(self, gpu):
+        """
+        Internal index of a GPU id, a new index is assigned on first use.
+        Needs to be called with the condition acquired.
+
+        Arguments:
+        gpu - GPU id
+
+        Return:
+        Index
+        """
+        for idx in range(self.max_gpus):
+            if self.gpu_ids[idx] == gpu:
+                return idx
+            elif self.gpu_ids[idx] == -1:
+                self.gpu_ids[idx] = gpu
+                self.capacity[idx] = self.capacity_dict.get(gpu, self.max_slots)
+                return idx
+        raise ValueError(
+            'More than {0} different GPU ids are used: {1}'.format(self.max_gpus, gpu)
+            )
+
+    def get_request(self, request):
+        """
+        Convert a request to internal GPU indices.
+        Needs to be called with the condition acquired.
+
+        Arguments:
+        request - Return value of parse_gpu_list
+
+        Return:
+        List of (index, slot) tuples
+        """
+        index_request = []
+        for gpu, slot in request:
+            if slot is not None and not 0 <= slot < self.max_slots:
+                raise ValueError(
+                    'GPU split {0}_{1} out of range: At most {2} jobs per GPU are supported'.format(
+                        gpu, slot, self.max_slots
+                        )
+                    )
+            index_request.append((self.get_index(gpu), slot))
+        return index_request
+
+    def get_busy(self, index):
+        return len([
+            idx
+            for idx in range(self.max_slots)
+            if self.slots[index * self.max_slots + idx]
+            ])
+
+    def is_free(self, request):
+        shared = {}
+        for index, slot in request:
+            if self.exclusive[index] != 0:
+                return False
+            busy = self.get_busy(index)
+            if slot is None:
+                if busy:
+                    return False
+            else:
+                if self.slots[index * self.max_slots + slot] != 0:
+                    return False
+                shared[index] = shared.get(index, 0) + 1
+                if busy + shared[index] > self.capacity[index]:
+                    return False
+        return True
+
+    def is_first(self, waiter, request):
+        """
+        Check if a higher ranked waiting request conflicts with the request.
+
+        Arguments:
+        waiter - Index of the waiting request
+        request - List of (index, slot) tuples
+
+        Return:
+        True, if no higher ranked waiting request conflicts
+        """
+        if waiter is None:
+            return True
+        rank = (self.waiter_rank[waiter], waiter)
+        mask = self.waiter_mask[waiter]
+        shared = {}
+        for index, slot in request:
+            if slot is not None:
+                shared[index] = shared.get(index, 0) + 1
+
+        # Shared slots needed by the higher ranked waiting requests
+        reserved = {}
+        for idx in range(self.max_waiters):
+            if idx == waiter or not self.waiter_active[idx]:
+                continue
+            elif not self.waiter_mask[idx] & mask or (self.waiter_rank[idx], idx) > rank:
+                continue
+            elif self.waiter_exclusive[idx] & mask:
+                return False
+            for index, slot in request:
+                if not self.waiter_mask[idx] >> index & 1:
+                    continue
+                elif slot is None:
+                    return False
+                slots = self.waiter_slots[idx * self.max_gpus + index]
+                if slots >> slot & 1:
+                    return False
+                reserved[index] = reserved.get(index, 0) + bin(slots).count('1')
+
+        for index, number in shared.items():
+            if self.get_busy(index) + number + reserved.get(index, 0) > self.capacity[index]:
+                return False
+        return True
+
+    def register(self, priority, request):
+        self.ticket.value += 1
+        for idx in range(self.max_waiters):
+            if not self.waiter_active[idx]:
+                mask = 0
+                exclusive = 0
+                for index in range(self.max_gpus):
+                    self.waiter_slots[idx * self.max_gpus + index] = 0
+                for index, slot in request:
+                    mask |= 1 << index
+                    if slot is None:
+                        exclusive |= 1 << index
+                    else:
+                        self.waiter_slots[idx * self.max_gpus + index] |= 1 << slot
+                self.waiter_active[idx] = 1
+                self.waiter_rank[idx] = self.ticket.value - priority * self.priority_weight
+                self.waiter_mask[idx] = mask
+                self.waiter_exclusive[idx] = exclusive
+                return idx
+        # Too many waiters: Wait unranked
+        return None
+
+    def unregister(self, waiter):
+        if waiter is not None:
+            self.waiter_active[waiter] = 0
+
+    def release_dead(self):
+        for idx in range(self.max_gpus):
+            if self.exclusive[idx] != 0 and not is_alive(self.exclusive[idx]):
+                self.exclusive[idx] = 0
+        for idx in range(self.max_gpus * self.max_slots):
+            if self.slots[idx] != 0 and not is_alive(self.slots[idx]):
+                self.slots[idx] = 0
+
+    def acquire(self, gpu_list, priority=0, abort=None, timeout=1):
+        """
+        Block until all requested GPUs are available and reserve them.
+
+        Arguments:
+        gpu_list - List of GPU id strings, e.g. ['0', '1_0']
+        priority - Higher priorities are served first
+        abort - Shared value, waiting stops with GpuAbort if it is set
+        timeout - Interval to check the abort flag and dead processes
+
+        Return:
+        Request to pass to release
+        """
+        request = parse_gpu_list(gpu_list)
+        if not request:
+            return request
+        pid = os.getpid()
+
+        with self.condition:
+            request = self.get_request(request)
+            waiter = self.register(priority, request)
+            try:
+                while True:
+                    if self.is_first(waiter, request) and self.is_free(request):
+                        for index, slot in request:
+                            if slot is None:
+                                self.exclusive[index] = pid
+                            else:
+                                self.slots[index * self.max_slots + slot] = pid
+                        return request
+                    elif abort is not None and abort.value:
+                        raise GpuAbort('STOP: abort')
+                    elif not self.condition.wait(timeout):
+                        self.release_dead()
+            finally:
+                self.unregister(waiter)
+                # Lower ranked waiters might be able to go now
+                self.condition.notify_all()
+
+    def release(self, request):
+        """
+        Release GPUs reserved by acquire.
+
+        Arguments:
+        request - Return value of acquire
+
+        Return:
+        None
+        """
+        if not request:
+            return
+        with self.condition:
+            for index, slot in request:
+                if slot is None:
+                    self.exclusive[index] = 0
+                else:
+                    self.slots[index * self.max_slots + slot] = 0
+            self.condition.notify_all()
+
+    def status(self):
+        """
+        Snapshot of the reserved GPUs.
+
+        Arguments:
+        None
+
+        Return:
+        Dictionary GPU id -> (exclusive pid, list of shared pids), number of waiting requests
+        """
+        with self.condition:
+            reserved = {}
+            for index in range(self.max_gpus):
+                shared = [
+                    self.slots[index * self.max_slots + idx]
+                    for idx in range(self.max_slots)
+                    if self.slots[index * self.max_slots + idx]
+                    ]
+                if self.exclusive[index] or shared:
+                    reserved[self.gpu_ids[index]] = (self.exclusive[index], shared)
+            waiting = sum(self.waiter_active)
+        return reserved, waiting
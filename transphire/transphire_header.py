@@ -0,0 +1,174 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import struct
+
+
+HEADER_CACHE = {}
+HEADER_CACHE_SIZE = 100000
+
+MRC_EXTENSIONS = ('.mrc', '.mrcs', '.st')
+TIFF_EXTENSIONS = ('.tif', '.tiff', '.eer')
+
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_TYPE_SIZE = {
+    3: ('H', 2),
+    4: ('I', 4),
+    16: ('Q', 8),
+    }
+
+
+class HeaderError(Exception):
+    """
+    Raised, if the header cannot be read with the native reader.
+    """
+    pass
+
+
+def read_header(file_name):
+    """
+    Read the dimensions of a MRC/MRCS, TIFF or EER file.
+    Only the header bytes are read and the result is cached by (path, size, mtime).
+
+    Arguments:
+    file_name - File to read
+
+    Return:
+    x_dim, y_dim, z_dim
+    """
+    stat = os.stat(file_name)
+    key = (file_name, stat.st_size, stat.st_mtime)
+    try:
+        return HEADER_CACHE[key]
+    except KeyError:
+        pass
+
+    extension = os.path.splitext(file_name)[-1].lower()
+    with open(file_name, 'rb') as read:
+        if extension in MRC_EXTENSIONS:
+            dimensions = read_mrc_header(read)
+        elif extension in TIFF_EXTENSIONS:
+            dimensions = read_tiff_header(read)
+        else:
+            raise HeaderError('File extension not supported: {0}'.format(file_name))
+
+    if len(HEADER_CACHE) >= HEADER_CACHE_SIZE:
+        HEADER_CACHE.clear()
+    HEADER_CACHE[key] = dimensions
+    return dimensions
+
+
+def read_mrc_header(read):
+    """
+    Read the dimensions of an open MRC file.
+
+    Arguments:
+    read - File object opened in binary mode
+
+    Return:
+    x_dim, y_dim, z_dim
+    """
+    header = read.read(224)
+    if len(header) != 224:
+        raise HeaderError('MRC header incomplete')
+
+    # Machine stamp: 0x44 0x44/0x41 little endian, 0x11 0x11 big endian
+    if header[212] == 0x11:
+        endian = '>'
+    else:
+        endian = '<'
+    x_dim, y_dim, z_dim = struct.unpack('{0}3i'.format(endian), header[:12])
+    if x_dim <= 0 or y_dim <= 0 or z_dim < 0:
+        raise HeaderError('MRC header invalid: {0} {1} {2}'.format(x_dim, y_dim, z_dim))
+    return x_dim, y_dim, z_dim
+
+
+def read_tiff_header(read):
+    """
+    Read the dimensions of an open TIFF or EER file.
+    The number of frames is the number of IFDs in the file.
+    Classic TIFF and BigTIFF are supported, the compression does not matter.
+
+    Arguments:
+    read - File object opened in binary mode
+
+    Return:
+    x_dim, y_dim, z_dim
+    """
+    header = read.read(16)
+    if header[:2] == b'II':
+        endian = '<'
+    elif header[:2] == b'MM':
+        endian = '>'
+    else:
+        raise HeaderError('Not a TIFF file')
+
+    version = struct.unpack('{0}H'.format(endian), header[2:4])[0]
+    if version == 42:
+        count_format, count_size = 'H', 2
+        entry_format, entry_size = 'HHI4s', 12
+        offset_format, offset_size = 'I', 4
+        offset = struct.unpack('{0}I'.format(endian), header[4:8])[0]
+    elif version == 43:
+        count_format, count_size = 'Q', 8
+        entry_format, entry_size = 'HHQ8s', 20
+        offset_format, offset_size = 'Q', 8
+        offset = struct.unpack('{0}Q'.format(endian), header[8:16])[0]
+    else:
+        raise HeaderError('TIFF version not known: {0}'.format(version))
+
+    x_dim = 0
+    y_dim = 0
+    z_dim = 0
+    while offset != 0:
+        read.seek(offset)
+        data = read.read(count_size)
+        if len(data) != count_size:
+            raise HeaderError('TIFF IFD incomplete')
+        nr_entries = struct.unpack('{0}{1}'.format(endian, count_format), data)[0]
+
+        if z_dim == 0:
+            data = read.read(nr_entries * entry_size)
+            if len(data) != nr_entries * entry_size:
+                raise HeaderError('TIFF IFD incomplete')
+            for idx in range(nr_entries):
+                tag, typ, _, value = struct.unpack(
+                    '{0}{1}'.format(endian, entry_format),
+                    data[idx * entry_size:(idx + 1) * entry_size]
+                    )
+                if tag in (TIFF_IMAGE_WIDTH, TIFF_IMAGE_LENGTH):
+                    value_format, value_size = TIFF_TYPE_SIZE[typ]
+                    value = struct.unpack(
+                        '{0}{1}'.format(endian, value_format),
+                        value[:value_size]
+                        )[0]
+                    if tag == TIFF_IMAGE_WIDTH:
+                        x_dim = value
+                    else:
+                        y_dim = value
+        else:
+            read.seek(nr_entries * entry_size, os.SEEK_CUR)
+
+        data = read.read(offset_size)
+        if len(data) != offset_size:
+            raise HeaderError('TIFF IFD incomplete')
+        offset = struct.unpack('{0}{1}'.format(endian, offset_format), data)[0]
+        z_dim += 1
+
+    return x_dim, y_dim, z_dim
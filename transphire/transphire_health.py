@@ -0,0 +1,310 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import threading
+import time
+import multiprocessing as mp
+
+
+STATUS_UNKNOWN = 0
+STATUS_OK = 1
+STATUS_MISSING = 2
+STATUS_TIMEOUT = 3
+STATUS_ERROR = 4
+
+
+def check_if_mounted(directory):
+    """
+    Check, if the mount point is still present.
+
+    Arguments:
+    directory - Directory to check.
+
+    Return:
+    True, if the mount point is still present, else False
+    """
+    folder_names = directory.split('/')
+    # Return, if the process is not running.
+    if folder_names[-1] == 'False' or folder_names[-1] == 'Later':
+        return False
+    else:
+        pass
+
+    for idx in range(1, len(folder_names)+1):
+        current_dir = os.path.join(*folder_names[0:idx])
+        if not current_dir:
+            continue
+        elif folder_names[0]:
+            pass
+        else:
+            current_dir = '/{0}'.format(current_dir)
+
+        if os.path.ismount(current_dir):
+            return True
+        else:
+            try:
+                os.listdir(current_dir)
+            except PermissionError:
+                return True
+            else:
+                pass
+    return False
+
+
+def probe(folder):
+    """
+    Filesystem probe of a folder.
+    Both values come from the same statvfs call.
+
+    Arguments:
+    folder - Folder to check
+
+    Return:
+    Total bytes, used bytes, free bytes, True if the mount point is present
+    """
+    usage = shutil.disk_usage(folder)
+    return usage.total, usage.used, usage.free, check_if_mounted(folder)
+
+
+class FsHealth(object):
+    """
+    Cached filesystem health of the folders used by the processes.
+
+    One background thread probes every folder each ttl seconds and writes the
+    results to shared memory. Every probe runs in its own thread and is
+    marked as timed out if it does not return within timeout seconds, so a
+    hanging mount does not block the other folders or the processes. A
+    folder with a hanging probe is not probed again until the probe returns.
+    The processes only read the shared snapshot and do not touch the
+    filesystem. Folders that were not registered are probed directly.
+    The health object must be created before the fork, the background thread
+    runs in the process that calls start.
+    """
+
+    def __init__(self, folders, ttl=10, timeout=5, probe_func=probe):
+        """
+        Initialize object variables.
+
+        Arguments:
+        folders - List of folders to check
+        ttl - Time in seconds between two probes of a folder
+        timeout - Time in seconds after that a probe counts as hanging
+        probe_func - Function that probes a folder, see probe
+
+        Return:
+        None
+        """
+        super(FsHealth, self).__init__()
+        self.folders = []
+        for folder in folders:
+            if folder and folder not in self.folders:
+                self.folders.append(folder)
+        self.index = dict([(folder, idx) for idx, folder in enumerate(self.folders)])
+        self.ttl = ttl
+        self.timeout = timeout
+        self.probe_func = probe_func
+
+        size = max(1, len(self.folders))
+        self.lock = mp.Lock()
+        self.status = mp.RawArray('b', size)
+        self.total = mp.RawArray('d', size)
+        self.used = mp.RawArray('d', size)
+        self.free = mp.RawArray('d', size)
+        self.mounted = mp.RawArray('b', size)
+        self.timestamp = mp.RawArray('d', size)
+        self.nr_probes = mp.RawValue('q', 0)
+        self.nr_timeouts = mp.RawValue('q', 0)
+
+        self.pending = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.closed = False
+
+    def set_result(self, folder, status, result=None):
+        idx = self.index[folder]
+        with self.lock:
+            self.status[idx] = status
+            if result is not None:
+                self.total[idx], self.used[idx], self.free[idx], self.mounted[idx] = result
+            self.timestamp[idx] = time.time()
+            self.nr_probes.value += 1
+            if status == STATUS_TIMEOUT:
+                self.nr_timeouts.value += 1
+
+    def probe_folder(self, folder):
+        try:
+            result = self.probe_func(folder)
+        except FileNotFoundError:
+            self.set_result(folder, STATUS_MISSING, (0, 0, 0, False))
+        except OSError:
+            self.set_result(folder, STATUS_ERROR, (0, 0, 0, False))
+        else:
+            self.set_result(folder, STATUS_OK, result)
+
+    def refresh(self):
+        """
+        Probe all folders that do not have a hanging probe.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        started = []
+        for folder in self.folders:
+            thread = self.pending.get(folder)
+            if thread is not None and thread.is_alive():
+                continue
+            thread = threading.Thread(target=self.probe_folder, args=(folder,), daemon=True)
+            thread.start()
+            self.pending[folder] = thread
+            started.append(thread)
+
+        deadline = time.time() + self.timeout
+        for thread in started:
+            thread.join(max(0, deadline - time.time()))
+
+        for folder, thread in self.pending.items():
+            if thread.is_alive():
+                self.set_result(folder, STATUS_TIMEOUT)
+
+    def start(self):
+        """
+        Probe all folders once and start the background thread.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        self.pid = os.getpid()
+        self.closed = False
+        self.wakeup.clear()
+        self.refresh()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.ttl)
+            if not self.closed:
+                self.refresh()
+
+    def close(self):
+        """
+        Stop the background thread.
+        Hanging probes are daemon threads and do not block the exit.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        self.closed = True
+        if self.thread is not None and self.pid == os.getpid():
+            self.wakeup.set()
+            self.thread.join()
+        self.thread = None
+        self.pid = None
+
+    def get(self, folder):
+        """
+        Last known health of a folder.
+
+        Arguments:
+        folder - Folder to check
+
+        Return:
+        Dictionary with status, total, used, free, mounted and age in seconds
+        """
+        try:
+            idx = self.index[folder]
+        except KeyError:
+            # Not registered: Probe directly
+            try:
+                total, used, free, mounted = self.probe_func(folder)
+            except FileNotFoundError:
+                status, total, used, free, mounted = STATUS_MISSING, 0, 0, 0, False
+            except OSError:
+                status, total, used, free, mounted = STATUS_ERROR, 0, 0, 0, False
+            else:
+                status = STATUS_OK
+            return {
+                'status': status,
+                'total': total,
+                'used': used,
+                'free': free,
+                'mounted': bool(mounted),
+                'age': 0.0,
+                }
+
+        with self.lock:
+            return {
+                'status': self.status[idx],
+                'total': self.total[idx],
+                'used': self.used[idx],
+                'free': self.free[idx],
+                'mounted': bool(self.mounted[idx]),
+                'age': time.time() - self.timestamp[idx] if self.timestamp[idx] else float('inf'),
+                }
+
+    def is_mounted(self, folder):
+        """
+        Check, if the mount point of a folder was present at the last probe.
+
+        Arguments:
+        folder - Folder to check
+
+        Return:
+        True, if the mount point is present and responding, else False
+        """
+        health = self.get(folder)
+        return bool(health['status'] == STATUS_OK and health['mounted'])
+
+
+def get_fs_health(settings, folders):
+    """
+    Create a filesystem health object with the Output settings.
+    Settings of older settings files fall back to the defaults.
+
+    Arguments:
+    settings - TranSPHIRE settings
+    folders - List of folders to check
+
+    Return:
+    FsHealth object
+    """
+    try:
+        ttl = float(settings['Output']['Health check interval'])
+    except KeyError:
+        ttl = 10
+    try:
+        timeout = float(settings['Output']['Health check timeout'])
+    except KeyError:
+        timeout = 5
+
+    return FsHealth(
+        folders,
+        ttl=max(0.1, ttl),
+        timeout=max(0.1, timeout),
+        )
@@ -22,6 +22,7 @@ import re
 import numpy as np
 
 from . import transphire_utils as tu
+from . import transphire_cache as tcache
 
 
 def get_header(input_file):
@@ -59,6 +60,109 @@ def get_header(input_file):
         return header, idx
 
 
+def read_data(file_name, dtype=float, skip_header=0):
+    """
+    Read a data file with np.genfromtxt.
+
+    Arguments:
+    file_name - File to read
+    dtype - Data type of the columns
+    skip_header - Number of header lines to skip
+
+    Return:
+    Data array
+    """
+    return np.genfromtxt(
+        file_name,
+        dtype=dtype,
+        skip_header=skip_header,
+        )
+
+
+def read_star_data(file_name):
+    """
+    Read the data of a relion star file.
+
+    Arguments:
+    file_name - Star file to read
+
+    Return:
+    Data array
+    """
+    dtype, max_header = get_header(input_file=file_name)
+    return read_data(file_name, dtype=dtype, skip_header=max_header)
+
+
+def read_ctffind_data(file_name, dtype):
+    """
+    Read the data and the input micrograph name of a CTFFIND output file.
+
+    Arguments:
+    file_name - CTFFIND output file
+    dtype - Data type of the columns
+
+    Return:
+    Data array, input file name or None, if the data array is empty
+    """
+    data_name = read_data(file_name, dtype=dtype)
+    if data_name.size == 0:
+        return data_name, None
+
+    with open(file_name, 'r') as read:
+        content = read.read()
+    match_re = re.compile('# Input file: (.*?)\s+; Number of micrographs: 1')
+    return data_name, match_re.search(content, re.S).group(1)
+
+
+def count_lines(file_name):
+    """
+    Count the non empty lines of a file.
+
+    Arguments:
+    file_name - File to read
+
+    Return:
+    Number of non empty lines
+    """
+    with open(file_name, 'r') as read:
+        return len([entry for entry in read.readlines() if entry.strip()])
+
+
+def search_log(file_name, pattern):
+    """
+    Search a regular expression in a log file.
+
+    Arguments:
+    file_name - Log file to read
+    pattern - Regular expression, compiled with re.MULTILINE
+
+    Return:
+    Tuple of the match groups or None, if there is no match
+    """
+    with open(file_name, 'r') as read:
+        match = re.search(pattern, read.read(), re.MULTILINE)
+    if match is None:
+        return None
+    else:
+        return match.groups()
+
+
+def read_box_data(file_name):
+    """
+    Read a crYOLO box file.
+
+    Arguments:
+    file_name - Box file to read
+
+    Return:
+    Data array or None, if the file cannot be converted
+    """
+    try:
+        return read_data(file_name)
+    except ValueError:
+        return None
+
+
 def get_dtype_dict():
     """
     Dtype of the data plot array.
@@ -312,6 +416,7 @@ def dummy(name, name_no_feedback, settings, directory_name, import_name='', send
 
 
 def import_isac_v1_2(name, name_no_feedback, settings, directory_name, import_name='', send_data=None):
+    cache = tcache.get_parse_cache(directory_name, 'import_isac_v1_2', import_name=import_name)
     files = [
         entry for entry in glob.glob(
         '{0}/*/ISAC2'.format(directory_name)
@@ -320,15 +425,13 @@ def import_isac_v1_2(name, name_no_feedback, settings, directory_name, import_na
     useable_files = []
     for file_name in files:
         try:
-            with open(os.path.join(file_name, 'processed_images.txt'), 'r') as read:
-                accepted = len([entry for entry in read.readlines() if entry.strip()])
+            accepted = cache.get(os.path.join(file_name, 'processed_images.txt'), count_lines)
         except FileNotFoundError:
             accepted = 0
         except Exception as e:
             print('File corrupt: {} - {}'.format(file_name, str(e)))
         try:
-            with open(os.path.join(file_name, 'not_processed_images.txt'), 'r') as read:
-                rejected = len([entry for entry in read.readlines() if entry.strip()])
+            rejected = cache.get(os.path.join(file_name, 'not_processed_images.txt'), count_lines)
         except FileNotFoundError:
             rejected = 0
         except Exception as e:
@@ -337,6 +440,7 @@ def import_isac_v1_2(name, name_no_feedback, settings, directory_name, import_na
             '{0}/png/*'.format(os.path.dirname(file_name))
             )])
         useable_files.append([os.path.dirname(file_name), accepted, rejected, classes])
+    cache.save()
 
     useable_files_jpg = [
         tu.get_name(entry)
@@ -384,6 +488,7 @@ def import_isac_v1_2(name, name_no_feedback, settings, directory_name, import_na
 
 
 def import_cinderella_v0_3_1(name, name_no_feedback, settings, directory_name, import_name='', send_data=None):
+    cache = tcache.get_parse_cache(directory_name, 'import_cinderella_v0_3_1', import_name=import_name)
     files = [
         entry for entry in glob.glob(
         '{0}/{1}*_transphire.log'.format(directory_name, import_name)
@@ -392,19 +497,19 @@ def import_cinderella_v0_3_1(name, name_no_feedback, settings, directory_name, i
     useable_files = []
     for file_name in files:
         try:
-            with open(file_name, 'r') as read:
-                # Regex documentation can be found here: https://regex101.com/r/MxOgyg/3
-                match = re.search(
-                    '^\s*Good(?: classes|):\s*(\d+) .*$(?:\n|\r\n)(?:\n|\r\n)(?:\n|\r\n)^\s*Bad(?: classes|):\s*(\d+) .*$(?:\n|\r\n)(?:\n|\r\n)^Bad Particles(?:\n|\r\n)(\d+)(?:\n|\r\n)Good Particles(?:\n|\r\n)(\d+)$',
-                    read.read(),
-                    re.MULTILINE
-                    )
+            # Regex documentation can be found here: https://regex101.com/r/MxOgyg/3
+            match = cache.get(
+                file_name,
+                search_log,
+                '^\s*Good(?: classes|):\s*(\d+) .*$(?:\n|\r\n)(?:\n|\r\n)(?:\n|\r\n)^\s*Bad(?: classes|):\s*(\d+) .*$(?:\n|\r\n)(?:\n|\r\n)^Bad Particles(?:\n|\r\n)(\d+)(?:\n|\r\n)Good Particles(?:\n|\r\n)(\d+)$',
+                )
         except FileNotFoundError:
             continue
         except Exception as e:
             print('File corrupt: {} - {}'.format(file_name, str(e)))
         if match is not None:
-            useable_files.append([file_name, int(match.group(1)), int(match.group(2)), int(match.group(3)), int(match.group(4))])
+            useable_files.append([file_name, int(match[0]), int(match[1]), int(match[2]), int(match[3])])
+    cache.save()
 
     useable_files_jpg = [
         tu.get_name(entry).replace('_good', '').replace('_bad', '')
@@ -460,6 +565,7 @@ def import_cinderella_v0_3_1(name, name_no_feedback, settings, directory_name, i
 
 
 def import_window_v1_2(name, name_no_feedback, settings, directory_name, import_name='', send_data=None):
+    cache = tcache.get_parse_cache(directory_name, 'import_window_v1_2', import_name=import_name)
     files = [
         entry for entry in glob.glob(
         '{0}/{1}*_transphire.log'.format(directory_name, import_name)
@@ -468,18 +574,18 @@ def import_window_v1_2(name, name_no_feedback, settings, directory_name, import_
     useable_files = []
     for file_name in files:
         try:
-            with open(file_name, 'r') as read:
-                match = re.search(
-                    '^.*Processed\s+:\s+(\d+).*$(?:\n|\r\n)^.*Rejected by out of boundary\s+:\s+(\d+).*$',
-                    read.read(),
-                    re.MULTILINE
-                    )
+            match = cache.get(
+                file_name,
+                search_log,
+                '^.*Processed\s+:\s+(\d+).*$(?:\n|\r\n)^.*Rejected by out of boundary\s+:\s+(\d+).*$',
+                )
         except FileNotFoundError:
             continue
         except Exception as e:
             print('File corrupt: {} - {}'.format(file_name, str(e)))
         if match is not None:
-            useable_files.append([file_name, match.group(1), match.group(2)])
+            useable_files.append([file_name, match[0], match[1]])
+    cache.save()
 
     useable_files_jpg = [
         tu.get_name(entry)
@@ -545,13 +651,13 @@ def import_ctffind_v4_1_8(name, name_no_feedback, settings, directory_name, impo
         ) if not entry.endswith('_avrot.txt') and not '_transphire_' in entry
         ]
 
+    dtype_import = get_dtype_import_dict()[dtype_import_dict_name]
+    cache = tcache.get_parse_cache(directory_name, 'import_ctffind_v4_1_8', tag=str(dtype_import), import_name=import_name)
     useable_files = []
+    input_names = {}
     for file_name in files:
         try:
-            data_name = np.genfromtxt(
-                file_name,
-                dtype=get_dtype_import_dict()[dtype_import_dict_name],
-                )
+            data_name, input_name = cache.get(file_name, read_ctffind_data, dtype_import)
         except ValueError:
             continue
         except IOError:
@@ -561,8 +667,10 @@ def import_ctffind_v4_1_8(name, name_no_feedback, settings, directory_name, impo
         else:
             if data_name.size > 0:
                 useable_files.append([file_name, data_name])
+                input_names[file_name] = input_name
             else:
                 continue
+    cache.save()
 
     useable_files_jpg = set([
         tu.get_name(entry)
@@ -593,16 +701,12 @@ def import_ctffind_v4_1_8(name, name_no_feedback, settings, directory_name, impo
     data.fill(0)
     data_original.fill(0)
 
-    match_re = re.compile('# Input file: (.*?)\s+; Number of micrographs: 1')
-
     file_names = []
     jpg_json_data = []
     jpg_dirs = glob.glob(os.path.join(directory_name, 'jpg*'))
     json_dirs = glob.glob(os.path.join(directory_name, 'json*'))
     for file_name, _ in useable_files:
-        with open(file_name, 'r') as read:
-            content = read.read()
-        file_names.append(match_re.search(content, re.S).group(1))
+        file_names.append(input_names[file_name])
 
         file_name_base = tu.get_name(file_name)
         jpgs = [os.path.join(jpg_name, '{}.jpg'.format(file_name_base)) for jpg_name in jpg_dirs]
@@ -652,15 +756,11 @@ def import_gctf_v1_06(name, name_no_feedback, settings, directory_name, import_n
     suffix = '_gctf'
     dtype_dict_name = tu.find_best_match(name_no_feedback, get_dtype_dict())
 
+    cache = tcache.get_parse_cache(directory_name, 'import_gctf_v1_06', import_name=import_name)
     useable_files = []
     for file_name in sorted(glob.glob('{0}/{1}*{2}.star'.format(directory_name, import_name, suffix))):
         try:
-            dtype, max_header = get_header(input_file=file_name)
-            data_name = np.genfromtxt(
-                file_name,
-                dtype=dtype,
-                skip_header=max_header,
-                )
+            data_name = cache.get(file_name, read_star_data)
         except ValueError:
             continue
         except IOError:
@@ -672,6 +772,7 @@ def import_gctf_v1_06(name, name_no_feedback, settings, directory_name, import_n
                 useable_files.append([file_name, data_name])
             else:
                 continue
+    cache.save()
 
     useable_files_jpg = set([
         tu.get_name(entry)
@@ -763,13 +864,12 @@ def import_cter_v1_0(name, name_no_feedback, settings, directory_name, import_na
     """
     dtype_import_dict_name = tu.find_best_match(name_no_feedback, get_dtype_import_dict())
 
+    dtype_import = get_dtype_import_dict()[dtype_import_dict_name]
+    cache = tcache.get_parse_cache(directory_name, 'import_cter_v1_0', tag=str(dtype_import), import_name=import_name)
     useable_files = []
     for file_name in sorted(glob.glob('{0}/{1}*/partres.txt'.format(directory_name, import_name))):
         try:
-            data_name = np.genfromtxt(
-                file_name,
-                dtype=get_dtype_import_dict()[dtype_import_dict_name],
-                )
+            data_name = cache.get(file_name, read_data, dtype=dtype_import)
         except ValueError:
             continue
         except IOError:
@@ -781,6 +881,7 @@ def import_cter_v1_0(name, name_no_feedback, settings, directory_name, import_na
                 useable_files.append([os.path.dirname(file_name), data_name])
             else:
                 continue
+    cache.save()
 
     useable_files_jpg = set([
         tu.get_name(entry)
@@ -870,13 +971,12 @@ def import_motion_cor_2_v1_0_0(name, name_no_feedback, settings, directory_name,
         dtype=str
         )
 
+    dtype_import = get_dtype_import_dict()[dtype_import_dict_name]
+    cache = tcache.get_parse_cache(directory_name, 'import_motion_cor_2_v1_0_0', tag=str(dtype_import), import_name=import_name)
     useable_files = []
     for file_name in files:
         try:
-            array = np.genfromtxt(
-                file_name,
-                dtype=get_dtype_import_dict()[dtype_import_dict_name]
-                )
+            array = cache.get(file_name, read_data, dtype=dtype_import)
         except ValueError:
             continue
         except IOError:
@@ -913,10 +1013,7 @@ def import_motion_cor_2_v1_0_0(name, name_no_feedback, settings, directory_name,
     data_original = []
     for idx, file_name in enumerate(useable_files):
         try:
-            data_name = np.genfromtxt(
-                file_name,
-                dtype=get_dtype_import_dict()[dtype_import_dict_name]
-                )
+            data_name = cache.get(file_name, read_data, dtype=dtype_import)
         except IOError:
             continue
         else:
@@ -958,6 +1055,7 @@ def import_motion_cor_2_v1_0_0(name, name_no_feedback, settings, directory_name,
             '{0}.json'.format(tu.get_name(tu.get_name(file_name)))
             )
         data[idx]['image'] = ';;;'.join(glob.glob(jpg_name) + glob.glob(json_name))
+    cache.save()
 
     sort_idx = np.argsort(data, order='file_name')
     data = data[sort_idx]
@@ -1021,13 +1119,16 @@ def import_cryolo_v1_8_0(name, name_no_feedback, settings, directory_name, impor
             break
 
     files_box = np.array(box_files)
+    cache = tcache.get_parse_cache(directory_name, 'import_cryolo_v1_8_0', import_name=import_name)
     useable_files = []
     for file_name in files_box:
         data_cbox = np.array([0])
         data_box_x = np.array([0])
         data_box_y = np.array([0])
         try:
-            data_imported = np.genfromtxt(file_name)
+            data_imported = cache.get(file_name, read_box_data)
+            if data_imported is None:
+                raise ValueError
         except ValueError:
             useable_files.append([os.path.splitext(os.path.basename(file_name))[0], 0, data_cbox, data_box_x, data_box_y])
         except IOError:
@@ -1040,6 +1141,7 @@ def import_cryolo_v1_8_0(name, name_no_feedback, settings, directory_name, impor
                 data_box_x = np.atleast_2d(data_imported)[:, 5]
                 data_box_y = np.atleast_2d(data_imported)[:, 6]
             useable_files.append([os.path.splitext(os.path.basename(file_name))[0], data_imported.shape[0], data_cbox, data_box_x, data_box_y])
+    cache.save()
 
     useable_files_jpg = [
         tu.get_name(entry)
@@ -1105,10 +1207,13 @@ def import_cryolo_v1_0_4(name, name_no_feedback, settings, directory_name, impor
             break
 
     files_box = np.array(box_files)
+    cache = tcache.get_parse_cache(directory_name, 'import_cryolo_v1_0_4', import_name=import_name)
     useable_files = []
     for file_name in files_box:
         try:
-            data_imported = np.genfromtxt(file_name)
+            data_imported = cache.get(file_name, read_box_data)
+            if data_imported is None:
+                raise ValueError
         except ValueError:
             useable_files.append([os.path.splitext(os.path.basename(file_name))[0], 0, np.array([0])])
         except IOError:
@@ -1125,6 +1230,7 @@ def import_cryolo_v1_0_4(name, name_no_feedback, settings, directory_name, impor
                 data_box_x = np.array([0])
                 data_box_y = np.array([0])
             useable_files.append([os.path.splitext(os.path.basename(file_name))[0], data_imported.shape[0], data_cbox, data_box_x, data_box_y])
+    cache.save()
 
     useable_files_jpg = [
         tu.get_name(entry)
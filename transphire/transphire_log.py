@@ -0,0 +1,230 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import threading
+
+
+class LogWriter(object):
+    """
+    Buffered writer for the log and error files.
+
+    Records are appended to a per file buffer and written in one batch if the
+    buffer exceeds max_records or max_bytes, or at the latest after max_delay
+    seconds by a background thread. The records are written unchanged, so the
+    files look like with one open and append per record.
+    Files can be rotated to file.1, file.2, ... before they exceed rotate_size
+    and every batch can be synced to disk.
+    The background thread is started with the first record, so the writer can
+    be created before a fork and is only used in the process that writes.
+    """
+
+    def __init__(
+            self,
+            max_records=1000,
+            max_bytes=1024**2,
+            max_delay=1,
+            rotate_size=0,
+            rotate_count=5,
+            fsync=False
+            ):
+        """
+        Initialize object variables.
+
+        Arguments:
+        max_records - Number of buffered records that trigger a write
+        max_bytes - Number of buffered bytes that trigger a write
+        max_delay - Maximum time in seconds a record stays in the buffer
+        rotate_size - Rotate a file before it gets larger than this size in bytes, 0 disables rotation
+        rotate_count - Number of rotated files to keep
+        fsync - Sync every batch to disk
+
+        Return:
+        None
+        """
+        super(LogWriter, self).__init__()
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.rotate_size = rotate_size
+        self.rotate_count = rotate_count
+        self.fsync = fsync
+
+        self.buffer = {}
+        self.locks = {}
+        self.nr_records = 0
+        self.nr_bytes = 0
+        self.nr_writes = 0
+        self.buffer_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.closed = False
+
+    def start(self):
+        self.pid = os.getpid()
+        self.closed = False
+        self.wakeup.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.max_delay)
+            self.wakeup.clear()
+            self.flush()
+
+    def write(self, file_name, text, lock=None):
+        """
+        Add a record to the buffer of a file.
+
+        Arguments:
+        file_name - File to append to
+        text - Record to append
+        lock - Lock to hold while writing, if the file is shared by other processes
+
+        Return:
+        None
+        """
+        with self.buffer_lock:
+            if self.pid != os.getpid():
+                self.start()
+            try:
+                self.buffer[file_name].append(text)
+            except KeyError:
+                self.buffer[file_name] = [text]
+            if lock is not None:
+                self.locks[file_name] = lock
+            self.nr_records += 1
+            self.nr_bytes += len(text)
+            is_full = bool(
+                self.nr_records >= self.max_records or
+                self.nr_bytes >= self.max_bytes
+                )
+        if is_full:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered records.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        with self.write_lock:
+            with self.buffer_lock:
+                buffer = self.buffer
+                self.buffer = {}
+                self.nr_records = 0
+                self.nr_bytes = 0
+            for file_name, records in buffer.items():
+                lock = self.locks.get(file_name)
+                if lock is not None:
+                    lock.acquire()
+                try:
+                    self.write_file(file_name, ''.join(records))
+                finally:
+                    if lock is not None:
+                        lock.release()
+
+    def write_file(self, file_name, data):
+        try:
+            if self.rotate_size:
+                self.rotate(file_name, len(data))
+            with open(file_name, 'a+') as write:
+                write.write(data)
+                if self.fsync:
+                    write.flush()
+                    os.fsync(write.fileno())
+        except FileNotFoundError:
+            # Log folder does not exist (anymore)
+            pass
+        except OSError as e:
+            print('Could not write to {0}: {1}'.format(file_name, e))
+        else:
+            self.nr_writes += 1
+
+    def rotate(self, file_name, size):
+        try:
+            current_size = os.path.getsize(file_name)
+        except FileNotFoundError:
+            return
+        if current_size == 0 or current_size + size <= self.rotate_size:
+            return
+
+        for idx in range(self.rotate_count - 1, 0, -1):
+            old_name = '{0}.{1}'.format(file_name, idx)
+            if os.path.exists(old_name):
+                os.replace(old_name, '{0}.{1}'.format(file_name, idx + 1))
+        if self.rotate_count > 0:
+            os.replace(file_name, '{0}.1'.format(file_name))
+        else:
+            os.remove(file_name)
+
+    def close(self):
+        """
+        Stop the background thread and write the remaining records.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        self.closed = True
+        if self.thread is not None and self.pid == os.getpid():
+            self.wakeup.set()
+            self.thread.join()
+        self.thread = None
+        self.pid = None
+        self.flush()
+
+
+def get_log_writer(settings, rotate=True):
+    """
+    Create a log writer with the Output settings.
+    Settings of older settings files fall back to the defaults.
+
+    Arguments:
+    settings - TranSPHIRE settings
+    rotate - Use the rotation settings
+
+    Return:
+    LogWriter object
+    """
+    try:
+        max_delay = float(settings['Output']['Log flush interval'])
+    except KeyError:
+        max_delay = 1
+    try:
+        rotate_size = int(float(settings['Output']['Log rotation size']) * 1024**2)
+    except KeyError:
+        rotate_size = 0
+    try:
+        fsync = bool(settings['Output']['Log fsync'] == 'True')
+    except KeyError:
+        fsync = False
+
+    return LogWriter(
+        max_delay=max(0.01, max_delay),
+        rotate_size=rotate_size if rotate else 0,
+        fsync=fsync,
+        )
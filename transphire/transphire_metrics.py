@@ -0,0 +1,342 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import json
+import os
+import time
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+PHASES = ('wait', 'run', 'total')
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest rank percentile.
+
+    Arguments:
+    sorted_values - Sorted list of values
+    fraction - Percentile between 0 and 1
+
+    Return:
+    Percentile, None for an empty list
+    """
+    if not sorted_values:
+        return None
+    idx = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[idx]
+
+
+class MetricsSender(object):
+    """
+    Send the timestamps of the queue items to the MetricsCollector of the
+    ProcessWorker. Every call is a non blocking put to a multiprocessing
+    queue. Without a queue the calls do nothing.
+    """
+
+    def __init__(self, queue=None):
+        """
+        Initialize object variables.
+
+        Arguments:
+        queue - multiprocessing.Queue that is read by the collector or None
+
+        Return:
+        None
+        """
+        super(MetricsSender, self).__init__()
+        self.queue = queue
+
+    def send(self, event, stage, root_name, status=None):
+        if self.queue is not None:
+            self.queue.put((event, stage, root_name, time.time(), status))
+
+    def enqueue(self, stage, root_name):
+        self.send('enqueue', stage, root_name)
+
+    def dequeue(self, stage, root_name):
+        self.send('dequeue', stage, root_name)
+
+    def start(self, stage, root_name):
+        self.send('start', stage, root_name)
+
+    def end(self, stage, root_name, success):
+        self.send('end', stage, root_name, 'ok' if success else 'error')
+
+
+class StageMetrics(object):
+    """
+    Latency samples and counters of one stage.
+    """
+
+    def __init__(self, max_samples, window):
+        super(StageMetrics, self).__init__()
+        self.window = window
+        self.samples = dict([
+            (phase, collections.deque(maxlen=max_samples))
+            for phase in PHASES
+            ])
+        self.sums = dict([(phase, 0.0) for phase in PHASES])
+        self.counts = dict([(phase, 0) for phase in PHASES])
+        self.items = {'ok': 0, 'error': 0}
+        self.finished = collections.deque()
+
+    def add(self, phase, value):
+        if value is None or value < 0:
+            return
+        self.samples[phase].append(value)
+        self.sums[phase] += value
+        self.counts[phase] += 1
+
+    def finish(self, status, timestamp):
+        self.items[status] += 1
+        if status == 'ok':
+            self.finished.append(timestamp)
+
+    def get_throughput(self, now):
+        while self.finished and self.finished[0] < now - self.window:
+            self.finished.popleft()
+        return len(self.finished) / self.window * 60
+
+
+class MetricsCollector(object):
+    """
+    Per stage latency and throughput of the queue items.
+
+    The processes send enqueue, dequeue, start and end timestamps of every
+    item. The wait time is the time from the enqueue to the dequeue, the run
+    time the time from the start to the end and the total time the time from
+    the enqueue to the end. Items that are put back into a queue after an
+    error start a new wait time.
+    The last max_samples latencies of every stage are used for the p50, p95
+    and p99 percentiles, the throughput is the number of finished items per
+    minute in the last window seconds.
+    """
+
+    def __init__(self, max_samples=10000, window=300):
+        """
+        Initialize object variables.
+
+        Arguments:
+        max_samples - Number of latencies per stage and phase used for the percentiles
+        window - Time in seconds used for the throughput
+
+        Return:
+        None
+        """
+        super(MetricsCollector, self).__init__()
+        self.max_samples = max_samples
+        self.window = window
+        self.stages = {}
+        self.pending = {}
+        self.last_export = 0
+
+    def get_stage(self, stage):
+        try:
+            return self.stages[stage]
+        except KeyError:
+            self.stages[stage] = StageMetrics(self.max_samples, self.window)
+            return self.stages[stage]
+
+    def add_event(self, event):
+        """
+        Add an event of a MetricsSender.
+
+        Arguments:
+        event - Tuple of event name, stage, root name, timestamp and status
+
+        Return:
+        Dictionary with the timestamps of the item, if it is finished, else None
+        """
+        name, stage, root_name, timestamp, status = event
+        stage_metrics = self.get_stage(stage)
+        key = (stage, root_name)
+        if name == 'enqueue':
+            if 'start' in self.pending.get(key, {}):
+                # Put back after an error before the end of the run
+                self.pending[key]['requeue'] = timestamp
+            else:
+                # A new enqueue starts a new wait time
+                self.pending[key] = {'enqueue': timestamp}
+            return None
+
+        item = self.pending.setdefault(key, {})
+        item[name] = timestamp
+        if name != 'end':
+            return None
+
+        if 'requeue' in item:
+            self.pending[key] = {'enqueue': item['requeue']}
+        else:
+            del self.pending[key]
+        enqueue = item.get('enqueue')
+        dequeue = item.get('dequeue')
+        start = item.get('start')
+        if enqueue is not None and dequeue is not None:
+            stage_metrics.add('wait', dequeue - enqueue)
+        if start is not None:
+            stage_metrics.add('run', timestamp - start)
+        if enqueue is not None:
+            stage_metrics.add('total', timestamp - enqueue)
+        stage_metrics.finish(status, timestamp)
+        return {
+            'stage': stage,
+            'root_name': root_name,
+            'status': status,
+            'enqueue': enqueue,
+            'dequeue': dequeue,
+            'start': start,
+            'end': timestamp,
+            }
+
+    def get_summary(self, queue_depths=None, running=None):
+        """
+        Aggregated metrics of all stages.
+
+        Arguments:
+        queue_depths - Dictionary stage -> number of queued items
+        running - Dictionary stage -> number of running items
+
+        Return:
+        Dictionary stage -> metrics dictionary
+        """
+        if queue_depths is None:
+            queue_depths = {}
+        if running is None:
+            running = {}
+        now = time.time()
+        summary = {}
+        for stage in sorted(set(self.stages) | set(queue_depths)):
+            stage_metrics = self.get_stage(stage)
+            entry = {
+                'items_ok': stage_metrics.items['ok'],
+                'items_error': stage_metrics.items['error'],
+                'throughput_per_min': stage_metrics.get_throughput(now),
+                'queue_depth': queue_depths.get(stage),
+                'running': running.get(stage),
+                }
+            for phase in PHASES:
+                values = sorted(stage_metrics.samples[phase])
+                for quantile in QUANTILES:
+                    entry['{0}_p{1}'.format(phase, int(quantile * 100))] = percentile(values, quantile)
+                entry['{0}_sum'.format(phase)] = stage_metrics.sums[phase]
+                entry['{0}_count'.format(phase)] = stage_metrics.counts[phase]
+            summary[stage] = entry
+        return summary
+
+    @staticmethod
+    def to_prometheus(summary):
+        """
+        Prometheus text format of a summary.
+
+        Arguments:
+        summary - Return value of get_summary
+
+        Return:
+        Text
+        """
+        lines = [
+            '# HELP transphire_stage_latency_seconds Wait, run and total time of the items per stage.',
+            '# TYPE transphire_stage_latency_seconds summary',
+            ]
+        for stage, entry in summary.items():
+            for phase in PHASES:
+                labels = 'stage="{0}",phase="{1}"'.format(stage, phase)
+                for quantile in QUANTILES:
+                    value = entry['{0}_p{1}'.format(phase, int(quantile * 100))]
+                    if value is not None:
+                        lines.append('transphire_stage_latency_seconds{{{0},quantile="{1}"}} {2}'.format(
+                            labels, quantile, value
+                            ))
+                lines.append('transphire_stage_latency_seconds_sum{{{0}}} {1}'.format(labels, entry['{0}_sum'.format(phase)]))
+                lines.append('transphire_stage_latency_seconds_count{{{0}}} {1}'.format(labels, entry['{0}_count'.format(phase)]))
+
+        lines.extend([
+            '# HELP transphire_stage_items_total Finished items per stage.',
+            '# TYPE transphire_stage_items_total counter',
+            ])
+        for stage, entry in summary.items():
+            for status in ('ok', 'error'):
+                lines.append('transphire_stage_items_total{{stage="{0}",status="{1}"}} {2}'.format(
+                    stage, status, entry['items_{0}'.format(status)]
+                    ))
+
+        for name, key, text in (
+                ('throughput_items_per_minute', 'throughput_per_min', 'Finished items per minute, averaged over the throughput window.'),
+                ('queue_depth', 'queue_depth', 'Number of queued items.'),
+                ('running', 'running', 'Number of running items.'),
+                ):
+            lines.extend([
+                '# HELP transphire_stage_{0} {1}'.format(name, text),
+                '# TYPE transphire_stage_{0} gauge'.format(name),
+                ])
+            for stage, entry in summary.items():
+                if entry[key] is not None:
+                    lines.append('transphire_stage_{0}{{stage="{1}"}} {2}'.format(name, stage, entry[key]))
+        return '{0}\n'.format('\n'.join(lines))
+
+    def export(self, folder, log_writer, queue_depths=None, running=None):
+        """
+        Write the metrics to metrics.prom and append them to metrics.jsonl.
+
+        Arguments:
+        folder - Output folder
+        log_writer - LogWriter used for the JSON lines
+        queue_depths - Dictionary stage -> number of queued items
+        running - Dictionary stage -> number of running items
+
+        Return:
+        None
+        """
+        summary = self.get_summary(queue_depths, running)
+        prom_file = os.path.join(folder, 'metrics.prom')
+        temp_file = '{0}.tmp'.format(prom_file)
+        try:
+            with open(temp_file, 'w') as write:
+                write.write(self.to_prometheus(summary))
+            os.replace(temp_file, prom_file)
+        except FileNotFoundError:
+            # Log folder does not exist (anymore)
+            pass
+        log_writer.write(
+            os.path.join(folder, 'metrics.jsonl'),
+            '{0}\n'.format(json.dumps({'time': time.time(), 'stages': summary}))
+            )
+        self.last_export = time.time()
+
+
+def get_metrics(settings, queue):
+    """
+    Create the metrics sender with the Output settings.
+    Settings of older settings files fall back to the defaults.
+
+    Arguments:
+    settings - TranSPHIRE settings
+    queue - multiprocessing.Queue that is read by the collector
+
+    Return:
+    MetricsSender object, export interval in seconds, 0 if disabled
+    """
+    try:
+        interval = float(settings['Output']['Metrics interval'])
+    except KeyError:
+        interval = 30
+    if interval <= 0:
+        return MetricsSender(), 0
+    else:
+        return MetricsSender(queue), interval
@@ -21,12 +21,12 @@ import os
 #import re
 import collections as co
 import numpy as np
-import mrcfile as mrc
 import matplotlib
 matplotlib.use('QT5Agg')
 import matplotlib.image as mi
 
 from . import transphire_utils as tu
+from . import transphire_preview as tp
 from . import transphire_software as ts
 
 
@@ -962,60 +962,10 @@ def create_jpg_file(input_file, data, settings):
     with open(json_file, 'w') as write:
         json.dump(json_dict, write, indent=1)
 
-    arr_1 = None
-    arr_2 = None
-    try:
-        with mrc.open(input_file) as mrc_file:
-            input_data = mrc_file.data
-    except ValueError:
-        if os.path.splitext(input_file)[1] in ('.mrc', '.mrcs'):
-            with mrc.open(input_file, 'r+', permissive=True) as mrc_file:
-                mrc_file.header.map = mrc.constants.MAP_ID
-        with mrc.open(input_file) as mrc_file:
-            input_data = mrc_file.data
-    if len(input_data.shape) == 3:
-        input_data = np.sum(input_data, axis=0) / input_data.shape[0]
-    input_data = input_data - np.mean(input_data)
-    input_data = tu.normalize_image(input_data)
-
-    idx = 1
-    while True:
-        if np.max(input_data.shape) < idx * 4096:
-            break
-        idx += 1
-    original_shape = idx * 4096
     bin_shape = 512
-    ratio = original_shape / bin_shape
-    assert ratio.is_integer()
-    ratio = int(ratio)
-    pad_x = original_shape - input_data.shape[0]
-    pad_y = original_shape - input_data.shape[1]
-
-    input_data = np.pad(input_data, ((0, pad_x), (0, pad_y)), mode='median')
     shape = (bin_shape, bin_shape)
-    output_data = tu.rebin(input_data, shape)[:-int(1+pad_x//ratio), :-int(1+pad_y//ratio)]
-    arr_1 = output_data
-
-    tile_overlap = 512 / 2
-    tile_shape = 512
-    tile_ratio = original_shape / tile_overlap
-    assert tile_ratio.is_integer()
-    tile_ratio = int(tile_ratio)
-    tile_images = []
-    for x_val in range(tile_ratio):
-        if (x_val+1)*tile_shape > original_shape:
-            continue
-        for y_val in range(tile_ratio):
-            if (y_val+1)*tile_shape > original_shape:
-                continue
-            slices = (
-                slice(x_val*tile_shape, (x_val+1)*tile_shape, 1),
-                slice(y_val*tile_shape, (y_val+1)*tile_shape, 1),
-                )
-            pw = np.abs(np.fft.fftshift(np.fft.fft2(input_data[slices])))**2
-            tile_images.append(pw)
-    if tile_images:
-        arr_2 = np.sum(np.array(tile_images) / len(tile_images), axis=0)
+    arr_1, arr_2 = tp.create_preview(input_file, bin_shape=bin_shape, tile_shape=512)
+    if arr_2 is not None:
         arr_2 = tu.rebin(arr_2, shape)
 
         apix = None
@@ -0,0 +1,316 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import bisect
+import json
+import math
+import os
+import threading
+
+from . import transphire_import as ti
+from . import transphire_utils as tu
+
+
+def get_outlier_keys(dict_name):
+    """
+    Numeric columns of the plot data that are checked for outliers.
+
+    Arguments:
+    dict_name - Name of the plot data type
+
+    Return:
+    List of column names
+    """
+    return [
+        key
+        for key, dtype in ti.get_dtype_dict()[dict_name]
+        if dtype in ('<f8', '<i8')
+        ]
+
+
+def get_outlier_rows(dict_name, data):
+    """
+    Rows of the plot data as (file name, list of values).
+
+    Arguments:
+    dict_name - Name of the plot data type
+    data - Plot data array
+
+    Return:
+    List of rows
+    """
+    keys = get_outlier_keys(dict_name)
+    return [
+        (str(row['file_name']), [float(row[key]) for key in keys])
+        for row in data
+        ]
+
+
+def get_state_file(state_folder, directory, dict_name):
+    """
+    File of the saved window of an output folder.
+
+    Arguments:
+    state_folder - Folder for the saved windows
+    directory - Output folder of the plot data
+    dict_name - Name of the plot data type
+
+    Return:
+    File name
+    """
+    return os.path.join(
+        state_folder,
+        '{0}_{1}.json'.format(dict_name, os.path.basename(os.path.normpath(directory)))
+        )
+
+
+def sorted_median(values):
+    """
+    Median of a sorted list, like np.median.
+
+    Arguments:
+    values - Sorted list of floats
+
+    Return:
+    Median, nan for an empty list
+    """
+    length = len(values)
+    if length == 0:
+        return float('nan')
+    elif length % 2:
+        return values[length // 2]
+    else:
+        return (values[length // 2 - 1] + values[length // 2]) / 2
+
+
+class RunningWindow(object):
+    """
+    Values of the last size micrographs in file name order.
+
+    The plot data is sorted by file name, so the last values of the plot
+    data are the values of the largest file names. A micrograph with a
+    smaller file name than all micrographs of a full window does not change
+    it and a micrograph that is processed again replaces its values.
+    Every column keeps a sorted list of its values, so the median and the
+    median absolute deviation do not need to sort the window.
+    A size smaller than 1 keeps all values.
+    """
+
+    def __init__(self, size, keys):
+        """
+        Initialize object variables.
+
+        Arguments:
+        size - Number of values used for the median
+        keys - Column names
+
+        Return:
+        None
+        """
+        super(RunningWindow, self).__init__()
+        self.size = size
+        self.keys = list(keys)
+        self.names = []
+        self.rows = {}
+        self.values = dict([(key, []) for key in self.keys])
+        self.nans = dict([(key, 0) for key in self.keys])
+
+    def is_full(self):
+        return self.size > 0 and len(self.names) >= self.size
+
+    def add(self, name, values):
+        """
+        Add the values of a micrograph.
+
+        Arguments:
+        name - File name
+        values - List of values in the order of the keys
+
+        Return:
+        None
+        """
+        if name in self.rows:
+            self.remove(name)
+        elif self.is_full() and name < self.names[0]:
+            return
+
+        bisect.insort(self.names, name)
+        self.rows[name] = values
+        for key, value in zip(self.keys, values):
+            if math.isnan(value):
+                self.nans[key] += 1
+            else:
+                bisect.insort(self.values[key], value)
+
+        if self.size > 0 and len(self.names) > self.size:
+            self.remove(self.names[0])
+
+    def remove(self, name):
+        self.names.pop(bisect.bisect_left(self.names, name))
+        for key, value in zip(self.keys, self.rows.pop(name)):
+            if math.isnan(value):
+                self.nans[key] -= 1
+            else:
+                values = self.values[key]
+                values.pop(bisect.bisect_left(values, value))
+
+    def median(self, key):
+        if self.nans[key]:
+            return float('nan')
+        return sorted_median(self.values[key])
+
+    def mad(self, key):
+        median = self.median(key)
+        if math.isnan(median):
+            return median
+        return sorted_median(sorted([abs(value - median) for value in self.values[key]]))
+
+    def get_statistics(self):
+        """
+        Median and median absolute deviation of every column.
+
+        Arguments:
+        None
+
+        Return:
+        Dictionary key -> (median, MAD)
+        """
+        return dict([
+            (key, (self.median(key), self.mad(key)))
+            for key in self.keys
+            ])
+
+    def to_dict(self):
+        return {
+            'size': self.size,
+            'keys': self.keys,
+            'rows': [[name, self.rows[name]] for name in self.names],
+            }
+
+    @classmethod
+    def from_dict(cls, content, size):
+        """
+        Create a window from a saved state.
+
+        Arguments:
+        content - Return value of to_dict
+        size - Number of values used for the median
+
+        Return:
+        RunningWindow, None if the saved window is too small
+        """
+        if content['size'] > 0 and (size < 1 or size > content['size']):
+            # Values before the saved window are not known
+            if len(content['rows']) >= content['size']:
+                return None
+        window = cls(size, content['keys'])
+        for name, values in content['rows']:
+            window.add(name, values)
+        return window
+
+
+class OutlierDetector(object):
+    """
+    Running windows of the processes, served by the queue manager.
+
+    One window per plot data type and output folder is shared by all
+    processes of a type. The window is saved in the state folder after
+    every update and loaded on continue. If there is no saved window, the
+    process fills it once with all results of the output folder.
+    """
+
+    def __init__(self, state_folder):
+        """
+        Initialize object variables.
+
+        Arguments:
+        state_folder - Folder for the saved windows
+
+        Return:
+        None
+        """
+        super(OutlierDetector, self).__init__()
+        self.state_folder = state_folder
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def get_window(self, directory, dict_name, size):
+        key = (directory, dict_name)
+        window = self.windows.get(key)
+        if window is not None and window.size == size:
+            return window
+
+        try:
+            with open(get_state_file(self.state_folder, directory, dict_name), 'r') as read:
+                content = json.load(read)
+        except (IOError, ValueError):
+            content = None
+        if content is None or content['keys'] != get_outlier_keys(dict_name):
+            window = None
+        else:
+            window = RunningWindow.from_dict(content, size)
+        self.windows[key] = window
+        return window
+
+    def save(self, directory, dict_name, window):
+        state_file = get_state_file(self.state_folder, directory, dict_name)
+        temp_file = '{0}.tmp'.format(state_file)
+        tu.mkdir_p(self.state_folder)
+        with open(temp_file, 'w') as write:
+            json.dump(window.to_dict(), write)
+        os.replace(temp_file, state_file)
+
+    def update(self, directory, dict_name, size, rows):
+        """
+        Add the rows of a micrograph.
+
+        Arguments:
+        directory - Output folder of the plot data
+        dict_name - Name of the plot data type
+        size - Number of values used for the median
+        rows - Return value of get_outlier_rows
+
+        Return:
+        Dictionary key -> (median, MAD), None if the window needs to be filled first
+        """
+        with self.lock:
+            window = self.get_window(directory, dict_name, size)
+            if window is None:
+                return None
+            for name, values in rows:
+                window.add(name, values)
+            self.save(directory, dict_name, window)
+            return window.get_statistics()
+
+    def fill(self, directory, dict_name, size, rows):
+        """
+        Create the window from all results of the output folder.
+
+        Arguments:
+        directory - Output folder of the plot data
+        dict_name - Name of the plot data type
+        size - Number of values used for the median
+        rows - Return value of get_outlier_rows for all results
+
+        Return:
+        None
+        """
+        with self.lock:
+            window = RunningWindow(size, get_outlier_keys(dict_name))
+            for name, values in rows:
+                window.add(name, values)
+            self.windows[(directory, dict_name)] = window
@@ -15,13 +15,80 @@
     You should have received a copy of the GNU General Public License
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import itertools
 import os
 import numpy as np
 
 
+MIC_NUMBER_CACHE = {}
+MIC_NUMBER_CACHE_SIZE = 1000000
+NOT_CACHED = object()
+
+
+def parse_mic_number(name, prefix, suffix, as_int):
+    """
+    Identify the micrograph number out of a single name string.
+
+    Arguments:
+    name - File name
+    prefix - Rename prefix
+    suffix - Rename suffix
+    as_int - Convert the number to int
+
+    Return:
+    Number string or int, None if it is not an integer
+    """
+    name = os.path.basename(name)
+    if suffix == '':
+        first_part = name.rsplit('.', 1)[0]
+    else:
+        first_part = name.rsplit(suffix, 1)[0]
+    if prefix == '':
+        number = first_part
+    else:
+        number = first_part.split(prefix)[-1]
+    if as_int:
+        try:
+            number = int(number)
+        except ValueError:
+            number = None
+    return number
+
+
+def get_name_list(array):
+    """
+    Convert the file names to a list of strings.
+    The file name column has a fixed width much larger than the names, so
+    the array is shortened to the longest name first. Names are padded with
+    zeros at the end, so a character position is used by any name, if all
+    positions before it are used as well.
+
+    Arguments:
+    array - Array containing the file names
+
+    Return:
+    List of file names
+    """
+    if not isinstance(array, np.ndarray) or array.dtype.kind != 'U' or array.ndim != 1 or array.size == 0:
+        return list(array)
+
+    chars = array[:, np.newaxis].view('<u4')
+    low = 0
+    high = chars.shape[1]
+    while low < high:
+        middle = (low + high) // 2
+        if chars[:, middle].any():
+            low = middle + 1
+        else:
+            high = middle
+    return array.astype('<U{0}'.format(max(low, 1))).tolist()
+
+
 def get_mic_number(array, settings, as_int=True):
     """
     Identify the micrograph number out of the name string.
+    Every name is parsed once and the result is kept in MIC_NUMBER_CACHE,
+    so a refresh of the plots only parses the new micrographs.
 
     Arguments:
     array - Array containing information
@@ -30,41 +97,30 @@ def get_mic_number(array, settings, as_int=True):
     Return:
     Array of micrograph numbers
     """
-    error = False
     if as_int:
         out_type = int
     else:
         out_type = str
-    if settings['Output']['Rename micrographs'] == 'True':
-        number_list = []
-        prefix = settings['Output']['Rename prefix']
-        suffix = settings['Output']['Rename suffix']
-        for entry in array:
-            entry = os.path.basename(entry)
-            if suffix == '':
-                first_part_split = entry.rsplit('.', 1)
-            else:
-                first_part_split = entry.rsplit(suffix, 1)
-            first_part = first_part_split[0]
-            if prefix == '':
-                number = first_part
-            else:
-                number = first_part.split(prefix)[-1]
-            if as_int:
-                try:
-                    number = int(number)
-                except ValueError:
-                    error = True
-                    break
-            number_list.append(number)
-    else:
-        number_list = np.arange(len(array))
-
-    if error:
-        number_list = np.arange(len(array))
-    else:
-        pass
-
+    if settings['Output']['Rename micrographs'] != 'True':
+        return np.arange(len(array)).astype(out_type)
+
+    prefix = settings['Output']['Rename prefix']
+    suffix = settings['Output']['Rename suffix']
+    cache = MIC_NUMBER_CACHE.setdefault((prefix, suffix, as_int), {})
+
+    names = get_name_list(array)
+    number_list = list(map(cache.get, names, itertools.repeat(NOT_CACHED)))
+    if NOT_CACHED in number_list:
+        if len(cache) > MIC_NUMBER_CACHE_SIZE:
+            cache.clear()
+        for idx, number in enumerate(number_list):
+            if number is NOT_CACHED:
+                number = parse_mic_number(names[idx], prefix, suffix, as_int)
+                cache[names[idx]] = number
+                number_list[idx] = number
+
+    if as_int and None in number_list:
+        return np.arange(len(array)).astype(out_type)
     return np.array(number_list).astype(out_type)
 
 
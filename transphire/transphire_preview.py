@@ -0,0 +1,212 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import numpy as np
+import mrcfile as mrc
+
+
+PAD_SHAPE = 4096
+BLOCK_SIZE = 64 * 1024**2
+
+
+def open_image(file_name):
+    """
+    Open a MRC file memory mapped.
+    A wrong map header entry is fixed like in the JPG functions before.
+
+    Arguments:
+    file_name - MRC file
+
+    Return:
+    mrcfile object
+    """
+    try:
+        return mrc.mmap(file_name, 'r')
+    except ValueError:
+        with mrc.open(file_name, 'r+', permissive=True) as mrc_file:
+            mrc_file.header.map = mrc.constants.MAP_ID
+        return mrc.mmap(file_name, 'r')
+
+
+def get_image_shape(data):
+    """
+    Shape of the frame average of a memory mapped MRC data array.
+
+    Arguments:
+    data - 2D image or 3D stack
+
+    Return:
+    Number of rows, number of columns
+    """
+    return data.shape[-2], data.shape[-1]
+
+
+def read_block(data, rows=slice(None), columns=slice(None)):
+    """
+    Read a block of the frame average in double precision.
+
+    Arguments:
+    data - 2D image or 3D stack
+    rows - Row slice
+    columns - Column slice
+
+    Return:
+    2D block
+    """
+    if data.ndim == 3:
+        block = np.zeros(data[0, rows, columns].shape, dtype=np.float64)
+        for frame in data:
+            block += frame[rows, columns]
+        block /= data.shape[0]
+        return block
+    else:
+        return np.array(data[rows, columns], dtype=np.float64)
+
+
+def get_mean(data, block_rows):
+    """
+    Mean of the frame average, read block by block.
+
+    Arguments:
+    data - 2D image or 3D stack
+    block_rows - Number of rows per block
+
+    Return:
+    Mean value
+    """
+    nr_rows, nr_columns = get_image_shape(data)
+    total = 0.0
+    for start in range(0, nr_rows, block_rows):
+        total += np.sum(read_block(data, rows=slice(start, start + block_rows)))
+    return total / (nr_rows * nr_columns)
+
+
+def get_column_medians(data, mean, block_columns):
+    """
+    Median of every column of the mean free frame average, read in column strips.
+
+    Arguments:
+    data - 2D image or 3D stack
+    mean - Mean to subtract
+    block_columns - Number of columns per strip
+
+    Return:
+    1D array of column medians
+    """
+    nr_columns = get_image_shape(data)[1]
+    medians = np.empty(nr_columns, dtype=np.float64)
+    for start in range(0, nr_columns, block_columns):
+        columns = slice(start, start + block_columns)
+        medians[columns] = np.median(read_block(data, columns=columns) - mean, axis=0)
+    return medians
+
+
+def create_preview(file_name, bin_shape=512, tile_shape=512, power_spectrum=True, block_size=BLOCK_SIZE):
+    """
+    Create the binned image and the tiled power spectrum of a micrograph.
+
+    The micrograph is padded to a multiple of 4096 with the median of each
+    column and row, binned to bin_shape and the power spectra of the
+    non-overlapping tiles are averaged, like with the full image in memory.
+    The file is memory mapped and processed in bands of tile_shape rows, so
+    the peak memory is bounded by the band and the column strips instead of the
+    micrograph size.
+
+    Arguments:
+    file_name - MRC file
+    bin_shape - Size of the binned image
+    tile_shape - Size of the power spectrum tiles
+    power_spectrum - Calculate the power spectrum
+    block_size - Maximum size of a column strip in bytes
+
+    Return:
+    Binned image, averaged power spectrum or None
+    """
+    with open_image(file_name) as mrc_file:
+        data = mrc_file.data
+        nr_rows, nr_columns = get_image_shape(data)
+
+        idx = 1
+        while True:
+            if max(nr_rows, nr_columns) < idx * PAD_SHAPE:
+                break
+            idx += 1
+        original_shape = idx * PAD_SHAPE
+        ratio = original_shape / bin_shape
+        assert ratio.is_integer()
+        ratio = int(ratio)
+        pad_x = original_shape - nr_rows
+        pad_y = original_shape - nr_columns
+
+        mean = get_mean(data, tile_shape)
+        column_medians = get_column_medians(
+            data,
+            mean,
+            max(1, block_size // (8 * nr_rows))
+            )
+        # np.pad median mode: The padded rows contain the column medians,
+        # the padded columns the median of the (already row padded) row.
+        padded_row = np.empty(original_shape, dtype=np.float64)
+        padded_row[:nr_columns] = column_medians
+        padded_row[nr_columns:] = np.median(column_medians)
+
+        binned = np.zeros((bin_shape, bin_shape), dtype=np.float64)
+        spectrum = np.zeros((tile_shape, tile_shape), dtype=np.float64)
+        nr_tiles = 0
+        band = np.empty((tile_shape, original_shape), dtype=np.float64)
+        for start in range(0, original_shape, tile_shape):
+            stop = min(start + tile_shape, original_shape)
+            band_rows = stop - start
+            real_rows = max(0, min(stop, nr_rows) - start)
+            if real_rows:
+                block = read_block(data, rows=slice(start, start + real_rows)) - mean
+                band[:real_rows, :nr_columns] = block
+                band[:real_rows, nr_columns:] = np.median(block, axis=1)[:, np.newaxis]
+            band[real_rows:band_rows] = padded_row
+
+            # Binning: Sum the columns per bin first and add the rows to their bin
+            column_sum = band[:band_rows].reshape(band_rows, bin_shape, ratio).sum(-1)
+            np.add.at(binned, np.arange(start, stop) // ratio, column_sum)
+
+            if power_spectrum and band_rows == tile_shape:
+                for column in range(0, original_shape - tile_shape + 1, tile_shape):
+                    tile = band[:, column:column + tile_shape]
+                    spectrum += np.abs(np.fft.fftshift(np.fft.fft2(tile)))**2
+                    nr_tiles += 1
+
+    binned /= ratio**2
+    binned = binned[:-int(1 + pad_x // ratio), :-int(1 + pad_y // ratio)]
+    if nr_tiles:
+        spectrum /= nr_tiles
+    else:
+        spectrum = None
+    return binned, spectrum
+
+
+def read_image(file_name):
+    """
+    Read the mean free frame average of a small image, e.g. a power spectrum.
+
+    Arguments:
+    file_name - MRC file
+
+    Return:
+    2D image
+    """
+    with open_image(file_name) as mrc_file:
+        data = read_block(mrc_file.data)
+    return data - np.mean(data)
@@ -0,0 +1,634 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import os
+import re
+import sqlite3
+import threading
+
+from . import transphire_utils as tu
+
+
+KEY_SPLIT_RE = re.compile(r'\|\|\||;;;')
+
+
+def get_queue_store(backend, queue_folder):
+    """
+    Create the queue store for the requested backend.
+
+    Arguments:
+    backend - Name of the backend (SQLite or Text)
+    queue_folder - Folder containing the Queue_* files
+
+    Return:
+    Queue store object
+    """
+    if backend == 'SQLite':
+        return SQLiteQueueStore(queue_folder)
+    elif backend == 'Text':
+        return TextQueueStore(queue_folder)
+    else:
+        raise NameError('Queue backend not known: {0}'.format(backend))
+
+
+def get_queue_keys(entry):
+    """
+    Extract the lookup keys of a queue entry.
+    Entries are file names or '|||' and ';;;' separated lists of file names.
+
+    Arguments:
+    entry - Queue entry
+
+    Return:
+    Set of basenames present in the entry
+    """
+    return set([
+        os.path.basename(part)
+        for part in KEY_SPLIT_RE.split(entry)
+        if part
+        ])
+
+
+def get_reference_folders(settings):
+    """
+    Folders of the files that are deleted once they are not queued anymore.
+    Stacks are only deleted after the compression.
+
+    Arguments:
+    settings - TranSPHIRE settings
+
+    Return:
+    List of folders, empty if no stacks are deleted
+    """
+    if settings['Copy']['Compress'] in ('False', 'Later'):
+        return []
+    elif settings['Input']['Input frames extension'] in ('tiff', 'tif'):
+        return []
+    return [settings['stack_folder'], settings['compress_folder_feedback_0']]
+
+
+def get_reference_keys(entries, folders):
+    """
+    Extract the referenced files of queue entries.
+    Only the parts of the entries that are located in one of the folders are used.
+
+    Arguments:
+    entries - List of queue entries
+    folders - Set of folders
+
+    Return:
+    List of file names, one per reference
+    """
+    keys = []
+    for entry in entries:
+        for part in KEY_SPLIT_RE.split(entry):
+            part = part.strip()
+            if part and os.path.dirname(part) in folders:
+                keys.append(part)
+    return keys
+
+
+def count_references(queue_store, file_names, folders):
+    """
+    Count the references of the queue files from scratch.
+
+    Arguments:
+    queue_store - Queue store
+    file_names - Queue files to count
+    folders - Set of folders
+
+    Return:
+    Dictionary file name -> number of references
+    """
+    counts = collections.Counter()
+    for file_name in file_names:
+        counts.update(get_reference_keys(queue_store.read(file_name), folders))
+    return dict(counts)
+
+
+def check_references(references, queue_store, file_names, folders, repair=True):
+    """
+    Compare the reference counts with the content of the queue files.
+    Used after a crash or restart to rebuild the counts.
+
+    Arguments:
+    references - QueueReferences object or proxy
+    queue_store - Queue store
+    file_names - Queue files to count
+    folders - Set of folders
+    repair - Replace the counts with the recounted ones
+
+    Return:
+    Dictionary file name -> (tracked count, recounted count) of the differences
+    """
+    counts = count_references(queue_store, file_names, folders)
+    if repair:
+        return references.rebuild(counts)
+    else:
+        return references.compare(counts)
+
+
+class QueueReferences(object):
+    """
+    Number of queue entries that reference a file.
+
+    The object is served by the queue manager, so every update is a single
+    call that is atomic for all processes. The queue stores update the
+    counts whenever entries are added to or removed from a tracked queue
+    file, so the check if a file is still queued does not read any file.
+    """
+
+    def __init__(self):
+        super(QueueReferences, self).__init__()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def update(self, added, removed):
+        """
+        Add and remove references.
+
+        Arguments:
+        added - List of added file names
+        removed - List of removed file names
+
+        Return:
+        None
+        """
+        with self.lock:
+            for key in added:
+                self.counts[key] = self.counts.get(key, 0) + 1
+            for key in removed:
+                value = self.counts.get(key, 0) - 1
+                if value > 0:
+                    self.counts[key] = value
+                else:
+                    self.counts.pop(key, None)
+
+    def count(self, keys):
+        with self.lock:
+            return sum([self.counts.get(key, 0) for key in keys])
+
+    def get_counts(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def compare(self, counts):
+        """
+        Compare the counts with recounted ones.
+
+        Arguments:
+        counts - Dictionary file name -> number of references
+
+        Return:
+        Dictionary file name -> (tracked count, recounted count) of the differences
+        """
+        with self.lock:
+            differences = {}
+            for key in set(self.counts) | set(counts):
+                old = self.counts.get(key, 0)
+                new = counts.get(key, 0)
+                if old != new:
+                    differences[key] = (old, new)
+            return differences
+
+    def rebuild(self, counts):
+        """
+        Replace the counts with recounted ones.
+
+        Arguments:
+        counts - Dictionary file name -> number of references
+
+        Return:
+        Dictionary file name -> (tracked count, recounted count) of the differences
+        """
+        differences = self.compare(counts)
+        with self.lock:
+            self.counts = dict([(key, value) for key, value in counts.items() if value > 0])
+        return differences
+
+
+@tu.rerun_function_in_case_of_error
+def write_text_file(file_name, opener, content):
+    with open(file_name, opener) as write:
+        write.write(content)
+
+
+def read_text_file(file_name):
+    """
+    Read the non empty lines of a Queue_* text file.
+
+    Arguments:
+    file_name - Queue file
+
+    Return:
+    List of stripped lines, empty if the file does not exist
+    """
+    try:
+        with open(file_name, 'r') as read:
+            return [line.strip() for line in read.readlines() if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def sqlite_transaction(func):
+    """
+    Run the decorated SQLiteQueueStore method inside an immediate transaction.
+    The connection is passed as first argument after self.
+    """
+    def wrapper(self, *args, **kwargs):
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            return_value = func(self, connection, *args, **kwargs)
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+        return return_value
+    return wrapper
+
+
+class QueueStore(object):
+    """
+    Reference tracking shared by the queue stores.
+    """
+
+    def __init__(self, queue_folder):
+        super(QueueStore, self).__init__()
+        self.queue_folder = queue_folder
+        self.references = None
+        self.reference_files = set()
+        self.reference_folders = set()
+
+    def set_references(self, references, file_names, folders):
+        """
+        Track the references of the queue files.
+
+        Arguments:
+        references - QueueReferences object or proxy
+        file_names - Queue files to track
+        folders - Folders of the referenced files
+
+        Return:
+        None
+        """
+        self.references = references
+        self.reference_files = set([os.path.basename(file_name) for file_name in file_names])
+        self.reference_folders = set(folders)
+
+    def is_tracked(self, file_name):
+        return self.references is not None and os.path.basename(file_name) in self.reference_files
+
+    def track(self, file_name, added=(), removed=()):
+        if not self.is_tracked(file_name):
+            return
+        added = get_reference_keys(added, self.reference_folders)
+        removed = get_reference_keys(removed, self.reference_folders)
+        if added or removed:
+            self.references.update(added, removed)
+
+
+class TextQueueStore(QueueStore):
+    """
+    Queue store that works directly on the Queue_* text files.
+    Every operation re-reads and, if necessary, re-writes the file.
+    """
+
+    def __init__(self, queue_folder):
+        super(TextQueueStore, self).__init__(queue_folder)
+
+    def read(self, file_name):
+        return read_text_file(file_name)
+
+    def count(self, file_name):
+        return len(self.read(file_name))
+
+    def write(self, file_name, lines):
+        if self.is_tracked(file_name):
+            old_lines = self.read(file_name)
+        else:
+            old_lines = []
+        write_text_file(file_name, 'w', ''.join(['{0}\n'.format(line) for line in lines]))
+        self.track(file_name, added=lines, removed=old_lines)
+
+    def create(self, file_name):
+        if not os.path.exists(file_name):
+            write_text_file(file_name, 'w', '')
+
+    def append(self, file_name, entries, allow_dublicate=False):
+        if allow_dublicate:
+            # Always write if dublicates are allowed
+            files_to_write = entries
+        else:
+            files_to_write = []
+            try:
+                with open(file_name, 'r') as read:
+                    data = read.read()
+            except FileNotFoundError:
+                data = ''
+            for name in entries:
+                if not re.search(r'^{0}$'.format(re.escape(name)), data, re.MULTILINE):
+                    files_to_write.append(name)
+
+        if files_to_write:
+            write_text_file(file_name, 'a', '{0}\n'.format("\n".join(files_to_write)))
+            self.track(file_name, added=files_to_write)
+
+    def remove(self, file_name, entries):
+        entries = set(entries)
+        lines = self.read(file_name)
+        useable_lines = [line for line in lines if line not in entries]
+        write_text_file(file_name, 'w', '{0}\n'.format('\n'.join(useable_lines)))
+        self.track(file_name, removed=[line for line in lines if line in entries])
+
+    def move(self, entry, source_file, target_file):
+        self.remove(source_file, [entry])
+        self.append(target_file, [entry])
+
+    def set_running(self, file_name, entry, running=True):
+        pass
+
+    def contains(self, file_names, name):
+        for file_name in file_names:
+            try:
+                with open(file_name, 'r') as read:
+                    if re.search(r'{0}'.format(re.escape(name)), read.read(), re.MULTILINE):
+                        return True
+            except FileNotFoundError:
+                pass
+        return False
+
+    def find(self, file_name, name):
+        try:
+            with open(file_name, 'r') as read:
+                return re.findall(r'^.*{0}.*$'.format(re.escape(name)), read.read(), re.MULTILINE)
+        except FileNotFoundError:
+            return []
+
+    def export(self, file_name, target=None):
+        if target is not None and os.path.exists(file_name):
+            tu.copy(file_name, target)
+
+
+class SQLiteQueueStore(QueueStore):
+    """
+    Indexed queue store backed by a SQLite database in the queue folder.
+
+    Every Queue_* file is represented by its basename and imported on first
+    access. Membership checks use the (file, entry) and (file, key) indices and
+    the save -> done transition happens in a single transaction.
+    The text files are only written on export.
+    """
+
+    def __init__(self, queue_folder):
+        super(SQLiteQueueStore, self).__init__(queue_folder)
+        self.db_file = os.path.join(queue_folder, 'Queue.sqlite3')
+        self._connection = None
+        self._pid = None
+        self._known_files = set()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pid'] = None
+        state['_known_files'] = set()
+        return state
+
+    def _connect(self):
+        # Connections must not be shared between forked processes.
+        if self._connection is None or self._pid != os.getpid():
+            tu.mkdir_p(self.queue_folder)
+            self._connection = sqlite3.connect(self.db_file, timeout=120, isolation_level=None)
+            self._pid = os.getpid()
+            self._known_files = set()
+            # WAL allows readers next to a writer and avoids a fsync per transaction.
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS queue_entries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file TEXT NOT NULL,
+                    entry TEXT NOT NULL,
+                    running INTEGER NOT NULL DEFAULT 0
+                    );
+                CREATE INDEX IF NOT EXISTS queue_entries_file_entry ON queue_entries (file, entry);
+                CREATE TABLE IF NOT EXISTS queue_keys (
+                    id INTEGER NOT NULL,
+                    file TEXT NOT NULL,
+                    key TEXT NOT NULL
+                    );
+                CREATE INDEX IF NOT EXISTS queue_keys_file_key ON queue_keys (file, key);
+                CREATE INDEX IF NOT EXISTS queue_keys_id ON queue_keys (id);
+                CREATE TABLE IF NOT EXISTS queue_files (
+                    file TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL
+                    );
+                """)
+        return self._connection
+
+    @staticmethod
+    def _name(file_name):
+        return os.path.basename(file_name)
+
+    @staticmethod
+    def _stat(file_name):
+        try:
+            stat = os.stat(file_name)
+        except FileNotFoundError:
+            return None, None
+        else:
+            return stat.st_size, stat.st_mtime
+
+    def _ensure(self, connection, file_name):
+        """
+        Import the text file, if it is unknown or changed since the last import/export.
+        """
+        name = self._name(file_name)
+        if name in self._known_files:
+            return name
+
+        size, mtime = self._stat(file_name)
+        row = connection.execute(
+            'SELECT size, mtime FROM queue_files WHERE file = ?',
+            (name,)
+            ).fetchone()
+        if row is None or (size is not None and (row[0], row[1]) != (size, mtime)):
+            self._clear(connection, name)
+            self._insert(connection, name, read_text_file(file_name))
+            connection.execute(
+                'INSERT OR REPLACE INTO queue_files (file, size, mtime) VALUES (?, ?, ?)',
+                (name, size, mtime)
+                )
+        self._known_files.add(name)
+        return name
+
+    @staticmethod
+    def _clear(connection, name):
+        connection.execute('DELETE FROM queue_keys WHERE file = ?', (name,))
+        connection.execute('DELETE FROM queue_entries WHERE file = ?', (name,))
+
+    @staticmethod
+    def _insert(connection, name, entries):
+        for entry in entries:
+            cursor = connection.execute(
+                'INSERT INTO queue_entries (file, entry) VALUES (?, ?)',
+                (name, entry)
+                )
+            connection.executemany(
+                'INSERT INTO queue_keys (id, file, key) VALUES (?, ?, ?)',
+                [(cursor.lastrowid, name, key) for key in get_queue_keys(entry)]
+                )
+
+    @staticmethod
+    def _delete(connection, name, entry):
+        connection.execute(
+            'DELETE FROM queue_keys WHERE id IN (SELECT id FROM queue_entries WHERE file = ? AND entry = ?)',
+            (name, entry)
+            )
+        return connection.execute(
+            'DELETE FROM queue_entries WHERE file = ? AND entry = ?',
+            (name, entry)
+            ).rowcount
+
+    @staticmethod
+    def _exists(connection, name, entry):
+        return connection.execute(
+            'SELECT 1 FROM queue_entries WHERE file = ? AND entry = ? LIMIT 1',
+            (name, entry)
+            ).fetchone() is not None
+
+    @sqlite_transaction
+    def read(self, connection, file_name):
+        name = self._ensure(connection, file_name)
+        return [
+            row[0]
+            for row in connection.execute(
+                'SELECT entry FROM queue_entries WHERE file = ? ORDER BY id',
+                (name,)
+                )
+            ]
+
+    @sqlite_transaction
+    def count(self, connection, file_name):
+        name = self._ensure(connection, file_name)
+        return connection.execute(
+            'SELECT COUNT(*) FROM queue_entries WHERE file = ?',
+            (name,)
+            ).fetchone()[0]
+
+    @sqlite_transaction
+    def write(self, connection, file_name, lines):
+        name = self._ensure(connection, file_name)
+        if self.is_tracked(file_name):
+            old_lines = [
+                row[0]
+                for row in connection.execute('SELECT entry FROM queue_entries WHERE file = ?', (name,))
+                ]
+        else:
+            old_lines = []
+        lines = [line for line in lines if line]
+        self._clear(connection, name)
+        self._insert(connection, name, lines)
+        self.track(file_name, added=lines, removed=old_lines)
+
+    @sqlite_transaction
+    def create(self, connection, file_name):
+        self._ensure(connection, file_name)
+
+    @sqlite_transaction
+    def append(self, connection, file_name, entries, allow_dublicate=False):
+        name = self._ensure(connection, file_name)
+        if allow_dublicate:
+            files_to_write = entries
+        else:
+            files_to_write = [entry for entry in entries if not self._exists(connection, name, entry)]
+        self._insert(connection, name, files_to_write)
+        self.track(file_name, added=files_to_write)
+
+    @sqlite_transaction
+    def remove(self, connection, file_name, entries):
+        name = self._ensure(connection, file_name)
+        removed = []
+        for entry in set(entries):
+            removed.extend([entry] * self._delete(connection, name, entry))
+        self.track(file_name, removed=removed)
+
+    @sqlite_transaction
+    def move(self, connection, entry, source_file, target_file):
+        source_name = self._ensure(connection, source_file)
+        target_name = self._ensure(connection, target_file)
+        self.track(source_file, removed=[entry] * self._delete(connection, source_name, entry))
+        if not self._exists(connection, target_name, entry):
+            self._insert(connection, target_name, [entry])
+            self.track(target_file, added=[entry])
+
+    @sqlite_transaction
+    def set_running(self, connection, file_name, entry, running=True):
+        name = self._ensure(connection, file_name)
+        connection.execute(
+            'UPDATE queue_entries SET running = ? WHERE file = ? AND entry = ?',
+            (int(running), name, entry)
+            )
+
+    @sqlite_transaction
+    def contains(self, connection, file_names, name):
+        names = [self._ensure(connection, file_name) for file_name in file_names]
+        return connection.execute(
+            'SELECT 1 FROM queue_keys WHERE file IN ({0}) AND key = ? LIMIT 1'.format(
+                ', '.join(['?'] * len(names))
+                ),
+            names + [name]
+            ).fetchone() is not None
+
+    @sqlite_transaction
+    def find(self, connection, file_name, name):
+        # Substring search restricted to a single queue file without any file IO.
+        file_key = self._ensure(connection, file_name)
+        return [
+            row[0]
+            for row in connection.execute(
+                'SELECT entry FROM queue_entries WHERE file = ? AND instr(entry, ?) > 0 ORDER BY id',
+                (file_key, name)
+                )
+            ]
+
+    def export(self, file_name, target=None):
+        """
+        Write the content of a queue file in the Queue_* text format.
+
+        Arguments:
+        file_name - Queue file to export
+        target - Alternative output file (default file_name)
+
+        Return:
+        None
+        """
+        lines = self.read(file_name)
+        if target is None:
+            target = file_name
+        write_text_file(target, 'w', ''.join(['{0}\n'.format(line) for line in lines]))
+        if target == file_name:
+            connection = self._connect()
+            size, mtime = self._stat(file_name)
+            connection.execute(
+                'INSERT OR REPLACE INTO queue_files (file, size, mtime) VALUES (?, ?, ?)',
+                (self._name(file_name), size, mtime)
+                )
+
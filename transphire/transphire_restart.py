@@ -0,0 +1,214 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import collections
+import os
+import queue
+import re
+import threading
+import time
+
+
+FEED_CHUNK_SIZE = 1000
+
+
+class LifoQueue(queue.LifoQueue):
+    """
+    LIFO queue served by the queue manager.
+    put_many puts a list of items with a single manager call.
+    """
+
+    def put_many(self, items):
+        for item in items:
+            self.put(item)
+
+
+def remove_lines(lines, patterns):
+    """
+    Remove the lines that match any of the patterns.
+
+    Arguments:
+    lines - List of queue lines
+    patterns - List of regular expressions
+
+    Return:
+    Sorted list of the remaining lines, unchanged list without patterns
+    """
+    if not patterns:
+        return list(lines)
+    regex = re.compile('|'.join(['(?:{0})'.format(pattern) for pattern in patterns]))
+    return sorted([line for line in lines if regex.search(line) is None])
+
+
+def filter_existing(file_names):
+    """
+    Keep the files that exist.
+    Every folder is listed once instead of checking every single file.
+    Symlinks are checked individually, because broken links are listed.
+
+    Arguments:
+    file_names - List of file names
+
+    Return:
+    Set of existing file names
+    """
+    folders = collections.defaultdict(list)
+    for file_name in set(file_names):
+        folders[os.path.dirname(file_name)].append(file_name)
+
+    existing = set()
+    for folder, folder_files in folders.items():
+        try:
+            with os.scandir(folder or '.') as entries:
+                names = {}
+                for entry in entries:
+                    names[entry.name] = entry.is_symlink()
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for file_name in folder_files:
+            is_symlink = names.get(os.path.basename(file_name))
+            if is_symlink is None:
+                continue
+            elif not is_symlink or os.path.exists(file_name):
+                existing.add(file_name)
+    return existing
+
+
+def filter_copy_lines(lines, project_folder, keep_list, keep_feedback):
+    """
+    Keep the lines of a Copy_to queue that belong to the continued run.
+    Lines in the project folder and lines that contain an entry of the
+    keep list are kept. Feedback results are only kept, if the feedback
+    loop is not restarted. Files that do not exist anymore are removed.
+
+    Arguments:
+    lines - List of queue lines
+    project_folder - Project folder
+    keep_list - List of folder names that are kept
+    keep_feedback - Keep the lines of the feedback results
+
+    Return:
+    Sorted list of unique lines
+    """
+    good_lines = set()
+    for line in set(lines):
+        if os.path.dirname(line) == project_folder:
+            good_lines.add(line)
+        elif '000_Feedback_results' in line and not keep_feedback:
+            continue
+        elif any(entry in line for entry in keep_list):
+            good_lines.add(line)
+    return sorted(filter_existing(good_lines))
+
+
+class QueueFeeder(object):
+    """
+    Fill the process queues in a background thread.
+
+    The lines of every stage are put in chunks with a single manager call
+    per chunk, so the processes can start while the queues are still being
+    filled. The lines of a stage keep their order, so the LIFO order is the
+    same as for single puts.
+    """
+
+    def __init__(self, chunk_size=FEED_CHUNK_SIZE):
+        """
+        Initialize object variables.
+
+        Arguments:
+        chunk_size - Number of lines per manager call
+
+        Return:
+        None
+        """
+        super(QueueFeeder, self).__init__()
+        self.chunk_size = chunk_size
+        self.jobs = queue.Queue()
+        self.counts = collections.OrderedDict()
+        self.fed = 0
+        self.error = None
+        self.start_time = None
+        self.end_time = None
+        self.thread = None
+
+    def start(self):
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, name, lifo_queue, lines, wakeup=None):
+        """
+        Add lines to put into a queue.
+
+        Arguments:
+        name - Name of the stage
+        lifo_queue - Queue proxy of the stage
+        lines - List of lines
+        wakeup - Event that is set after every chunk (default None)
+
+        Return:
+        None
+        """
+        if lines:
+            self.counts[name] = self.counts.get(name, 0) + len(lines)
+            self.jobs.put((lifo_queue, list(lines), wakeup))
+
+    def close(self):
+        # No more stages to add
+        self.jobs.put(None)
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            lifo_queue, lines, wakeup = job
+            for idx in range(0, len(lines), self.chunk_size):
+                chunk = lines[idx:idx+self.chunk_size]
+                try:
+                    lifo_queue.put_many(chunk)
+                except Exception as err:
+                    # The lines are still in the queue files and are used on the next continue
+                    self.error = err
+                    break
+                self.fed += len(chunk)
+                if wakeup is not None:
+                    wakeup.set()
+        self.end_time = time.time()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def get_summary(self):
+        """
+        Summary of the filled queues.
+
+        Arguments:
+        None
+
+        Return:
+        Text
+        """
+        return '{0} items in {1} queues ({2})'.format(
+            self.fed,
+            len(self.counts),
+            ', '.join(['{0}: {1}'.format(name, count) for name, count in self.counts.items()])
+            )
@@ -0,0 +1,108 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import multiprocessing as mp
+import numbers
+
+
+NUMBER_TYPES = (bool, int, float)
+
+
+class SharedDict(object):
+    """
+    Dictionary with a fixed set of keys that is shared with forked processes.
+
+    bool, int and float values are stored in a shared memory array, so reading
+    and writing them does not need a round trip to a manager process.
+    The type of the last written value is stored next to it and used on read,
+    like a value of a manager dict, e.g. False + 1 is read back as 1.
+    All other values (file names, locks, manager proxies) are constant and kept
+    in a local dictionary of every process.
+    Locks should be real multiprocessing locks created before the fork.
+    """
+
+    def __init__(self, content):
+        """
+        Initialize object variables.
+
+        Arguments:
+        content - Dictionary with the initial content
+
+        Return:
+        None
+        """
+        super(SharedDict, self).__init__()
+        self._numbers = {}
+        self._constants = {}
+        for key, value in content.items():
+            if isinstance(value, NUMBER_TYPES):
+                self._numbers[key] = len(self._numbers)
+            else:
+                self._constants[key] = value
+
+        self._array = mp.RawArray('d', max(len(self._numbers), 1))
+        self._types = mp.RawArray('b', max(len(self._numbers), 1))
+        for key, idx in self._numbers.items():
+            self._set(idx, content[key])
+
+    def _set(self, idx, value):
+        typ = type(value)
+        if typ not in NUMBER_TYPES:
+            # e.g. numpy numbers
+            typ = int if isinstance(value, numbers.Integral) else float
+        self._types[idx] = NUMBER_TYPES.index(typ)
+        self._array[idx] = typ(value)
+
+    def __getitem__(self, key):
+        try:
+            idx = self._numbers[key]
+        except KeyError:
+            return self._constants[key]
+        else:
+            return NUMBER_TYPES[self._types[idx]](self._array[idx])
+
+    def __setitem__(self, key, value):
+        try:
+            idx = self._numbers[key]
+        except KeyError:
+            if key in self._constants:
+                raise KeyError('{0} is a constant and cannot be changed after the fork!'.format(key))
+            else:
+                raise KeyError('{0} is not part of the shared dictionary!'.format(key))
+        else:
+            self._set(idx, value)
+
+    def __contains__(self, key):
+        return key in self._numbers or key in self._constants
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._numbers) + len(self._constants)
+
+    def keys(self):
+        return list(self._numbers) + list(self._constants)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
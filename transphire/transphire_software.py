@@ -25,6 +25,7 @@ import traceback as tb
 import subprocess
 from hyperspy.io_plugins.digital_micrograph import DigitalMicrographReader
 
+from . import transphire_header as th
 from . import transphire_import as ti
 from . import transphire_utils as tu
 
@@ -676,19 +677,23 @@ def check_nr_frames(frames, settings, force=False):
         frames.append(None)
         return False, 0, 0, 0
     else:
-        command = "{0} '{1}'".format(
-            settings['Path']['IMOD header'],
-            frames[0]
-            )
+        try:
+            x_dim, y_dim, z_dim = th.read_header(frames[0])
+        except (th.HeaderError, OSError):
+            # Unsupported format or unreadable header: Fall back to IMOD
+            command = "{0} '{1}'".format(
+                settings['Path']['IMOD header'],
+                frames[0]
+                )
 
-        text = subprocess.check_output(command, shell=True, encoding='utf-8')
+            text = subprocess.check_output(command, shell=True, encoding='utf-8')
 
-        z_dim = 0
-        x_dim = 0
-        y_dim = 0
-        for line in text.split('\n'):
-            if line.startswith(' Number of columns, rows, sections .....'):
-                x_dim, y_dim, z_dim = list(map(int, line.split()[-3:]))
+            z_dim = 0
+            x_dim = 0
+            y_dim = 0
+            for line in text.split('\n'):
+                if line.startswith(' Number of columns, rows, sections .....'):
+                    x_dim, y_dim, z_dim = list(map(int, line.split()[-3:]))
 
         return bool(z_dim == int(settings['Input']['Number of frames'])), x_dim, y_dim, z_dim
 
@@ -1314,7 +1319,21 @@ def check_outputs(zero_list, non_zero_list, exists_list, folder, command):
             continue
 
 
-def check_for_outlier(dict_name, data, file_name, settings):
+def check_for_outlier(dict_name, data, file_name, settings, statistics=None):
+    """
+    Check the median of the last values and the values of the current file
+    against the warning and skip ranges of the Notification settings.
+
+    Arguments:
+    dict_name - Name of the plot data type
+    data - Plot data array containing the current file
+    file_name - Current file
+    settings - TranSPHIRE settings
+    statistics - Running window statistics of the OutlierDetector (default None: median of the last values of data)
+
+    Return:
+    List of warnings, list of skip reasons
+    """
     dtype_dict = ti.get_dtype_dict()
     lower_median = int(settings['Notification']['Nr. of values used for median'])
     warning_list = []
@@ -1337,7 +1356,10 @@ def check_for_outlier(dict_name, data, file_name, settings):
             continue
 
         try:
-            last_values_median = np.median(data[key][-lower_median:])
+            if statistics is None:
+                last_values_median = np.median(data[key][-lower_median:])
+            else:
+                last_values_median = statistics[key][0]
             warning_low, warning_high = settings['Notification']['{0} {1} warning'.format(dict_name, key)].split()
             skip_low, skip_high = settings['Notification']['{0} {1} skip'.format(dict_name, key)].split()
         except KeyError:
@@ -0,0 +1,239 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import json
+import os
+import select
+import subprocess as sp
+import sys
+import threading
+import time
+
+from . import transphire_transfer as ttransfer
+
+
+HELLO = 'TRANSPHIRE_SUDO_HELLO'
+READY = 'TRANSPHIRE_SUDO_READY'
+HELPER_CODE = 'import sys; sys.path.insert(0, {0!r}); from transphire import transphire_sudo; transphire_sudo.serve()'
+
+
+class SudoError(IOError):
+    """
+    Raised, if the helper session cannot be started.
+    """
+    pass
+
+
+def handle(request):
+    """
+    Execute a request of the worker in the helper.
+
+    Arguments:
+    request - Request dictionary
+
+    Return:
+    Reply dictionary
+    """
+    if request['command'] == 'mkdir':
+        os.makedirs(request['folder'], exist_ok=True)
+        return {}
+
+    elif request['command'] == 'copy':
+        start = time.time()
+        length_in, checksum_in = ttransfer.copy_file(
+            request['file_in'],
+            request['file_out'],
+            checksum=request['verify'],
+            )
+        if request['verify']:
+            length_out, checksum_out = ttransfer.get_checksum(request['file_out'])
+        else:
+            length_out, checksum_out = length_in, checksum_in
+        return {
+            'length_in': length_in,
+            'checksum_in': checksum_in,
+            'length_out': length_out,
+            'checksum_out': checksum_out,
+            'time': time.time() - start,
+            }
+
+    else:
+        raise NameError('Unknown command: {0}'.format(request['command']))
+
+
+def serve():
+    """
+    Main loop of the helper that runs as the other user.
+    Reads one JSON request per line from stdin and writes one JSON reply per
+    line to stdout.
+
+    Arguments:
+    None
+
+    Return:
+    None
+    """
+    # Skip the password line, if sudo did not need it
+    for line in sys.stdin:
+        if line.strip() == HELLO:
+            break
+    else:
+        return
+    sys.stdout.write('{0}\n'.format(READY))
+    sys.stdout.flush()
+
+    for line in sys.stdin:
+        try:
+            reply = handle(json.loads(line))
+        except Exception as e:
+            reply = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+        else:
+            reply['error'] = None
+        sys.stdout.write('{0}\n'.format(json.dumps(reply)))
+        sys.stdout.flush()
+
+
+class SudoSession(object):
+    """
+    Persistent helper process that runs as another user via sudo.
+
+    The password is sent once when the session starts instead of spawning
+    sudo for every file. Files are copied by the helper with a bounded buffer
+    and the checksums of the input and the written file are calculated
+    incrementally.
+    The helper is started with the first request, so the session can be
+    created before a fork. A dead helper is started again with the next
+    request.
+    """
+
+    def __init__(self, user, password, timeout=30, sudo='sudo'):
+        """
+        Initialize object variables.
+
+        Arguments:
+        user - User to run the helper as
+        password - sudo password
+        timeout - Time in seconds to wait for the helper to start
+        sudo - sudo executable
+
+        Return:
+        None
+        """
+        super(SudoSession, self).__init__()
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.sudo = sudo
+        self.process = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def mask(self, text):
+        if self.password:
+            return text.replace(self.password, 'PASSWORD')
+        else:
+            return text
+
+    def readline(self, timeout=None):
+        if timeout is not None:
+            ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+            if not ready:
+                return ''
+        return self.process.stdout.readline()
+
+    def start(self):
+        package_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.process = sp.Popen(
+            [
+                self.sudo, '-k', '-S', '-p', '', '-u', self.user,
+                sys.executable, '-u', '-c', HELPER_CODE.format(package_folder)
+                ],
+            stdin=sp.PIPE,
+            stdout=sp.PIPE,
+            stderr=sp.PIPE,
+            universal_newlines=True,
+            )
+        self.pid = os.getpid()
+        try:
+            self.process.stdin.write('{0}\n{1}\n'.format(self.password, HELLO))
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            pass
+
+        if self.readline(self.timeout).strip() != READY:
+            self.process.kill()
+            _, error = self.process.communicate()
+            self.process = None
+            raise SudoError('Cannot start sudo session as {0}! {1}'.format(self.user, self.mask(error)))
+
+    def close(self):
+        """
+        Stop the helper.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        if self.process is not None and self.pid == os.getpid():
+            try:
+                self.process.stdin.close()
+                self.process.wait(self.timeout)
+            except (BrokenPipeError, sp.TimeoutExpired):
+                self.process.kill()
+        self.process = None
+
+    def request(self, command, **kwargs):
+        """
+        Send a request to the helper and wait for the reply.
+
+        Arguments:
+        command - Command name
+        kwargs - Arguments of the command
+
+        Return:
+        Reply dictionary
+        """
+        kwargs['command'] = command
+        with self.lock:
+            for attempt in range(2):
+                if self.process is None or self.pid != os.getpid() or self.process.poll() is not None:
+                    self.start()
+                try:
+                    self.process.stdin.write('{0}\n'.format(json.dumps(kwargs)))
+                    self.process.stdin.flush()
+                    line = self.readline()
+                except BrokenPipeError:
+                    line = ''
+                if line:
+                    break
+                # Helper died: Start a new one
+                self.close()
+            else:
+                raise SudoError('Sudo session as {0} died!'.format(self.user))
+
+        reply = json.loads(line)
+        if reply['error'] is not None:
+            raise IOError(self.mask(reply['error']))
+        return reply
+
+    def mkdir(self, folder):
+        return self.request('mkdir', folder=folder)
+
+    def copy(self, file_in, file_out, verify=True):
+        return self.request('copy', file_in=file_in, file_out=file_out, verify=verify)
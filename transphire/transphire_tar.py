@@ -0,0 +1,244 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import concurrent.futures
+import io
+import os
+import tarfile
+import zlib
+
+
+COMPRESS_CHUNK_SIZE = 16 * 1024**2
+
+
+def get_index_file(tar_file):
+    return '{0}.index'.format(tar_file)
+
+
+def read_file(file_name):
+    with open(file_name, 'rb') as read:
+        return read.read()
+
+
+class TarPacker(object):
+    """
+    Append files to a tar archive that stays open between the calls.
+
+    The next file is read by a thread while the current one is written.
+    After every call the end of archive blocks are written and the position
+    is moved back in front of them, so the archive on disk is always
+    complete and can be copied at any time.
+    Every member is written to an index side file with its data offset and
+    size, so single files can be extracted without reading the archive.
+    """
+
+    def __init__(self):
+        """
+        Initialize object variables.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        super(TarPacker, self).__init__()
+        self.tar_file = None
+        self.tar = None
+        self.index = None
+        self.executor = None
+        self.pid = None
+
+    def open(self, tar_file):
+        if self.tar_file == tar_file and self.pid == os.getpid():
+            return
+        self.close()
+        self.tar = tarfile.open(tar_file, 'a')
+        self.index = open(get_index_file(tar_file), 'a')
+        self.tar_file = tar_file
+        self.pid = os.getpid()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+    def close(self):
+        """
+        Close the open archive.
+
+        Arguments:
+        None
+
+        Return:
+        None
+        """
+        if self.tar is not None and self.pid == os.getpid():
+            self.tar.close()
+            self.index.close()
+            self.executor.shutdown()
+        self.tar_file = None
+        self.tar = None
+        self.index = None
+        self.executor = None
+
+    def add(self, tar_file, members):
+        """
+        Append files to an archive.
+
+        Arguments:
+        tar_file - Archive to append to
+        members - List of (file name, name in the archive) tuples
+
+        Return:
+        Size of the archive in bytes
+        """
+        self.open(tar_file)
+        if members:
+            future = self.executor.submit(read_file, members[0][0])
+        for idx, (file_name, arcname) in enumerate(members):
+            data = future.result()
+            if idx + 1 < len(members):
+                future = self.executor.submit(read_file, members[idx + 1][0])
+
+            tarinfo = self.tar.gettarinfo(file_name, arcname=arcname)
+            # The file might have changed after the read
+            tarinfo.size = len(data)
+            self.tar.addfile(tarinfo, io.BytesIO(data))
+            # The data is followed by the padding to the next block
+            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+            if remainder:
+                blocks += 1
+            offset_data = self.tar.offset - blocks * tarfile.BLOCKSIZE
+            self.index.write('{0}\t{1}\t{2}\n'.format(tarinfo.name, offset_data, tarinfo.size))
+
+        # Terminate the archive on disk without closing it
+        self.tar.fileobj.write(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+        self.tar.fileobj.flush()
+        self.tar.fileobj.seek(self.tar.offset)
+        self.index.flush()
+        return self.tar.offset + 2 * tarfile.BLOCKSIZE
+
+
+def compress_chunk(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress(tar_file, level=1, workers=None, chunk_size=COMPRESS_CHUNK_SIZE):
+    """
+    Compress an archive with gzip in parallel.
+    Every chunk is an independent gzip member, so the result is a normal
+    .tar.gz file. The positions of the chunks are added to the index file.
+
+    Arguments:
+    tar_file - Archive to compress
+    level - Compression level
+    workers - Number of threads, default number of CPUs
+    chunk_size - Uncompressed size of a chunk
+
+    Return:
+    Name of the compressed archive
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    output_file = '{0}.gz'.format(tar_file)
+    chunks = []
+    with open(tar_file, 'rb') as read, \
+            open(output_file, 'wb') as write, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        offset = 0
+        done = False
+        while not done:
+            # Bound the memory to two chunks per thread
+            futures = []
+            for _ in range(2 * workers):
+                data = read.read(chunk_size)
+                if not data:
+                    done = True
+                    break
+                futures.append((len(data), executor.submit(compress_chunk, data, level)))
+            for size, future in futures:
+                chunks.append((offset, write.tell(), size))
+                write.write(future.result())
+                offset += size
+
+    with open(get_index_file(output_file), 'w') as write:
+        try:
+            with open(get_index_file(tar_file), 'r') as read:
+                write.write(read.read())
+        except FileNotFoundError:
+            pass
+        for offset, compressed_offset, size in chunks:
+            write.write('#chunk\t{0}\t{1}\t{2}\n'.format(offset, compressed_offset, size))
+    return output_file
+
+
+def read_index(index_file):
+    """
+    Read an index file.
+
+    Arguments:
+    index_file - Index file
+
+    Return:
+    Dictionary name -> (data offset, size), list of (offset, compressed offset, size) chunks
+    """
+    members = {}
+    chunks = []
+    with open(index_file, 'r') as read:
+        for line in read:
+            columns = line.rstrip('\n').split('\t')
+            if columns[0] == '#chunk':
+                chunks.append(tuple(int(entry) for entry in columns[1:]))
+            else:
+                members[columns[0]] = (int(columns[1]), int(columns[2]))
+    return members, chunks
+
+
+def extract(tar_file, name, output_file):
+    """
+    Extract a single file with the help of the index file.
+
+    Arguments:
+    tar_file - Archive, .tar or .tar.gz created by compress
+    name - Name of the member
+    output_file - File to write
+
+    Return:
+    None
+    """
+    members, chunks = read_index(get_index_file(tar_file))
+    offset, size = members[name]
+    with open(tar_file, 'rb') as read, open(output_file, 'wb') as write:
+        if not chunks:
+            read.seek(offset)
+            write.write(read.read(size))
+            return
+
+        for chunk_offset, compressed_offset, chunk_size in chunks:
+            if chunk_offset + chunk_size <= offset:
+                continue
+            elif chunk_offset >= offset + size:
+                break
+            read.seek(compressed_offset)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = b''
+            while len(data) < chunk_size:
+                block = read.read(1024**2)
+                if not block:
+                    break
+                data += decompressor.decompress(block)
+            start = max(0, offset - chunk_offset)
+            stop = min(chunk_size, offset + size - chunk_offset)
+            write.write(data[start:stop])
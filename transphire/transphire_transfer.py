@@ -0,0 +1,393 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import concurrent.futures
+import errno
+import mmap
+import os
+import threading
+import time
+import zlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+CHUNK_SIZE = 8 * 1024**2
+
+# Errors that mean the kernel copy is not supported for this pair of files
+FALLBACK_ERRORS = (
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+    errno.ENOTSOCK,
+    errno.EBADF,
+    )
+
+
+class Crc32(object):
+    """
+    hashlib like interface for zlib.crc32.
+    """
+
+    def __init__(self):
+        super(Crc32, self).__init__()
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self):
+        return '{0:08x}'.format(self.value)
+
+
+def new_checksum():
+    """
+    Checksum for the copy verification.
+    xxhash is used if it is installed, CRC32 otherwise. Both are faster than
+    the cryptographic hashes and only need to detect corrupted copies.
+
+    Arguments:
+    None
+
+    Return:
+    Checksum object with update and hexdigest
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    else:
+        return Crc32()
+
+
+def map_file(fd, size):
+    """
+    Memory map a file for sequential reading.
+
+    Arguments:
+    fd - File descriptor
+    size - Number of bytes to map
+
+    Return:
+    mmap object
+    """
+    memory_map = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+    try:
+        memory_map.madvise(mmap.MADV_SEQUENTIAL)
+    except AttributeError:
+        pass
+    return memory_map
+
+
+def release_pages(memory_map, offset, length):
+    """
+    Drop processed pages of a memory mapped file from the resident memory,
+    so the memory usage is bounded by the chunk size.
+
+    Arguments:
+    memory_map - mmap object
+    offset - Start of the range, multiple of the page size
+    length - Length of the range
+
+    Return:
+    None
+    """
+    try:
+        memory_map.madvise(mmap.MADV_DONTNEED, offset, length)
+    except (AttributeError, ValueError, OSError):
+        pass
+
+
+def get_checksum(file_name, chunk_size=CHUNK_SIZE):
+    """
+    Checksum of a file.
+    The file is memory mapped, so the data is not copied to python.
+
+    Arguments:
+    file_name - File to read
+    chunk_size - Number of bytes per checksum update
+
+    Return:
+    Length of the file, hex digest
+    """
+    checksum = new_checksum()
+    fd = os.open(file_name, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        if size:
+            with map_file(fd, size) as memory_map, memoryview(memory_map) as view:
+                for offset in range(0, size, chunk_size):
+                    checksum.update(view[offset:offset + chunk_size])
+                    release_pages(memory_map, offset, min(chunk_size, size - offset))
+    finally:
+        os.close(fd)
+    return size, checksum.hexdigest()
+
+
+def copy_kernel(fd_in, fd_out, size, chunk_size=CHUNK_SIZE):
+    """
+    Copy without passing the data through python.
+    copy_file_range can use server side copies and reflinks, sendfile and
+    a plain read/write loop are the fallbacks.
+
+    Arguments:
+    fd_in - Input file descriptor
+    fd_out - Output file descriptor
+    size - Number of bytes to copy
+    chunk_size - Number of bytes per call
+
+    Return:
+    Number of copied bytes
+    """
+    offset = 0
+    for method in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, method):
+            continue
+        os.lseek(fd_out, offset, os.SEEK_SET)
+        try:
+            while offset < size:
+                if method == 'copy_file_range':
+                    copied = os.copy_file_range(fd_in, fd_out, min(chunk_size, size - offset), offset, offset)
+                else:
+                    copied = os.sendfile(fd_out, fd_in, offset, min(chunk_size, size - offset))
+                if not copied:
+                    # File got shorter while copying
+                    return offset
+                offset += copied
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRORS:
+                raise
+        else:
+            return offset
+
+    os.lseek(fd_in, offset, os.SEEK_SET)
+    os.lseek(fd_out, offset, os.SEEK_SET)
+    while offset < size:
+        data = os.read(fd_in, min(chunk_size, size - offset))
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd_out, view):]
+        offset += len(data)
+    return offset
+
+
+def copy_checksum(fd_in, fd_out, chunk_size=CHUNK_SIZE):
+    """
+    Copy and calculate the checksum of the input in the same pass.
+    The input is memory mapped and written directly from the mapping.
+
+    Arguments:
+    fd_in - Input file descriptor
+    fd_out - Output file descriptor
+    chunk_size - Number of bytes per checksum update and write
+
+    Return:
+    Number of copied bytes, hex digest
+    """
+    checksum = new_checksum()
+    size = os.fstat(fd_in).st_size
+    if size:
+        with map_file(fd_in, size) as memory_map, memoryview(memory_map) as view:
+            for offset in range(0, size, chunk_size):
+                with view[offset:offset + chunk_size] as data:
+                    checksum.update(data)
+                    written = 0
+                    while written < len(data):
+                        written += os.write(fd_out, data[written:])
+                release_pages(memory_map, offset, min(chunk_size, size - offset))
+    return size, checksum.hexdigest()
+
+
+def copy_file(file_in, file_out, checksum=False, chunk_size=CHUNK_SIZE):
+    """
+    Copy the content of a file.
+
+    Arguments:
+    file_in - Input file
+    file_out - Output file, will be truncated
+    checksum - Calculate the checksum of the input while copying
+    chunk_size - Number of bytes per call
+
+    Return:
+    Number of copied bytes, hex digest of the input or None
+    """
+    fd_in = os.open(file_in, os.O_RDONLY)
+    try:
+        fd_out = os.open(file_out, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            if checksum:
+                return copy_checksum(fd_in, fd_out, chunk_size)
+            else:
+                size = os.fstat(fd_in).st_size
+                return copy_kernel(fd_in, fd_out, size, chunk_size), None
+        finally:
+            os.close(fd_out)
+    finally:
+        os.close(fd_in)
+
+
+class TransferEngine(object):
+    """
+    Copy files with optional verification and collect throughput statistics.
+
+    A verified copy reads the input once: the checksum is calculated while
+    copying and compared with a checksum of the written file. Unverified
+    copies use the kernel copy functions. Network errors and checksum
+    mismatches are retried.
+    Several files can be copied at the same time with a thread pool, which is
+    created with the first parallel copy, so the engine can be created before
+    a fork.
+    """
+
+    def __init__(self, max_workers=4, chunk_size=CHUNK_SIZE, retries=5, retry_delay=1):
+        """
+        Initialize object variables.
+
+        Arguments:
+        max_workers - Maximum number of files copied at the same time
+        chunk_size - Number of bytes per call
+        retries - Number of retries for network errors and checksum mismatches
+        retry_delay - Time in seconds to wait after a network error
+
+        Return:
+        None
+        """
+        super(TransferEngine, self).__init__()
+        self.max_workers = max(1, max_workers)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.executor = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.statistics = {
+            'files': 0,
+            'bytes': 0,
+            'copy_time': 0.0,
+            'busy_time': 0.0,
+            'network_retries': 0,
+            'checksum_retries': 0,
+            'active': 0,
+            'max_active': 0,
+            }
+        self.busy_start = None
+
+    def add_statistics(self, **kwargs):
+        with self.lock:
+            for key, value in kwargs.items():
+                self.statistics[key] += value
+            self.statistics['max_active'] = max(self.statistics['max_active'], self.statistics['active'])
+            if self.statistics['active'] and self.busy_start is None:
+                self.busy_start = time.time()
+            elif not self.statistics['active'] and self.busy_start is not None:
+                self.statistics['busy_time'] += time.time() - self.busy_start
+                self.busy_start = None
+
+    def get_statistics(self):
+        """
+        Throughput statistics of all copies.
+
+        Arguments:
+        None
+
+        Return:
+        Dictionary with the number of files and bytes, the summed copy time
+        of the single files, the time with at least one active copy and the
+        throughput in MB/s over the busy time
+        """
+        with self.lock:
+            statistics = dict(self.statistics)
+            if self.busy_start is not None:
+                statistics['busy_time'] += time.time() - self.busy_start
+        try:
+            statistics['throughput'] = statistics['bytes'] / statistics['busy_time'] / 1024**2
+        except ZeroDivisionError:
+            statistics['throughput'] = 0.0
+        return statistics
+
+    def copy(self, file_in, file_out, verify=True):
+        """
+        Copy a file and verify the written file.
+
+        Arguments:
+        file_in - Input file
+        file_out - Output file
+        verify - Compare the checksums of the input and the written file
+
+        Return:
+        Number of copied bytes, time in seconds
+        """
+        network_counter = 0
+        counter = 0
+        self.add_statistics(active=1)
+        try:
+            start = time.time()
+            while True:
+                try:
+                    length_in, checksum_in = copy_file(file_in, file_out, verify, self.chunk_size)
+                except Exception:
+                    if network_counter >= self.retries:
+                        raise
+                    else:
+                        network_counter += 1
+                        self.add_statistics(network_retries=1)
+                        time.sleep(self.retry_delay)
+                        continue
+
+                if not verify:
+                    break
+
+                length_out, checksum_out = get_checksum(file_out, self.chunk_size)
+                if length_in == length_out and checksum_in == checksum_out:
+                    break
+                elif counter == self.retries:
+                    raise Exception('PROBLEM')
+                else:
+                    counter += 1
+                    self.add_statistics(checksum_retries=1)
+            copy_time = time.time() - start
+        finally:
+            self.add_statistics(active=-1)
+
+        self.add_statistics(files=1, bytes=length_in, copy_time=copy_time)
+        return length_in, copy_time
+
+    def run_parallel(self, function, jobs):
+        """
+        Run a copy function for several files at the same time.
+
+        Arguments:
+        function - Function called with the items of a job
+        jobs - List of argument tuples
+
+        Return:
+        List of the return values, the first exception is raised after all jobs finished
+        """
+        if len(jobs) < 2 or self.max_workers < 2:
+            return [function(*job) for job in jobs]
+
+        if self.pid != os.getpid():
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+            self.pid = os.getpid()
+        futures = [self.executor.submit(function, *job) for job in jobs]
+        concurrent.futures.wait(futures)
+        return [future.result() for future in futures]
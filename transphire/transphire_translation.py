@@ -0,0 +1,113 @@
+"""
+    TranSPHIRE is supposed to help with the cryo-EM data collection
+    Copyright (C) 2017 Markus Stabrin
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+
+
+def read_translation_names(file_name):
+    """
+    Read the first column of a translation file.
+    Matches np.genfromtxt(file_name, usecols=0, dtype=str): Empty lines are
+    skipped and everything after a # is a comment.
+
+    Arguments:
+    file_name - Translation file
+
+    Return:
+    Set of names, empty if the file does not exist
+    """
+    names = set()
+    try:
+        with open(file_name, 'r') as read:
+            for line in read:
+                columns = line.split('#', 1)[0].split()
+                if columns:
+                    names.add(columns[0])
+    except FileNotFoundError:
+        pass
+    return names
+
+
+class TranslationIndex(object):
+    """
+    Hashed index of the original names in the translation files.
+
+    The index is loaded once per process from the translation files.
+    Every process appends the names it writes to a shared journal file and
+    reads only the journal lines that were added since its last lookup.
+    Loading, lookups and appends need to be protected by the translate lock.
+    """
+
+    def __init__(self, file_names, journal_file):
+        """
+        Initialize object variables.
+
+        Arguments:
+        file_names - Translation files to index
+        journal_file - Append-only journal shared by all processes
+
+        Return:
+        None
+        """
+        super(TranslationIndex, self).__init__()
+        self.file_names = file_names
+        self.journal_file = journal_file
+        self.names = None
+        self.offset = 0
+
+    def load(self):
+        self.names = set()
+        for file_name in self.file_names:
+            self.names.update(read_translation_names(file_name))
+        try:
+            self.offset = os.path.getsize(self.journal_file)
+        except FileNotFoundError:
+            self.offset = 0
+
+    def update(self):
+        if self.names is None:
+            self.load()
+            return
+
+        try:
+            with open(self.journal_file, 'rb') as read:
+                read.seek(0, os.SEEK_END)
+                if read.tell() < self.offset:
+                    # Journal got truncated: Start from scratch
+                    self.load()
+                    return
+                read.seek(self.offset)
+                data = read.read()
+        except FileNotFoundError:
+            return
+
+        # Ignore an incomplete last line
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        for name in data.decode('utf-8').splitlines():
+            if name:
+                self.names.add(name)
+
+    def contains(self, name):
+        self.update()
+        return name in self.names
+
+    def add(self, name):
+        self.update()
+        with open(self.journal_file, 'a') as write:
+            write.write('{0}\n'.format(name))
+        self.names.add(name)
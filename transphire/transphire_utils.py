@@ -26,13 +26,13 @@ import shutil
 import time
 
 import numpy as np
-import pandas as pd
 
 from PyQt5.QtGui import QFont
 
 from . import transphire_content as tc
 from . import transphire_plot as tp
 from . import transphire_import as ti
+from . import transphire_transfer as ttransfer
 
 VERSION_RE = re.compile('(.*) >=v([\d.]+)')
 
@@ -59,134 +59,6 @@ def rerun_function_in_case_of_error(func):
     return wrapper
 
 
-def thread_safe(func):
-    def wrapper(self, *args, **kwargs):
-        self._DataFrame__get_df()
-        try:
-            return_value = func(self, *args, **kwargs)
-        except:
-            self._lock.release()
-            raise
-        else:
-            self._DataFrame__set_df()
-        return return_value
-    return wrapper
-
-
-class DataFrame(object):
-
-    def __init__(self, manager, file_path):
-        super(DataFrame, self).__init__()
-        self._lock = manager.RLock()
-        self._namespace = manager.Namespace()
-        self._file_path = file_path
-        self._data_frame = None
-        self._namespace.df = None
-        self._increment = 5
-
-        self.load_df()
-
-    def __get_df(self):
-        self._lock.acquire()
-        self._data_frame = self._namespace.df
-
-    def __set_df(self):
-        self._namespace.df = self._data_frame
-        self._data_frame = None
-        self._lock.release()
-
-    def __add_df_column(self, name):
-        self._data_frame[name] = np.nan
-        self._data_frame[name] = self._data_frame[name].astype(object)
-
-    def __add_df_rows(self, length):
-        columns = self._data_frame.columns
-        new_data_frame = pd.DataFrame(index=range(length), columns=columns)
-        self._data_frame = self._data_frame.append(new_data_frame, ignore_index=True)
-
-    def __save_df(self):
-        self._data_frame.to_csv(self._file_path)
-
-    def __check_df(self, index, columns):
-        if index not in self._data_frame.index:
-            rows_to_add = self._increment * (index // self._increment + 1) - self._data_frame.shape[0]
-            self.__add_df_rows(rows_to_add)
-
-        for column in columns:
-            try:
-                self._data_frame[column]
-            except KeyError:
-                self.__add_df_column(column)
-
-    @thread_safe
-    def get_df(self):
-        return self._data_frame
-
-    @thread_safe
-    def set_df(self, data_frame):
-        self._data_frame = data_frame
-        self.__save_df()
-
-    @thread_safe
-    def save_df(self):
-        self._data_frame.to_csv(self._file_path)
-
-    @thread_safe
-    def load_df(self):
-        if os.path.exists(self._file_path):
-            df = pd.read_csv(self._file_path, index_col=0, dtype=object)
-        else:
-            df = pd.DataFrame(dtype=object)
-        self._data_frame = df
-
-    @thread_safe
-    def value_in_column(self, value, column):
-        return value in self._data_frame[column].values
-
-    @thread_safe
-    def get_values(self, index, columns):
-        if isinstance(columns, str):
-            columns = [columns]
-        self.__check_df(index, columns)
-
-        return self._data_frame.loc[index, list(columns)]
-
-    @thread_safe
-    def set_values(self, index, value_dict, do_save=True):
-        self.__check_df(index, value_dict.keys())
-
-        for column, value in value_dict.items():
-            self._data_frame.loc[index, column] = value
-        if do_save:
-            self.__save_df()
-
-    @thread_safe
-    def append_values(self, value_dict, do_save=True):
-        index = self._data_frame[next(iter(value_dict))].last_valid_index() + 1
-        self.set_values(index, value_dict, do_save)
-
-    @thread_safe
-    def get_index_where(self, column, value, func_type):
-        try:
-            col = self._data_frame[column].astype(float)
-        except:
-            col = self._data_frame[column]
-
-        if func_type == 'eq':
-            return_value = self._data_frame.index[col == value]
-        elif func_type == 'gg':
-            return_value = self._data_frame.index[col > value]
-        elif func_type == 'll':
-            return_value = self._data_frame.index[col < value]
-        elif func_type == 'ge':
-            return_value = self._data_frame.index[col >= value]
-        elif func_type == 'le':
-            return_value = self._data_frame.index[col <= value]
-        else:
-            raise NameError
-        return return_value
-
-
 def get_unique_types():
     valid_sub_items = np.array([value['typ'] for value in get_function_dict().values() if value['typ'] is not None])
     _, unique_idx = np.unique(valid_sub_items, return_index=True)
@@ -286,29 +158,49 @@ def is_higher_version(name, version_ref):
     return version_tuple_comp >= version_tuple_ref
 
 
+FREQUENCY_MASK_CACHE = {}
+
+
+def get_frequency_mask(shape, apix=1.0, min_res=30):
+    """
+    Mask of the frequencies higher than min_res of a centered power spectrum.
+    The masks are cached by shape and resolution.
+
+    Arguments:
+    shape - Shape of the power spectrum
+    apix - Pixel size in angstrom
+    min_res - Minimum resolution in angstrom
+
+    Returns:
+    Boolean mask, False for the masked low frequencies
+    """
+    key = (shape[0], shape[1], apix, min_res)
+    try:
+        return FREQUENCY_MASK_CACHE[key]
+    except KeyError:
+        pass
+
+    box_x = shape[0]
+    box_x_half = box_x / 2
+    box_y = shape[1]
+    box_y_half = box_y / 2
+
+    min_freq = (apix / min_res)**2
+
+    x = (np.arange(box_x) - box_x_half) / box_x
+    y = (np.arange(box_y) - box_y_half) / box_y
+    radius = (x * x)[:, np.newaxis] + (y * y)[np.newaxis, :]
+    mask = radius >= min_freq
+    mask.setflags(write=False)
+    FREQUENCY_MASK_CACHE[key] = mask
+    return mask
+
+
 def normalize_image(data, apix=1.0, min_res=30, real=True):
     if real:
         pass
     else:
-        box_x = data.shape[0]
-        box_x_half = box_x / 2
-        box_y = data.shape[1]
-        box_y_half = box_y / 2
-
-        min_freq = (apix / min_res)**2
-
-        mask = np.ones((data.shape[0], data.shape[1]), dtype=bool)
-        for idx_x in range(mask.shape[0]):
-            for idx_y in range(mask.shape[1]):
-                x = (idx_x - box_x_half) / box_x
-                y = (idx_y - box_y_half) / box_y
-                radius = x**2+y**2
-                if radius < min_freq:
-                    mask[idx_x, idx_y] = 0
-                elif np.abs(idx_x - box_x_half) < 0:
-                    mask[idx_x, idx_y] = 0
-                elif np.abs(idx_y - box_y_half) < 0:
-                    mask[idx_x, idx_y] = 0
+        mask = get_frequency_mask(data.shape, apix=apix, min_res=min_res)
         data[~mask] = np.median(data[mask])
         data = np.sqrt(data)
 
@@ -340,19 +232,35 @@ def copy(file_in, file_out):
     """
 
     if os.path.isfile(file_in):
+        if os.path.isdir(file_out):
+            file_out = os.path.join(file_out, os.path.basename(file_in))
         mkdir_p(os.path.dirname(file_out))
-        try:
-            shutil.copy2(file_in, file_out)
-        except PermissionError:
-            print('Error with {0}! Switching to copyfile!'.format(file_in))
-            shutil.copyfile(file_in, file_out)
-        else:
-            umask = os.umask(0)
-            os.umask(umask)
-            os.chmod(file_out, 0o666 & ~umask)
+        ttransfer.copy_file(file_in, file_out)
+        copy_stat(file_in, file_out)
     elif os.path.isdir(file_in):
         copytree(file_in, file_out)
 
+
+def copy_stat(file_in, file_out):
+    """
+    Copy the time stamps of file_in like shutil.copy2 and set the default permissions.
+
+    Arguments:
+    file_in - Input file
+    file_out - Output file
+
+    Return:
+    None
+    """
+    try:
+        shutil.copystat(file_in, file_out)
+    except PermissionError:
+        print('Error with {0}! Cannot copy the file status!'.format(file_in))
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(file_out, 0o666 & ~umask)
+
 def copytree(root_src_dir, root_dst_dir):
     if os.path.exists(root_dst_dir):
         root_dst_dir = os.path.join(root_dst_dir, os.path.basename(root_src_dir))
@@ -1187,6 +1095,179 @@ def get_content_gui(content, template_name, n_feedbacks):
     return gui_content
 
 
+def get_content_pipeline(pipeline_settings=None):
+    """
+    Create the pipeline content used to start the processing threads
+    without the GUI.
+
+    Arguments:
+    pipeline_settings - Dictionary name -> number of processes, e.g. settings['Pipeline'] (default None)
+
+    Return:
+    Content as list
+    """
+    if pipeline_settings is None:
+        pipeline_settings = {}
+
+    content = []
+    for name, value, dtype, group, typ, priority, tooltip in tc.default_pipeline():
+        content.append({
+            name: [
+                pipeline_settings.get(name, value),
+                {
+                    'typ': typ,
+                    'name': name,
+                    'name_global': None,
+                    'values': value,
+                    'dtype': dtype,
+                    'group': group,
+                    'tooltip': tooltip,
+                    'widget_2': priority,
+                    'widget_3': None,
+                    }
+                ]
+            })
+    return [content]
+
+
+def set_project_folders(settings, mount_directory):
+    """
+    Add the project folder names to the settings.
+    Error files of a previous run are moved to the restart backup folder.
+
+    Arguments:
+    settings - TranSPHIRE settings
+    mount_directory - Folder containing the mount points
+
+    Return:
+    Dictionary of the folders that need to be created
+    """
+    settings['project_base'] = os.path.join(
+        settings['Output']['Project directory'],
+        settings['Output']['Project name']
+        )
+
+    settings['project_folder'] = os.path.join(
+        settings['project_base'],
+        'TranSPHIRE_results'
+        )
+
+    settings['scratch_folder'] = os.path.join(
+        settings['Output']['Scratch directory'],
+        settings['Output']['Project name'],
+        'TranSPHIRE_results'
+        )
+    folder_dict = {
+        'log_folder': 'XXX_Log_files',
+        'queue_folder': 'XXX_Queue_files',
+        'error_folder': 'XXX_Error_files',
+        'tar_folder': 'XXX_Tar_file_folder',
+        'stack_folder': '000_Import',
+        'meta_folder': '000_Import_meta',
+        'set_folder_raw': 'XXX_Settings',
+        'restart_backup_folder': 'XXX_Restart_Backup',
+        'software_meta_folder': '000_Session_meta',
+        }
+    for key, value in folder_dict.items():
+        settings[key] = os.path.join(
+            settings['project_folder'],
+            value
+            )
+
+    continue_mode = os.path.exists(settings['restart_backup_folder'])
+
+    settings['do_feedback_loop'] = int(settings['Output']['Number of feedbacks'])
+    settings['feedback_file'] = os.path.join(settings['log_folder'], 'feedback_log')
+    settings['spot_file'] = os.path.join(settings['log_folder'], 'spot_dict.txt')
+    settings['data_frame'] = os.path.join(settings['project_folder'], 'data_frame.csv')
+    settings['external_log'] = os.path.join(settings['set_folder_raw'], 'external_files.json')
+    settings['translation_file'] = os.path.join(settings['project_folder'], 'Valid_micrographs_info.txt')
+    settings['translation_file_bad'] = os.path.join(settings['project_folder'], 'Discarded_micrographs_info.txt')
+
+    settings['current_set'] = datetime.datetime.now().strftime('%Y_%m_%d_%H_%M_%S')
+
+    settings['restart_backup_folder'] = os.path.join(settings['restart_backup_folder'], settings['current_set'])
+    settings['set_folder'] = os.path.join(settings['set_folder_raw'], settings['current_set'])
+    folder_dict['set_folder'] = settings['set_folder']
+    folder_dict['restart_backup_folder'] = settings['restart_backup_folder']
+
+    # Move Error files from previous run
+    if continue_mode:
+        mkdir_p(settings['restart_backup_folder'])
+        try:
+            copy(
+                settings['error_folder'],
+                settings['restart_backup_folder'],
+                )
+            shutil.rmtree(settings['error_folder'])
+        except FileNotFoundError:
+            pass
+        # Copy Queue files from previous run
+        try:
+            copy(
+                settings['queue_folder'],
+                settings['restart_backup_folder'],
+                )
+        except FileNotFoundError:
+            pass
+
+    names = [
+        entry.replace('_entries', '')
+        for entry in settings['Copy']
+        if entry.endswith('_entries') and
+        entry.replace('_entries', '').replace('_', ' ') in settings['Copy']
+        ]
+    idx = 0
+    settings['plot_emit'] = []
+    for entry in names:
+        base_dir2 = None
+        no_feedback = False
+        if 'copy_to_' in entry.lower():
+            base_dir = mount_directory
+            no_feedback = True
+        else:
+            idx += 1
+            base_dir = settings['project_folder']
+            base_dir2 = settings['scratch_folder']
+
+        entry_name = '{}_entries'.format(entry)
+        prog_name_entries = settings['Copy'][entry_name] if entry_name in settings['Copy'] else [entry]
+        for prog_name in prog_name_entries:
+            if 'copy_to_' in entry.lower():
+                folder_name = prog_name.replace(' ', '_').replace('>=', '')
+            else:
+                folder_name = '{0:03d}_{1}'.format(idx, prog_name.replace(' ', '_').replace('>=', ''))
+
+            for index in range(int(settings['Output']['Number of feedbacks']) + 1):
+                if index == 0:
+                    folder_name_tmp = folder_name
+                elif no_feedback:
+                    continue
+                else:
+                    folder_name_tmp = os.path.join(
+                        '000_Feedback_results',
+                        '{0}_feedback_{1}'.format(
+                            folder_name,
+                            int(settings['Output']['Number of feedbacks']) - index + 1
+                            )
+                        )
+
+                folder_setting_name = '{0}_folder_feedback_{1}'.format(entry.lower(), index)
+                folder_setting = os.path.join(base_dir, folder_name_tmp)
+                prog_name_feedback = '{} feedback {}'.format(prog_name, int(settings['Output']['Number of feedbacks']) - index + 1) if index != 0 else prog_name
+                settings['plot_emit'].append([prog_name, prog_name_feedback, entry, folder_setting])
+
+                if prog_name == settings['Copy'][entry.replace('_', ' ')]:
+                    settings[folder_setting_name] = folder_setting
+                    if base_dir2 is not None:
+                        settings['scratch_{0}_folder_feedback_{1}'.format(entry.lower(), index)] = os.path.join(
+                            base_dir2,
+                            folder_name_tmp
+                            )
+
+    return folder_dict
+
+
 def look_and_feel_small(app, font=None):
     """
     Look and feel for the default settings dialog.